@@ -0,0 +1,171 @@
+import asyncio
+import heapq
+import itertools
+import json
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "50"))
+QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "2"))
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "20"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "40"))
+# Paths that never touch the database and are always admitted. /live streams stay open
+# for hours without a query and would each hold a slot; live.LIVE_MAX_STREAMS caps them.
+EXEMPT_PATHS = {"/", "/ready", "/docs", "/redoc", "/openapi.json", "/docs/oauth2-redirect", "/live"}
+# Static image variants: a list page loads dozens at once, and none of them touch the database
+EXEMPT_PREFIXES = ("/images/",)
+
+# Lower values are admitted first
+PRIORITY_DETAIL_READ = 0
+PRIORITY_LIST_READ = 1
+PRIORITY_WRITE = 2
+PRIORITY_BULK_WRITE = 3
+
+def is_batch_read(method: str, path: str) -> bool:
+    # /destinations/batch and the like; POST only carries id lists too long for a URL
+    return method in ("GET", "HEAD", "POST") and path.rstrip("/").endswith("/batch")
+
+def route_priority(method: str, path: str, query_string: bytes) -> int:
+    parts = [part for part in path.split("/") if part]
+    if is_batch_read(method, path):
+        return PRIORITY_LIST_READ
+    if method in ("GET", "HEAD"):
+        # /destinations/{id} and deeper are detail reads; /destinations/ is a list
+        return PRIORITY_DETAIL_READ if len(parts) >= 2 else PRIORITY_LIST_READ
+    if b"ids=" in query_string:
+        return PRIORITY_BULK_WRITE
+    return PRIORITY_WRITE
+
+class Rejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: int):
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+class ConcurrencyLimiter:
+    # At most max_concurrency requests run at once; the rest wait in a bounded priority
+    # queue. When the queue is full, a more urgent request evicts the least urgent waiter.
+    def __init__(self, max_concurrency: int, queue_size: int = QUEUE_SIZE, timeout: float = QUEUE_TIMEOUT):
+        self.max_concurrency = max_concurrency
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    async def acquire(self, priority: int):
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+            return
+        if len(self._waiters) >= self.queue_size:
+            worst = max(self._waiters)
+            if worst[0] <= priority:
+                raise Rejected(503, "Server is busy", self._retry_after())
+            self._waiters.remove(worst)
+            heapq.heapify(self._waiters)
+            worst[2].set_exception(Rejected(503, "Server is busy", self._retry_after()))
+        future = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self._sequence), future)
+        heapq.heappush(self._waiters, entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            self._abandon(entry)
+            raise Rejected(503, "Server is busy", self._retry_after())
+        except asyncio.CancelledError:
+            # Client disconnected or server shutting down while queued
+            self._abandon(entry)
+            raise
+
+    def _abandon(self, entry: Tuple[int, int, asyncio.Future]):
+        future = entry[2]
+        if future.done():
+            if future.exception() is None:
+                # Granted a slot just as the waiter gave up; hand it on
+                self.release()
+        elif entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            future.cancel()
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                # The slot passes straight to the waiter, so active stays the same
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.timeout))
+
+class TokenBucketLimiter:
+    def __init__(self, rate: float = RATE_LIMIT_PER_SECOND, burst: float = RATE_LIMIT_BURST, max_clients: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def check(self, client: str):
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self._buckets[client] = (tokens, now)
+            raise Rejected(429, "Too many requests", max(1, math.ceil((1 - tokens) / self.rate)))
+        if len(self._buckets) >= self.max_clients and client not in self._buckets:
+            # Forget clients whose buckets have refilled; they are indistinguishable from new ones
+            full_after = self.burst / self.rate
+            self._buckets = {key: value for key, value in self._buckets.items() if now - value[1] < full_after}
+        self._buckets[client] = (tokens - 1, now)
+
+class AdmissionMiddleware:
+    def __init__(self, app, max_concurrency: int, limiter: Optional[ConcurrencyLimiter] = None,
+                 rate_limiter: Optional[TokenBucketLimiter] = None):
+        self.app = app
+        self.limiter = limiter or ConcurrencyLimiter(max_concurrency)
+        self.rate_limiter = rate_limiter or TokenBucketLimiter()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS or scope["method"] == "OPTIONS" \
+                or scope["path"].startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+        try:
+            client = scope.get("client")
+            self.rate_limiter.check(client[0] if client else "unknown")
+            await self.limiter.acquire(route_priority(scope["method"], scope["path"], scope.get("query_string", b"")))
+        except Rejected as e:
+            await self._reject(send, e)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limiter.release()
+
+    async def _reject(self, send, rejection: Rejected):
+        body = json.dumps({"detail": rejection.detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": rejection.status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(rejection.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+def pool_capacity(db_engine) -> int:
+    # Connections the engine can hand out without making a request wait for one
+    pool = db_engine.pool
+    size = pool.size() if hasattr(pool, "size") else 5
+    overflow = getattr(pool, "_max_overflow", 0)
+    return size + max(overflow, 0)
@@ -0,0 +1,52 @@
+# bench_startup.py
+# Measures worker cold start in fresh interpreters: importing main, startup
+# (migrations), time until /ready turns green, and the first and second request.
+# Usage: python bench_startup.py [runs] [path ...]
+# Uses the Starlette test client, which needs httpx (pip install -r requirements-dev.txt).
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(main.app) as client:
+    started_up = time.perf_counter()
+    while client.get("/ready").status_code != 200:
+        if time.perf_counter() - started_up > 60:
+            raise SystemExit("worker never became ready")
+        time.sleep(0.005)
+    ready = time.perf_counter()
+    result = {"import_ms": (imported - started) * 1000, "startup_ms": (started_up - imported) * 1000,
+              "ready_ms": (ready - started_up) * 1000}
+    for path in sys.argv[1:]:
+        first = time.perf_counter()
+        client.get(path)
+        second = time.perf_counter()
+        client.get(path)
+        result[path + " first_ms"] = (second - first) * 1000
+        result[path + " second_ms"] = (time.perf_counter() - second) * 1000
+print(json.dumps(result))
+"""
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    paths = sys.argv[2:] or ["/destinations/", "/accommodations/", "/openapi.json"]
+    here = os.path.dirname(os.path.abspath(__file__))
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE, *paths], cwd=here, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    for key in samples[0]:
+        values = [sample[key] for sample in samples]
+        print(f"{key:40s} median {statistics.median(values):8.1f}  max {max(values):8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from pydantic import TypeAdapter
+
+import events
+from database import replicas, wrote_recently, READ_YOUR_WRITES_SECONDS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# memory:// keeps a cache per process; redis://host:port/db shares one across workers
+CACHE_URL = os.getenv("CACHE_URL", "memory://")
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+# How long a request waits for another request's identical fetch before building the body itself
+SINGLE_FLIGHT_WAIT_SECONDS = float(os.getenv("SINGLE_FLIGHT_WAIT_SECONDS", "5"))
+
+# Writes to an entity also invalidate entries tagged with these related entities
+RELATED_TAGS = {
+    "room": ("accommodation",),
+}
+
+class MemoryCache:
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, bytes, Tuple[str, ...]]]" = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ttl: int, tags: Iterable[str]):
+        tags = tuple(tags)
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, tag: str):
+        with self._lock:
+            for key in list(self._tags.pop(tag, ())):
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+class RedisCache:
+    # Entries live in Redis so every worker shares them. Each worker also keeps a
+    # short-lived near cache, which is dropped through a pub/sub message whenever any
+    # worker invalidates a tag. Redis errors are logged and treated as cache misses.
+    CHANNEL = "temajuk:cache:invalidate"
+
+    def __init__(self, url: str, prefix: str = "temajuk:cache:", near_ttl: int = 5, client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("CACHE_URL points at Redis but the redis package is not installed") from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.near_ttl = near_ttl
+        self.near = MemoryCache()
+        self._listener = threading.Thread(target=self._listen, name="cache-invalidation", daemon=True)
+        self._listener.start()
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def _tag_key(self, tag: str) -> str:
+        return self.prefix + "tag:" + tag
+
+    def get(self, key: str) -> Optional[bytes]:
+        value = self.near.get(key)
+        if value is not None:
+            return value
+        try:
+            value = self.client.get(self._key(key))
+        except Exception:
+            logger.warning("Redis cache get failed", exc_info=True)
+            return None
+        return value
+
+    def set(self, key: str, value: bytes, ttl: int, tags: Iterable[str]):
+        tags = tuple(tags)
+        self.near.set(key, value, min(ttl, self.near_ttl), tags)
+        try:
+            pipe = self.client.pipeline()
+            pipe.set(self._key(key), value, ex=ttl)
+            for tag in tags:
+                # A tag set has to outlive every entry in it, or a write after it expires
+                # finds nothing to invalidate; so its expiry is only ever pushed back
+                # (NX and GT need Redis 7)
+                pipe.sadd(self._tag_key(tag), self._key(key))
+                pipe.expire(self._tag_key(tag), ttl, nx=True)
+                pipe.expire(self._tag_key(tag), ttl, gt=True)
+            pipe.execute()
+        except Exception:
+            logger.warning("Redis cache set failed", exc_info=True)
+
+    def invalidate(self, tag: str):
+        self.near.invalidate(tag)
+        try:
+            keys = self.client.smembers(self._tag_key(tag))
+            pipe = self.client.pipeline()
+            if keys:
+                pipe.delete(*keys)
+            pipe.delete(self._tag_key(tag))
+            pipe.publish(self.CHANNEL, tag)
+            pipe.execute()
+        except Exception:
+            logger.warning("Redis cache invalidation failed", exc_info=True)
+
+    def clear(self):
+        self.near.clear()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                for message in pubsub.listen():
+                    if message and message.get("type") == "message":
+                        tag = message["data"]
+                        self.near.invalidate(tag.decode() if isinstance(tag, bytes) else tag)
+            except Exception:
+                logger.warning("Redis invalidation listener disconnected; retrying", exc_info=True)
+                # Entries may have been invalidated while we were not listening
+                self.near.clear()
+                time.sleep(1)
+
+def create_backend(url: str = CACHE_URL):
+    if url.startswith("memory://"):
+        return MemoryCache()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url)
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+backend = create_backend()
+
+class _Flight:
+    def __init__(self, tags: Tuple[str, ...]):
+        self.tags = tags
+        self.done = threading.Event()
+        self.body: Optional[bytes] = None
+        self.error: Optional[BaseException] = None
+        # Set when a write invalidates one of the tags while the body is being built
+        self.stale = False
+
+_flights: Dict[str, _Flight] = {}
+_flights_lock = threading.Lock()
+
+def _abandon_flights(tag: str):
+    # Requests arriving after a write must not join a fetch that started before it,
+    # and that fetch must not store its possibly outdated body
+    with _flights_lock:
+        for key, flight in list(_flights.items()):
+            if tag in flight.tags:
+                flight.stale = True
+                del _flights[key]
+
+def _on_write(entity: str, action: str, entity_id: str, obj: Any):
+    for tag in (entity,) + RELATED_TAGS.get(entity, ()):
+        _abandon_flights(tag)
+        backend.invalidate(tag)
+        if replicas.engines:
+            # A read served by a lagging replica right after this write could re-cache the
+            # old data, so invalidate again once the replication lag window has passed
+            timer = threading.Timer(READ_YOUR_WRITES_SECONDS, backend.invalidate, args=(tag,))
+            timer.daemon = True
+            timer.start()
+
+events.subscribe(events.ALL, _on_write)
+
+def request_key(request: Request) -> str:
+    # Normalised so that parameter order does not split the cache
+    return request.url.path + "?" + "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+
+def cached_json(request: Request, tags: Iterable[str], response_type, produce: Callable[[], Any], ttl: int = CACHE_TTL,
+                exclude: Any = None, key: Optional[str] = None) -> Response:
+    # Serve the serialised body of a read endpoint from the cache, or build and store it.
+    # Concurrent misses for the same key share a single fetch and serialisation. Pass key
+    # when the URL alone does not identify the response, e.g. a read with a POST body.
+    def build() -> bytes:
+        adapter = type_adapter(response_type)
+        return adapter.dump_json(adapter.validate_python(produce(), from_attributes=True), exclude=exclude)
+    if wrote_recently(request):
+        # The client reads from the primary to see its own write; a cached body, or one
+        # being built, may come from a lagging replica, so neither is used nor stored
+        return Response(content=build(), media_type="application/json")
+    key = key or request_key(request)
+    body = backend.get(key)
+    if body is None:
+        body = _single_flight(key, tuple(tags), build, ttl)
+    return Response(content=body, media_type="application/json")
+
+def _single_flight(key: str, tags: Tuple[str, ...], build: Callable[[], bytes], ttl: int) -> bytes:
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight(tags)
+    if not leader:
+        if not flight.done.wait(SINGLE_FLIGHT_WAIT_SECONDS):
+            # A slow leader must not hold every follower's thread; build without storing
+            return build()
+        if flight.error is not None:
+            # e.g. the leader's 404, which every follower should see as well
+            raise flight.error
+        return flight.body
+    try:
+        flight.body = build()
+        if not flight.stale:
+            backend.set(key, flight.body, ttl, tags)
+        return flight.body
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            if _flights.get(key) is flight:
+                del _flights[key]
+        flight.done.set()
+
+_adapters: Dict[Any, TypeAdapter] = {}
+
+def type_adapter(response_type) -> TypeAdapter:
+    # One adapter per response type for the whole worker; building one compiles its
+    # validator and serializer, which warmup.py does at boot
+    adapter = _adapters.get(response_type)
+    if adapter is None:
+        adapter = _adapters[response_type] = TypeAdapter(response_type)
+    return adapter
@@ -1,5 +1,5 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, and_
+from sqlalchemy.orm import Session, selectinload, noload, contains_eager
+from sqlalchemy import or_, and_, insert, delete, func, select
 from models import (
     Destination, DestinationTip, DestinationGallery, destination_facility, destination_activity,
     Accommodation, Room, AccommodationGallery, accommodation_facility,
@@ -7,7 +7,7 @@ from models import (
     Review,
     PhotoSpot, PhotoSpotTip, PhotoSpotGallery, PhotoSpotNearbyAttraction,
     TransportRoute, RouteStep, RouteTip,
-    Facility, Activity
+    Facility, Activity, ChangeLog, HOURS_COLUMNS, ROOT_MODELS
 )
 from schemas import (
     DestinationCreate, DestinationUpdate,
@@ -17,39 +17,250 @@ from schemas import (
     PhotoSpotCreate, PhotoSpotUpdate,
     TransportRouteCreate, TransportRouteUpdate, RouteStepCreate, RouteTipCreate
 )
-from typing import List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
+from collections import Counter
+from datetime import datetime, timedelta
+import base64
+import os
+import binascii
+import uuid
+import events
+import recommendations
+import search_index
+from parsers import parse_review_date, parse_duration_minutes, parse_rupiah, parse_capacity, parse_hours
+
+# Change-log rows younger than this are left for the next /changes call, so a transaction
+# that took an earlier id but committed later is not skipped
+CHANGES_SETTLE_SECONDS = float(os.getenv("CHANGES_SETTLE_SECONDS", "5"))
+
+# Child collections that responses can include; all of them unless the client narrows it down
+COLLECTIONS = {
+    Destination: ("facilities", "activities", "tips", "gallery"),
+    Accommodation: ("facilities", "rooms", "gallery"),
+    Culinary: ("specialties", "gallery"),
+    PhotoSpot: ("tips", "gallery", "nearby_attractions"),
+    TransportRoute: ("steps", "tips"),
+}
 
 # Utility functions
+def loader_options(model, include: Optional[Iterable[str]] = None) -> list:
+    # Included collections are fetched with one IN query each for the whole result;
+    # the others are never loaded and read as empty
+    names = COLLECTIONS.get(model, ())
+    wanted = set(names if include is None else include)
+    return [selectinload(getattr(model, name)) if name in wanted else noload(getattr(model, name)) for name in names]
+
+def get_or_create_by_name(db: Session, model, names: List[str]) -> list:
+    # One lookup for all names. New rows are only added to the session: they are inserted
+    # with the caller's commit, in one transaction, and flushing here would flush the
+    # caller's parent row before it is in the session.
+    names = list(dict.fromkeys(names))
+    if not names:
+        return []
+    existing = {row.name: row for row in db.query(model).filter(model.name.in_(names)).all()}
+    for name in names:
+        if name not in existing:
+            existing[name] = model(name=name)
+            db.add(existing[name])
+    return [existing[name] for name in names]
+
 def get_or_create_facilities(db: Session, facility_names: List[str]) -> List[Facility]:
-    facilities = []
-    for name in facility_names:
-        facility = db.query(Facility).filter(Facility.name == name).first()
-        if not facility:
-            facility = Facility(name=name)
-            db.add(facility)
-            db.commit()
-            db.refresh(facility)
-        facilities.append(facility)
-    return facilities
+    return get_or_create_by_name(db, Facility, facility_names)
 
 def get_or_create_activities(db: Session, activity_names: List[str]) -> List[Activity]:
-    activities = []
-    for name in activity_names:
-        activity = db.query(Activity).filter(Activity.name == name).first()
-        if not activity:
-            activity = Activity(name=name)
-            db.add(activity)
-            db.commit()
-            db.refresh(activity)
-        activities.append(activity)
-    return activities
+    return get_or_create_by_name(db, Activity, activity_names)
+
+def apply_fields(db_obj, update, collections: Tuple[str, ...] = ()) -> None:
+    # Copy the scalar fields of an update schema; child collections are synced separately
+    for var, value in update.model_dump(exclude=set(collections)).items():
+        if value is not None:
+            setattr(db_obj, var, value)
+
+def sync_children(collection, items, model, fields: Tuple[str, ...]) -> None:
+    # Diff existing child rows against the requested ones so only the difference is written
+    wanted = Counter(tuple(getattr(item, field) for field in fields) for item in items)
+    for row in list(collection):
+        key = tuple(getattr(row, field) for field in fields)
+        if wanted[key] > 0:
+            wanted[key] -= 1
+        else:
+            collection.remove(row)
+    for key, count in wanted.items():
+        for _ in range(count):
+            collection.append(model(**dict(zip(fields, key))))
+
+def parse_route_steps(steps) -> None:
+    # Keep the numeric duration and cost of each step in line with its text
+    for step in steps:
+        step.duration_minutes = parse_duration_minutes(step.duration)
+        step.cost_rupiah = parse_rupiah(step.cost)
+
+def parse_rooms(rooms) -> None:
+    # Keep the numeric price and guest count of each room in line with its text
+    for room in rooms:
+        room.price_rupiah = parse_rupiah(room.price)
+        room.guests = parse_capacity(room.capacity)
+
+def parse_hours_columns(row) -> None:
+    # Keep the parsed minutes of a row's opening hours (or best time) in line with the text
+    source, start, end = HOURS_COLUMNS[type(row)]
+    opens, closes = parse_hours(getattr(row, source)) or (None, None)
+    setattr(row, start, opens)
+    setattr(row, end, closes)
+
+def open_at_filter(model, minute: int):
+    # Rows whose hours contain the minute; an interval with until < from runs past midnight.
+    # Each branch is a range on the leading index column with the rest checked from the
+    # same index entries: opened by now and not yet closed (or closing after midnight),
+    # or opened yesterday evening and closing later this morning.
+    _, start, end = HOURS_COLUMNS[model]
+    opens, closes = getattr(model, start), getattr(model, end)
+    return or_(
+        and_(opens <= minute, or_(closes > minute, closes < opens)),
+        and_(opens > minute, closes > minute, closes < opens),
+    )
 
-# Destination CRUD
-def get_destination(db: Session, destination_id: str) -> Optional[Destination]:
-    return db.query(Destination).filter(Destination.id == destination_id).first()
+def sync_associations(db: Session, collection, names: List[str], model) -> None:
+    # Same diff for many-to-many links to facilities/activities, matched by name
+    wanted = list(dict.fromkeys(names))
+    for item in list(collection):
+        if item.name not in wanted:
+            collection.remove(item)
+    linked = {item.name for item in collection}
+    collection.extend(get_or_create_by_name(db, model, [name for name in wanted if name not in linked]))
+
+def get_by_ids(db: Session, model, ids: List[str], include: Optional[Iterable[str]] = None) -> list:
+    # One IN query; rows come back in the order of ids and missing ids are skipped
+    if not ids:
+        return []
+    rows = {row.id: row for row in db.query(model).options(*loader_options(model, include)).filter(model.id.in_(ids)).all()}
+    return [rows[entity_id] for entity_id in dict.fromkeys(ids) if entity_id in rows]
+
+def log_changes(db: Session, entity: str, action: str, ids: Iterable[str]) -> datetime:
+    # Adds change_log rows to the caller's transaction; returns the time to store in updated_at
+    changed_at = datetime.utcnow()
+    db.add_all([ChangeLog(entity=entity, entity_id=entity_id, action=action, changed_at=changed_at) for entity_id in ids])
+    return changed_at
+
+def touch(db: Session, model, entity: str, ids: Iterable[str]) -> None:
+    # A write to child rows (rooms) or a link that was cleared is an update of the parent
+    ids = [entity_id for entity_id in dict.fromkeys(ids) if entity_id]
+    if ids:
+        changed_at = log_changes(db, entity, "update", ids)
+        db.query(model).filter(model.id.in_(ids)).update({model.updated_at: changed_at}, synchronize_session=False)
+
+def delete_by_ids(db: Session, model, entity: str, ids: List[str]) -> List[str]:
+    # One DELETE ... RETURNING where the database has it; MySQL locks the rows with
+    # SELECT ... FOR UPDATE first, so either way only ids this call deleted are returned.
+    # Child and association rows go with them through ON DELETE CASCADE, and the delete
+    # stays in change_log so /changes can hand it to clients.
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return []
+    if model is Destination:
+        # Unlinked here as well as by ON DELETE SET NULL, so the review updates logged
+        # hold even where the foreign key is missing (SQLite tables from before step 13)
+        touch(db, Review, "review", [row[0] for row in db.query(Review.id).filter(Review.destination_id.in_(ids))])
+        db.query(Review).filter(Review.destination_id.in_(ids)).update({Review.destination_id: None}, synchronize_session=False)
+    statement = delete(model).where(model.id.in_(ids)).execution_options(synchronize_session=False)
+    if db.get_bind().dialect.delete_returning:
+        deleted = [row[0] for row in db.execute(statement.returning(model.id))]
+    else:
+        deleted = [row[0] for row in db.query(model.id).filter(model.id.in_(ids)).with_for_update()]
+        if deleted:
+            db.execute(statement)
+    if not deleted:
+        db.rollback()
+        return []
+    log_changes(db, entity, "delete", deleted)
+    db.commit()
+    for entity_id in deleted:
+        events.publish(entity, "delete", entity_id)
+    return deleted
+
+# Facets: entity -> (model, {field: (owner column, target column, target model)}) of the
+# many-to-many links counted next to category
+FACETS = {
+    "destination": (Destination, {
+        "facilities": (destination_facility.c.destination_id, destination_facility.c.facility_id, Facility),
+        "activities": (destination_activity.c.destination_id, destination_activity.c.activity_id, Activity),
+    }),
+    "accommodation": (Accommodation, {
+        "facilities": (accommodation_facility.c.accommodation_id, accommodation_facility.c.facility_id, Facility),
+    }),
+    "culinary": (Culinary, {}),
+    "photo_spot": (PhotoSpot, {}),
+}
+
+def search_filter(model, search: str):
+    # Same matching as the search parameter of the list endpoints
+    return or_(
+        model.title.ilike(f"%{search}%"),
+        model.description.ilike(f"%{search}%"),
+        model.location.ilike(f"%{search}%")
+    )
 
-def get_destinations(db: Session, skip: int = 0, limit: int = 100, search: str = None) -> List[Destination]:
-    query = db.query(Destination)
+def get_facets(db: Session, entity: str, search: str = None, category: str = None) -> dict:
+    # Grouped counts for a filter sidebar. Category counts ignore the category filter so
+    # the other categories stay selectable; link counts apply it.
+    model, links = FACETS[entity]
+    searched = [search_filter(model, search)] if search else []
+    filtered = searched + ([model.category == category] if category else [])
+    count = func.count().label("count")
+    categories = (
+        db.query(model.category, count)
+        .filter(*searched)
+        .group_by(model.category)
+        .order_by(count.desc(), model.category)
+        .all()
+    )
+    result = {
+        "entity": entity,
+        "total": db.query(func.count(model.id)).filter(*filtered).scalar(),
+        "category": [{"value": value, "count": n} for value, n in categories],
+    }
+    for field, (owner_column, target_column, target) in links.items():
+        query = db.query(target.name, count).select_from(owner_column.table).join(target, target.id == target_column)
+        if filtered:
+            # Without filters the counts come from the link table's own index alone
+            query = query.join(model, model.id == owner_column).filter(*filtered)
+        rows = query.group_by(target.name).order_by(count.desc(), target.name).all()
+        result[field] = [{"value": value, "count": n} for value, n in rows]
+    return result
+
+def get_fuzzy_matches(db: Session, model, entity: str, search: str, skip: int, limit: int,
+                      include: Optional[Iterable[str]] = None, criteria: tuple = ()) -> list:
+    # Typo-tolerant search: ranked ids from the in-memory trigram index, rows from one IN query.
+    # Extra filter criteria are applied in SQL to the matched ids before paging.
+    ids = search_index.fuzzy.search(entity, search)
+    if criteria and ids:
+        kept = {row[0] for row in db.query(model.id).filter(model.id.in_(ids), *criteria)}
+        ids = [entity_id for entity_id in ids if entity_id in kept]
+    return get_by_ids(db, model, ids[skip:skip + limit], include)
+
+def get_similar(db: Session, entity: str, entity_id: str, limit: int = 10,
+                include: Optional[Iterable[str]] = None) -> Optional[list]:
+    # Rows most similar by facility/activity overlap, from the precomputed neighbour lists;
+    # None when the item itself does not exist
+    model = recommendations.SOURCES[entity][0]
+    neighbors = recommendations.indexes[entity].similar(entity_id)
+    if neighbors is None:
+        # Not indexed yet: written by another worker moments ago, before the relay delivered it
+        if db.query(model.id).filter(model.id == entity_id).first() is None:
+            return None
+        return []
+    return get_by_ids(db, model, [neighbor for neighbor, _ in neighbors[:limit]], include)
+
+# Destination CRUD
+def get_destination(db: Session, destination_id: str, include: Optional[Iterable[str]] = None) -> Optional[Destination]:
+    return db.query(Destination).options(*loader_options(Destination, include)).filter(Destination.id == destination_id).first()
+
+def get_destinations(db: Session, skip: int = 0, limit: int = 100, search: str = None,
+        include: Optional[Iterable[str]] = None, fuzzy: bool = False, open_at: Optional[int] = None) -> List[Destination]:
+    criteria = (open_at_filter(Destination, open_at),) if open_at is not None else ()
+    if search and fuzzy:
+        return get_fuzzy_matches(db, Destination, "destination", search, skip, limit, include, criteria)
+    query = db.query(Destination).options(*loader_options(Destination, include)).filter(*criteria)
     if search:
         query = query.filter(
             or_(
@@ -70,7 +281,9 @@ def create_destination(db: Session, destination: DestinationCreate) -> Destinati
         category=destination.category,
         price=destination.price,
         location=destination.location,
-        open_hours=destination.open_hours
+        open_hours=destination.open_hours,
+        latitude=destination.latitude,
+        longitude=destination.longitude
     )
     
     # Handle facilities
@@ -95,46 +308,50 @@ def create_destination(db: Session, destination: DestinationCreate) -> Destinati
             db_gallery = DestinationGallery(image_url=image.image_url)
             db_destination.gallery.append(db_gallery)
     
+    parse_hours_columns(db_destination)
+    db_destination.updated_at = log_changes(db, "destination", "create", [db_destination.id])
     db.add(db_destination)
     db.commit()
     db.refresh(db_destination)
+    events.publish("destination", "create", db_destination.id, db_destination)
     return db_destination
 
 def update_destination(db: Session, destination_id: str, destination: DestinationUpdate) -> Optional[Destination]:
     db_destination = get_destination(db, destination_id)
     if db_destination:
-        for var, value in vars(destination).items():
-            if value is not None:
-                setattr(db_destination, var, value)
+        apply_fields(db_destination, destination, ("facilities", "activities", "tips", "gallery"))
+        parse_hours_columns(db_destination)
         
-        # Update facilities if provided
         if destination.facilities is not None:
-            facilities = get_or_create_facilities(db, destination.facilities)
-            db_destination.facilities = facilities
-        
-        # Update activities if provided
+            sync_associations(db, db_destination.facilities, destination.facilities, Facility)
         if destination.activities is not None:
-            activities = get_or_create_activities(db, destination.activities)
-            db_destination.activities = activities
+            sync_associations(db, db_destination.activities, destination.activities, Activity)
+        if destination.tips is not None:
+            sync_children(db_destination.tips, destination.tips, DestinationTip, ("tip",))
+        if destination.gallery is not None:
+            sync_children(db_destination.gallery, destination.gallery, DestinationGallery, ("image_url",))
         
+        db_destination.updated_at = log_changes(db, "destination", "update", [db_destination.id])
         db.commit()
         db.refresh(db_destination)
+        events.publish("destination", "update", db_destination.id, db_destination)
     return db_destination
 
 def delete_destination(db: Session, destination_id: str) -> bool:
-    db_destination = get_destination(db, destination_id)
-    if db_destination:
-        db.delete(db_destination)
-        db.commit()
-        return True
-    return False
+    return bool(delete_by_ids(db, Destination, "destination", [destination_id]))
 
-# Accommodation CRUD
-def get_accommodation(db: Session, accommodation_id: str) -> Optional[Accommodation]:
-    return db.query(Accommodation).filter(Accommodation.id == accommodation_id).first()
+def delete_destinations(db: Session, ids: List[str]) -> List[str]:
+    return delete_by_ids(db, Destination, "destination", ids)
 
-def get_accommodations(db: Session, skip: int = 0, limit: int = 100, search: str = None) -> List[Accommodation]:
-    query = db.query(Accommodation)
+# Accommodation CRUD
+def get_accommodation(db: Session, accommodation_id: str, include: Optional[Iterable[str]] = None) -> Optional[Accommodation]:
+    return db.query(Accommodation).options(*loader_options(Accommodation, include)).filter(Accommodation.id == accommodation_id).first()
+
+def get_accommodations(db: Session, skip: int = 0, limit: int = 100, search: str = None,
+        include: Optional[Iterable[str]] = None, fuzzy: bool = False) -> List[Accommodation]:
+    if search and fuzzy:
+        return get_fuzzy_matches(db, Accommodation, "accommodation", search, skip, limit, include)
+    query = db.query(Accommodation).options(*loader_options(Accommodation, include))
     if search:
         query = query.filter(
             or_(
@@ -156,7 +373,9 @@ def create_accommodation(db: Session, accommodation: AccommodationCreate) -> Acc
         price=accommodation.price,
         location=accommodation.location,
         contact=accommodation.contact,
-        website=accommodation.website
+        website=accommodation.website,
+        latitude=accommodation.latitude,
+        longitude=accommodation.longitude
     )
     
     # Handle facilities
@@ -174,6 +393,7 @@ def create_accommodation(db: Session, accommodation: AccommodationCreate) -> Acc
                 description=room.description
             )
             db_accommodation.rooms.append(db_room)
+        parse_rooms(db_accommodation.rooms)
     
     # Handle gallery
     if accommodation.gallery:
@@ -181,34 +401,37 @@ def create_accommodation(db: Session, accommodation: AccommodationCreate) -> Acc
             db_gallery = AccommodationGallery(image_url=image.image_url)
             db_accommodation.gallery.append(db_gallery)
     
+    db_accommodation.updated_at = log_changes(db, "accommodation", "create", [db_accommodation.id])
     db.add(db_accommodation)
     db.commit()
     db.refresh(db_accommodation)
+    events.publish("accommodation", "create", db_accommodation.id, db_accommodation)
     return db_accommodation
 
 def update_accommodation(db: Session, accommodation_id: str, accommodation: AccommodationUpdate) -> Optional[Accommodation]:
     db_accommodation = get_accommodation(db, accommodation_id)
     if db_accommodation:
-        for var, value in vars(accommodation).items():
-            if value is not None:
-                setattr(db_accommodation, var, value)
+        apply_fields(db_accommodation, accommodation, ("facilities", "rooms", "gallery"))
         
-        # Update facilities if provided
         if accommodation.facilities is not None:
-            facilities = get_or_create_facilities(db, accommodation.facilities)
-            db_accommodation.facilities = facilities
+            sync_associations(db, db_accommodation.facilities, accommodation.facilities, Facility)
+        if accommodation.rooms is not None:
+            sync_children(db_accommodation.rooms, accommodation.rooms, Room, ("type", "price", "capacity", "description"))
+            parse_rooms(db_accommodation.rooms)
+        if accommodation.gallery is not None:
+            sync_children(db_accommodation.gallery, accommodation.gallery, AccommodationGallery, ("image_url",))
         
+        db_accommodation.updated_at = log_changes(db, "accommodation", "update", [db_accommodation.id])
         db.commit()
         db.refresh(db_accommodation)
+        events.publish("accommodation", "update", db_accommodation.id, db_accommodation)
     return db_accommodation
 
 def delete_accommodation(db: Session, accommodation_id: str) -> bool:
-    db_accommodation = get_accommodation(db, accommodation_id)
-    if db_accommodation:
-        db.delete(db_accommodation)
-        db.commit()
-        return True
-    return False
+    return bool(delete_by_ids(db, Accommodation, "accommodation", [accommodation_id]))
+
+def delete_accommodations(db: Session, ids: List[str]) -> List[str]:
+    return delete_by_ids(db, Accommodation, "accommodation", ids)
 
 # Room CRUD
 def get_room(db: Session, room_id: str) -> Optional[Room]:
@@ -217,6 +440,32 @@ def get_room(db: Session, room_id: str) -> Optional[Room]:
 def get_rooms_by_accommodation(db: Session, accommodation_id: str, skip: int = 0, limit: int = 100) -> List[Room]:
     return db.query(Room).filter(Room.accommodation_id == accommodation_id).offset(skip).limit(limit).all()
 
+def search_rooms(db: Session, guests: Optional[int] = None, max_price: Optional[int] = None,
+        facilities: Optional[List[str]] = None, skip: int = 0, limit: int = 100) -> List[Room]:
+    # One query joined to the accommodation, read in ix_rooms_price_rupiah_guests order.
+    # Rooms whose price has no number are left out; facilities must all be offered.
+    query = (
+        db.query(Room)
+        .join(Room.accommodation)
+        .options(contains_eager(Room.accommodation))
+        .filter(Room.price_rupiah.isnot(None))
+    )
+    if max_price is not None:
+        query = query.filter(Room.price_rupiah <= max_price)
+    if guests is not None:
+        query = query.filter(Room.guests >= guests)
+    if facilities:
+        names = list(dict.fromkeys(facilities))
+        offering_all = (
+            select(accommodation_facility.c.accommodation_id)
+            .join(Facility, Facility.id == accommodation_facility.c.facility_id)
+            .where(Facility.name.in_(names))
+            .group_by(accommodation_facility.c.accommodation_id)
+            .having(func.count(func.distinct(Facility.id)) == len(names))
+        )
+        query = query.filter(Room.accommodation_id.in_(offering_all))
+    return query.order_by(Room.price_rupiah, Room.guests, Room.id).offset(skip).limit(limit).all()
+
 def create_room(db: Session, accommodation_id: str, room: RoomCreate) -> Room:
     db_room = Room(
         accommodation_id=accommodation_id,
@@ -225,9 +474,12 @@ def create_room(db: Session, accommodation_id: str, room: RoomCreate) -> Room:
         capacity=room.capacity,
         description=room.description
     )
+    parse_rooms([db_room])
     db.add(db_room)
+    touch(db, Accommodation, "accommodation", [accommodation_id])
     db.commit()
     db.refresh(db_room)
+    events.publish("room", "create", db_room.id, db_room)
     return db_room
 
 def update_room(db: Session, room_id: str, room: RoomCreate) -> Optional[Room]:
@@ -235,24 +487,32 @@ def update_room(db: Session, room_id: str, room: RoomCreate) -> Optional[Room]:
     if db_room:
         for var, value in vars(room).items():
             setattr(db_room, var, value)
+        parse_rooms([db_room])
+        touch(db, Accommodation, "accommodation", [db_room.accommodation_id])
         db.commit()
         db.refresh(db_room)
+        events.publish("room", "update", db_room.id, db_room)
     return db_room
 
 def delete_room(db: Session, room_id: str) -> bool:
-    db_room = get_room(db, room_id)
-    if db_room:
-        db.delete(db_room)
-        db.commit()
-        return True
-    return False
+    accommodation_id = db.query(Room.accommodation_id).filter(Room.id == room_id).scalar()
+    touch(db, Accommodation, "accommodation", [accommodation_id])
+    deleted = db.query(Room).filter(Room.id == room_id).delete(synchronize_session=False)
+    db.commit()
+    if deleted:
+        events.publish("room", "delete", room_id)
+    return deleted > 0
 
 # Culinary CRUD
-def get_culinary(db: Session, culinary_id: str) -> Optional[Culinary]:
-    return db.query(Culinary).filter(Culinary.id == culinary_id).first()
-
-def get_culinaries(db: Session, skip: int = 0, limit: int = 100, search: str = None) -> List[Culinary]:
-    query = db.query(Culinary)
+def get_culinary(db: Session, culinary_id: str, include: Optional[Iterable[str]] = None) -> Optional[Culinary]:
+    return db.query(Culinary).options(*loader_options(Culinary, include)).filter(Culinary.id == culinary_id).first()
+
+def get_culinaries(db: Session, skip: int = 0, limit: int = 100, search: str = None,
+        include: Optional[Iterable[str]] = None, fuzzy: bool = False, open_at: Optional[int] = None) -> List[Culinary]:
+    criteria = (open_at_filter(Culinary, open_at),) if open_at is not None else ()
+    if search and fuzzy:
+        return get_fuzzy_matches(db, Culinary, "culinary", search, skip, limit, include, criteria)
+    query = db.query(Culinary).options(*loader_options(Culinary, include)).filter(*criteria)
     if search:
         query = query.filter(
             or_(
@@ -274,7 +534,9 @@ def create_culinary(db: Session, culinary: CulinaryCreate) -> Culinary:
         price=culinary.price,
         location=culinary.location,
         open_hours=culinary.open_hours,
-        contact=culinary.contact
+        contact=culinary.contact,
+        latitude=culinary.latitude,
+        longitude=culinary.longitude
     )
     
     # Handle specialties
@@ -289,78 +551,193 @@ def create_culinary(db: Session, culinary: CulinaryCreate) -> Culinary:
             db_gallery = CulinaryGallery(image_url=image.image_url)
             db_culinary.gallery.append(db_gallery)
     
+    parse_hours_columns(db_culinary)
+    db_culinary.updated_at = log_changes(db, "culinary", "create", [db_culinary.id])
     db.add(db_culinary)
     db.commit()
     db.refresh(db_culinary)
+    events.publish("culinary", "create", db_culinary.id, db_culinary)
     return db_culinary
 
 def update_culinary(db: Session, culinary_id: str, culinary: CulinaryUpdate) -> Optional[Culinary]:
     db_culinary = get_culinary(db, culinary_id)
     if db_culinary:
-        for var, value in vars(culinary).items():
-            if value is not None:
-                setattr(db_culinary, var, value)
+        apply_fields(db_culinary, culinary, ("specialties", "gallery"))
+        parse_hours_columns(db_culinary)
+        
+        if culinary.specialties is not None:
+            sync_children(db_culinary.specialties, culinary.specialties, CulinarySpecialty, ("name",))
+        if culinary.gallery is not None:
+            sync_children(db_culinary.gallery, culinary.gallery, CulinaryGallery, ("image_url",))
+        
+        db_culinary.updated_at = log_changes(db, "culinary", "update", [db_culinary.id])
         db.commit()
         db.refresh(db_culinary)
+        events.publish("culinary", "update", db_culinary.id, db_culinary)
     return db_culinary
 
 def delete_culinary(db: Session, culinary_id: str) -> bool:
-    db_culinary = get_culinary(db, culinary_id)
-    if db_culinary:
-        db.delete(db_culinary)
-        db.commit()
-        return True
-    return False
+    return bool(delete_by_ids(db, Culinary, "culinary", [culinary_id]))
+
+def delete_culinaries(db: Session, ids: List[str]) -> List[str]:
+    return delete_by_ids(db, Culinary, "culinary", ids)
 
 # Review CRUD
 def get_review(db: Session, review_id: str) -> Optional[Review]:
     return db.query(Review).filter(Review.id == review_id).first()
 
-def get_reviews(db: Session, skip: int = 0, limit: int = 100, destination: str = None) -> List[Review]:
+def get_destination_id_by_title(db: Session, title: str) -> Optional[str]:
+    return db.query(Destination.id).filter(Destination.title == title).scalar()
+
+def encode_review_cursor(review: Review) -> str:
+    raw = f"{review.reviewed_at.isoformat()}|{review.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_review_cursor(cursor: str) -> Tuple[datetime, str]:
+    # Raises ValueError for malformed cursors
+    try:
+        reviewed_at, review_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+    return datetime.fromisoformat(reviewed_at), review_id
+
+def get_reviews(
+    db: Session,
+    skip: int = 0,
+    limit: int = 100,
+    destination: str = None,
+    destination_id: str = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None
+) -> List[Review]:
     query = db.query(Review)
-    if destination:
-        query = query.filter(Review.destination == destination)
+    if destination and not destination_id:
+        destination_id = get_destination_id_by_title(db, destination)
+        if not destination_id:
+            # Reviews whose title matched no destination are only reachable by title
+            query = query.filter(Review.destination == destination)
+    if destination_id:
+        query = query.filter(Review.destination_id == destination_id)
+    if since:
+        query = query.filter(Review.reviewed_at >= since)
+    if until:
+        query = query.filter(Review.reviewed_at < until)
+    if cursor:
+        # Keyset pagination: continue strictly after the last (reviewed_at, id) seen
+        reviewed_at, review_id = decode_review_cursor(cursor)
+        query = query.filter(
+            or_(
+                Review.reviewed_at < reviewed_at,
+                and_(Review.reviewed_at == reviewed_at, Review.id < review_id)
+            )
+        )
+    query = query.order_by(Review.reviewed_at.desc(), Review.id.desc())
     return query.offset(skip).limit(limit).all()
 
-def create_review(db: Session, review: ReviewCreate) -> Review:
-    db_review = Review(
-        id=review.id,
+def get_destination_reviews(db: Session, destination_id: str, skip: int = 0, limit: int = 100) -> Optional[List[Review]]:
+    # Newest first by review date, a range scan of ix_reviews_destination_id_reviewed_at_id;
+    # None when the destination does not exist
+    reviews = (
+        db.query(Review)
+        .filter(Review.destination_id == destination_id)
+        .order_by(Review.reviewed_at.desc(), Review.id.desc())
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+    if not reviews and db.query(Destination.id).filter(Destination.id == destination_id).first() is None:
+        return None
+    return reviews
+
+def review_values(review: ReviewCreate) -> dict:
+    # Column values for a new review, before its destination is looked up
+    return dict(
+        id=review.id or uuid.uuid4().hex,
         name=review.name,
         image_url=review.image_url,
         date=review.date,
         rating=review.rating,
         text=review.text,
-        destination=review.destination
+        reviewed_at=parse_review_date(review.date) or datetime.utcnow(),
+        destination=review.destination,
+        destination_id=review.destination_id
     )
+
+def known_destination_ids(db: Session, ids: Iterable[str]) -> set:
+    ids = {destination_id for destination_id in ids if destination_id}
+    return {row[0] for row in db.query(Destination.id).filter(Destination.id.in_(ids)).all()} if ids else set()
+
+def create_review(db: Session, review: ReviewCreate) -> Optional[Review]:
+    # None when the client names a destination_id that does not exist
+    values = review_values(review)
+    if values["destination_id"] and not known_destination_ids(db, [values["destination_id"]]):
+        return None
+    values["destination_id"] = values["destination_id"] or get_destination_id_by_title(db, review.destination)
+    db_review = Review(**values)
+    db_review.updated_at = log_changes(db, "review", "create", [db_review.id])
     db.add(db_review)
     db.commit()
     db.refresh(db_review)
+    events.publish("review", "create", db_review.id, db_review)
     return db_review
 
+def create_reviews(db: Session, rows: List[dict]) -> List[str]:
+    # One multi-row INSERT for rows built by review_values. Destination ids that do not
+    # exist are resolved from the title instead, or left empty, so one row cannot fail the batch.
+    if not rows:
+        return []
+    known_ids = known_destination_ids(db, [row["destination_id"] for row in rows])
+    titles = {row["destination"] for row in rows if row["destination_id"] not in known_ids}
+    ids_by_title = dict(db.query(Destination.title, Destination.id).filter(Destination.title.in_(titles)).all()) if titles else {}
+    for row in rows:
+        if row["destination_id"] not in known_ids:
+            row["destination_id"] = ids_by_title.get(row["destination"])
+    changed_at = log_changes(db, "review", "create", [row["id"] for row in rows])
+    for row in rows:
+        row["updated_at"] = changed_at
+    db.execute(insert(Review), rows)
+    db.commit()
+    for row in rows:
+        events.publish("review", "create", row["id"], Review(**row))
+    return [row["id"] for row in rows]
+
 def update_review(db: Session, review_id: str, review: ReviewUpdate) -> Optional[Review]:
     db_review = get_review(db, review_id)
     if db_review:
         for var, value in vars(review).items():
             if value is not None:
                 setattr(db_review, var, value)
+        
+        if review.date is not None:
+            db_review.reviewed_at = parse_review_date(review.date) or db_review.created_at
+        
+        # Re-link to the destination when only the title changed
+        if review.destination is not None and review.destination_id is None:
+            db_review.destination_id = get_destination_id_by_title(db, review.destination)
+        
+        db_review.updated_at = log_changes(db, "review", "update", [db_review.id])
         db.commit()
         db.refresh(db_review)
+        events.publish("review", "update", db_review.id, db_review)
     return db_review
 
 def delete_review(db: Session, review_id: str) -> bool:
-    db_review = get_review(db, review_id)
-    if db_review:
-        db.delete(db_review)
-        db.commit()
-        return True
-    return False
+    return bool(delete_by_ids(db, Review, "review", [review_id]))
 
-# PhotoSpot CRUD
-def get_photo_spot(db: Session, photo_spot_id: str) -> Optional[PhotoSpot]:
-    return db.query(PhotoSpot).filter(PhotoSpot.id == photo_spot_id).first()
+def delete_reviews(db: Session, ids: List[str]) -> List[str]:
+    return delete_by_ids(db, Review, "review", ids)
 
-def get_photo_spots(db: Session, skip: int = 0, limit: int = 100, search: str = None) -> List[PhotoSpot]:
-    query = db.query(PhotoSpot)
+# PhotoSpot CRUD
+def get_photo_spot(db: Session, photo_spot_id: str, include: Optional[Iterable[str]] = None) -> Optional[PhotoSpot]:
+    return db.query(PhotoSpot).options(*loader_options(PhotoSpot, include)).filter(PhotoSpot.id == photo_spot_id).first()
+
+def get_photo_spots(db: Session, skip: int = 0, limit: int = 100, search: str = None,
+        include: Optional[Iterable[str]] = None, fuzzy: bool = False, open_at: Optional[int] = None) -> List[PhotoSpot]:
+    criteria = (open_at_filter(PhotoSpot, open_at),) if open_at is not None else ()
+    if search and fuzzy:
+        return get_fuzzy_matches(db, PhotoSpot, "photo_spot", search, skip, limit, include, criteria)
+    query = db.query(PhotoSpot).options(*loader_options(PhotoSpot, include)).filter(*criteria)
     if search:
         query = query.filter(
             or_(
@@ -380,7 +757,9 @@ def create_photo_spot(db: Session, photo_spot: PhotoSpotCreate) -> PhotoSpot:
         image_url=photo_spot.image_url,
         category=photo_spot.category,
         location=photo_spot.location,
-        best_time=photo_spot.best_time
+        best_time=photo_spot.best_time,
+        latitude=photo_spot.latitude,
+        longitude=photo_spot.longitude
     )
     
     # Handle tips
@@ -401,35 +780,48 @@ def create_photo_spot(db: Session, photo_spot: PhotoSpotCreate) -> PhotoSpot:
             db_attraction = PhotoSpotNearbyAttraction(name=attraction.name)
             db_photo_spot.nearby_attractions.append(db_attraction)
     
+    parse_hours_columns(db_photo_spot)
+    db_photo_spot.updated_at = log_changes(db, "photo_spot", "create", [db_photo_spot.id])
     db.add(db_photo_spot)
     db.commit()
     db.refresh(db_photo_spot)
+    events.publish("photo_spot", "create", db_photo_spot.id, db_photo_spot)
     return db_photo_spot
 
 def update_photo_spot(db: Session, photo_spot_id: str, photo_spot: PhotoSpotUpdate) -> Optional[PhotoSpot]:
     db_photo_spot = get_photo_spot(db, photo_spot_id)
     if db_photo_spot:
-        for var, value in vars(photo_spot).items():
-            if value is not None:
-                setattr(db_photo_spot, var, value)
+        apply_fields(db_photo_spot, photo_spot, ("tips", "gallery", "nearby_attractions"))
+        parse_hours_columns(db_photo_spot)
+        
+        if photo_spot.tips is not None:
+            sync_children(db_photo_spot.tips, photo_spot.tips, PhotoSpotTip, ("tip",))
+        if photo_spot.gallery is not None:
+            sync_children(db_photo_spot.gallery, photo_spot.gallery, PhotoSpotGallery, ("image_url",))
+        if photo_spot.nearby_attractions is not None:
+            sync_children(db_photo_spot.nearby_attractions, photo_spot.nearby_attractions, PhotoSpotNearbyAttraction, ("name",))
+        
+        db_photo_spot.updated_at = log_changes(db, "photo_spot", "update", [db_photo_spot.id])
         db.commit()
         db.refresh(db_photo_spot)
+        events.publish("photo_spot", "update", db_photo_spot.id, db_photo_spot)
     return db_photo_spot
 
 def delete_photo_spot(db: Session, photo_spot_id: str) -> bool:
-    db_photo_spot = get_photo_spot(db, photo_spot_id)
-    if db_photo_spot:
-        db.delete(db_photo_spot)
-        db.commit()
-        return True
-    return False
+    return bool(delete_by_ids(db, PhotoSpot, "photo_spot", [photo_spot_id]))
 
-# TransportRoute CRUD
-def get_transport_route(db: Session, route_id: str) -> Optional[TransportRoute]:
-    return db.query(TransportRoute).filter(TransportRoute.id == route_id).first()
+def delete_photo_spots(db: Session, ids: List[str]) -> List[str]:
+    return delete_by_ids(db, PhotoSpot, "photo_spot", ids)
 
-def get_transport_routes(db: Session, skip: int = 0, limit: int = 100, search: str = None) -> List[TransportRoute]:
-    query = db.query(TransportRoute)
+# TransportRoute CRUD
+def get_transport_route(db: Session, route_id: str, include: Optional[Iterable[str]] = None) -> Optional[TransportRoute]:
+    return db.query(TransportRoute).options(*loader_options(TransportRoute, include)).filter(TransportRoute.id == route_id).first()
+
+def get_transport_routes(db: Session, skip: int = 0, limit: int = 100, search: str = None,
+        include: Optional[Iterable[str]] = None, fuzzy: bool = False) -> List[TransportRoute]:
+    if search and fuzzy:
+        return get_fuzzy_matches(db, TransportRoute, "transport_route", search, skip, limit, include)
+    query = db.query(TransportRoute).options(*loader_options(TransportRoute, include))
     if search:
         query = query.filter(
             or_(
@@ -467,26 +859,79 @@ def create_transport_route(db: Session, route: TransportRouteCreate) -> Transpor
         for tip in route.tips:
             db_tip = RouteTip(tip=tip.tip)
             db_route.tips.append(db_tip)
+    parse_route_steps(db_route.steps)
     
+    db_route.updated_at = log_changes(db, "transport_route", "create", [db_route.id])
     db.add(db_route)
     db.commit()
     db.refresh(db_route)
+    events.publish("transport_route", "create", db_route.id, db_route)
     return db_route
 
 def update_transport_route(db: Session, route_id: str, route: TransportRouteUpdate) -> Optional[TransportRoute]:
     db_route = get_transport_route(db, route_id)
     if db_route:
-        for var, value in vars(route).items():
-            if value is not None:
-                setattr(db_route, var, value)
+        apply_fields(db_route, route, ("steps", "tips"))
+        
+        if route.steps is not None:
+            sync_children(db_route.steps, route.steps, RouteStep, ("step", "description", "duration", "cost", "vehicle"))
+            parse_route_steps(db_route.steps)
+        if route.tips is not None:
+            sync_children(db_route.tips, route.tips, RouteTip, ("tip",))
+        
+        db_route.updated_at = log_changes(db, "transport_route", "update", [db_route.id])
         db.commit()
         db.refresh(db_route)
+        events.publish("transport_route", "update", db_route.id, db_route)
     return db_route
 
 def delete_transport_route(db: Session, route_id: str) -> bool:
-    db_route = get_transport_route(db, route_id)
-    if db_route:
-        db.delete(db_route)
-        db.commit()
-        return True
-    return False
\ No newline at end of file
+    return bool(delete_by_ids(db, TransportRoute, "transport_route", [route_id]))
+
+def delete_transport_routes(db: Session, ids: List[str]) -> List[str]:
+    return delete_by_ids(db, TransportRoute, "transport_route", ids)
+
+# Change feed
+def encode_change_token(change_id: int) -> str:
+    return base64.urlsafe_b64encode(f"c{change_id}".encode()).decode()
+
+def decode_change_token(token: str) -> int:
+    # Raises ValueError for malformed tokens
+    try:
+        raw = base64.urlsafe_b64decode(token.encode()).decode()
+    except (binascii.Error, UnicodeDecodeError) as e:
+        raise ValueError("Invalid token") from e
+    if not raw.startswith("c") or not raw[1:].isdigit():
+        raise ValueError("Invalid token")
+    return int(raw[1:])
+
+def get_changes(db: Session, after: int = 0, limit: int = 500) -> Tuple[int, bool, Dict[str, list], Dict[str, List[str]]]:
+    # Change-log rows after id `after`, read in id order up to the first one still settling.
+    # Read from the primary: the settle window only covers commit delay, not replica lag.
+    # Returns (last id read, more rows waiting, updated rows per entity, deleted ids per
+    # entity); an entity written several times is reported once, by its last action.
+    settled = datetime.utcnow() - timedelta(seconds=CHANGES_SETTLE_SECONDS)
+    rows = (
+        db.query(ChangeLog)
+        .filter(ChangeLog.id > after)
+        .order_by(ChangeLog.id)
+        .limit(limit + 1)
+        .all()
+    )
+    more = len(rows) > limit
+    last = after
+    actions: Dict[Tuple[str, str], str] = {}
+    for row in rows[:limit]:
+        if row.changed_at > settled:
+            # Nothing more can be read until it settles; the client polls again as usual
+            more = False
+            break
+        last = row.id
+        actions.pop((row.entity, row.entity_id), None)
+        actions[(row.entity, row.entity_id)] = row.action
+    changed: Dict[str, List[str]] = {}
+    deleted: Dict[str, List[str]] = {}
+    for (entity, entity_id), action in actions.items():
+        (deleted if action == "delete" else changed).setdefault(entity, []).append(entity_id)
+    updated = {entity: get_by_ids(db, ROOT_MODELS[entity], ids) for entity, ids in changed.items()}
+    return last, more, updated, deleted
@@ -1,18 +1,104 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from dotenv import load_dotenv
+from fastapi import Request
+import itertools
+import logging
 import os
+import threading
+import time
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL", "mysql+pymysql://root:@localhost:3306/destinasi_db")
+# Comma-separated read replica URLs; read-only endpoints are spread across them
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# How long a replica that failed its health check is skipped before being retried
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+# How long a client that just wrote keeps reading from the primary, to cover replication lag
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+READ_PRIMARY_COOKIE = "read_primary_until"
+
+def _create_engine(url: str, **kwargs):
+    db_engine = create_engine(url, **kwargs)
+
+    # SQLite only enforces ON DELETE CASCADE when foreign keys are switched on per connection
+    if db_engine.dialect.name == "sqlite":
+        @event.listens_for(db_engine, "connect")
+        def _enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA foreign_keys=ON")
+            cursor.close()
+
+    return db_engine
+
+engine = _create_engine(DATABASE_URL)
 
-engine = create_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+class ReplicaSet:
+    def __init__(self, engines):
+        self.engines = engines
+        self._down_until = [0.0] * len(engines)
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def candidates(self):
+        # Healthy replicas in round-robin order, starting one further along on each call
+        if not self.engines:
+            return []
+        start = next(self._counter) % len(self.engines)
+        now = time.monotonic()
+        order = [(start + offset) % len(self.engines) for offset in range(len(self.engines))]
+        return [(index, self.engines[index]) for index in order if self._down_until[index] <= now]
+
+    def mark_down(self, index: int):
+        with self._lock:
+            self._down_until[index] = time.monotonic() + REPLICA_RETRY_SECONDS
+        logger.warning("Read replica %d failed its health check; using others for %.0fs", index, REPLICA_RETRY_SECONDS)
+
+# pool_pre_ping makes every checkout a health check, so a dead replica is noticed before a query runs on it
+replicas = ReplicaSet([_create_engine(url, pool_pre_ping=True) for url in DATABASE_REPLICA_URLS])
+
+def read_engine(prefer_primary: bool = False):
+    if not prefer_primary:
+        for index, replica in replicas.candidates():
+            try:
+                with replica.connect():
+                    return replica
+            except OperationalError:
+                replicas.mark_down(index)
+    # No replicas configured, all of them down, or the client needs its own writes
+    return engine
+
+class ReadSession(Session):
+    # Picks its engine when it first needs a connection, so a request answered from the
+    # cache, or waiting for another request's identical fetch, holds no connection
+    def __init__(self, prefer_primary: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.prefer_primary = prefer_primary
+        self._read_engine = None
+
+    def get_bind(self, mapper=None, **kwargs):
+        if self._read_engine is None:
+            self._read_engine = read_engine(self.prefer_primary)
+        return self._read_engine
+
+def open_read_session(prefer_primary: bool = False):
+    return ReadSession(prefer_primary, autoflush=False)
+
+def wrote_recently(request: Request) -> bool:
+    try:
+        return float(request.cookies.get(READ_PRIMARY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
 def get_db():
     db = SessionLocal()
     try:
@@ -20,5 +106,13 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db(request: Request):
+    # For read-only endpoints: a replica session unless the client wrote within the lag window
+    db = open_read_session(prefer_primary=wrote_recently(request))
+    try:
+        yield db
+    finally:
+        db.close()
+
 def create_tables():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
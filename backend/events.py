@@ -0,0 +1,55 @@
+import logging
+from collections import defaultdict
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Write events published by crud after a commit.
+# Handlers are called as handler(entity, action, entity_id, obj) where action is
+# "create", "update" or "delete" and obj is None for deletes.
+Handler = Callable[[str, str, str, Any], None]
+# Called as handler(db) when writes from other workers may have been missed
+ResyncHandler = Callable[[Any], None]
+
+ALL = "*"
+
+_handlers: Dict[str, List[Handler]] = defaultdict(list)
+# Writes made by other workers, delivered by relay.py with obj reloaded from the
+# database. Only in-memory indexes subscribe; shared state such as the Redis cache
+# is already up to date.
+_remote_handlers: Dict[str, List[Handler]] = defaultdict(list)
+_resync_handlers: List[ResyncHandler] = []
+
+def subscribe(entity: str, handler: Handler) -> None:
+    _handlers[entity].append(handler)
+
+def unsubscribe(entity: str, handler: Handler) -> None:
+    if handler in _handlers[entity]:
+        _handlers[entity].remove(handler)
+
+def subscribe_remote(entity: str, handler: Handler) -> None:
+    _remote_handlers[entity].append(handler)
+
+def subscribe_resync(handler: ResyncHandler) -> None:
+    _resync_handlers.append(handler)
+
+def _deliver(handlers: List[Handler], entity: str, action: str, entity_id: str, obj: Any) -> None:
+    # The write is already committed, so a failing handler is logged instead of failing the request
+    for handler in handlers:
+        try:
+            handler(entity, action, entity_id, obj)
+        except Exception:
+            logger.exception("Write handler %s failed for %s %s %s", getattr(handler, "__module__", handler), action, entity, entity_id)
+
+def publish(entity: str, action: str, entity_id: str, obj: Any = None) -> None:
+    _deliver(list(_handlers[entity]) + list(_handlers[ALL]), entity, action, entity_id, obj)
+
+def publish_remote(entity: str, action: str, entity_id: str, obj: Any = None) -> None:
+    _deliver(list(_remote_handlers[entity]) + list(_remote_handlers[ALL]), entity, action, entity_id, obj)
+
+def resync(db) -> None:
+    for handler in list(_resync_handlers):
+        try:
+            handler(db)
+        except Exception:
+            logger.exception("Resync handler %s failed", getattr(handler, "__module__", handler))
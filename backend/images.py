@@ -0,0 +1,326 @@
+import hashlib
+import http.client
+import importlib.util
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.parse
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+import events
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Relative image_url values are read from this directory; http(s) URLs are fetched
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", "images/originals")
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "images/cache")
+# Public prefix of the variant URLs put into API payloads
+IMAGE_BASE_URL = os.getenv("IMAGE_BASE_URL", "/images")
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+# Comma-separated hosts remote originals may be fetched from; when empty any host is
+# allowed whose addresses are all public (not private, loopback, link-local or reserved)
+IMAGE_FETCH_HOSTS = {host.strip().lower() for host in os.getenv("IMAGE_FETCH_HOSTS", "").split(",") if host.strip()}
+FETCH_TIMEOUT = 15
+MAX_ORIGINAL_BYTES = 25 * 1024 * 1024
+# A URL whose variants could not be made is retried after this long
+RETRY_FAILED_SECONDS = 600
+
+# Variant name -> longest side in pixels; cards on list pages, full width on detail pages
+VARIANTS = {
+    "thumb": 160,
+    "card": 480,
+    "detail": 1280,
+}
+WEBP_QUALITY = 80
+
+# Entities whose rows (and galleries) carry image_url
+IMAGE_ENTITIES = ("destination", "accommodation", "culinary", "photo_spot", "transport_route", "review")
+
+@lru_cache(maxsize=65536)
+def source_key(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()[:32]
+
+def variant_urls(url: str) -> Dict[str, str]:
+    key = source_key(url)
+    return {name: f"{IMAGE_BASE_URL}/{key}/{name}.webp" for name in VARIANTS}
+
+def _source_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, "sources", key)
+
+def is_source_key(key: str) -> bool:
+    return len(key) == 32 and all(ch in "0123456789abcdef" for ch in key)
+
+def _url_path(cache_dir: str, key: str) -> str:
+    # Which URL a key stands for, shared by every worker
+    return os.path.join(cache_dir, "urls", key)
+
+def _object_path(cache_dir: str, digest: str, variant: str) -> str:
+    # Variants are stored by the hash of the original's bytes, so identical images share them
+    return os.path.join(cache_dir, "objects", digest[:2], digest, variant + ".webp")
+
+def _write_atomic(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+def check_fetch_url(url: str):
+    # Image URLs come from anonymous review submissions, so the server must not be made
+    # to fetch from its own network. Raises ValueError for URLs that may not be fetched.
+    parsed = urllib.parse.urlsplit(url)
+    host = (parsed.hostname or "").lower()
+    if parsed.scheme not in ("http", "https") or not host:
+        raise ValueError(f"Not an http(s) image URL: {url}")
+    if IMAGE_FETCH_HOSTS and host not in IMAGE_FETCH_HOSTS:
+        raise ValueError(f"Image host is not in IMAGE_FETCH_HOSTS: {host}")
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)}
+    except (OSError, ValueError) as e:
+        raise ValueError(f"Cannot resolve image host {host}: {e}") from e
+    for address in addresses:
+        _check_address(host, address)
+
+def _check_address(host: str, address: str):
+    ip = ipaddress.ip_address(address.split("%")[0])
+    if getattr(ip, "ipv4_mapped", None):
+        ip = ip.ipv4_mapped
+    if not ip.is_global or ip.is_multicast:
+        raise ValueError(f"Image host {host} resolves to a non-public address {ip}")
+
+class _CheckedHTTPConnection(http.client.HTTPConnection):
+    # The host is resolved again when connecting, and a DNS rebinding host can answer
+    # with an internal address this time; so the address actually connected to is
+    # checked as well, before anything is sent. Host and SNI stay the original name.
+    def connect(self):
+        super().connect()
+        try:
+            _check_address(self.host, self.sock.getpeername()[0])
+        except ValueError:
+            self.sock.close()
+            self.sock = None
+            raise
+
+class _CheckedHTTPSConnection(http.client.HTTPSConnection, _CheckedHTTPConnection):
+    # HTTPSConnection.connect wraps the socket in TLS after _CheckedHTTPConnection.connect
+    pass
+
+class _CheckedHTTPHandler(urllib.request.HTTPHandler):
+    def do_open(self, http_class, req, **kwargs):
+        return super().do_open(_CheckedHTTPConnection, req, **kwargs)
+
+class _CheckedHTTPSHandler(urllib.request.HTTPSHandler):
+    def do_open(self, http_class, req, **kwargs):
+        return super().do_open(_CheckedHTTPSConnection, req, **kwargs)
+
+class _CheckedRedirects(urllib.request.HTTPRedirectHandler):
+    # A public URL must not redirect the fetch to an internal one
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_fetch_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+# No proxies: the checked peer has to be the image host itself
+_opener = urllib.request.build_opener(
+    urllib.request.ProxyHandler({}), _CheckedHTTPHandler, _CheckedHTTPSHandler, _CheckedRedirects
+)
+
+def _read_original(url: str, store_dir: str) -> bytes:
+    if url.startswith(("http://", "https://")):
+        check_fetch_url(url)
+        with _opener.open(url, timeout=FETCH_TIMEOUT) as response:
+            data = response.read(MAX_ORIGINAL_BYTES + 1)
+    else:
+        root = os.path.realpath(store_dir)
+        path = os.path.realpath(os.path.join(root, url.lstrip("/")))
+        if os.path.commonpath([root, path]) != root:
+            raise ValueError(f"Image path escapes the image store: {url}")
+        with open(path, "rb") as f:
+            data = f.read(MAX_ORIGINAL_BYTES + 1)
+    if len(data) > MAX_ORIGINAL_BYTES:
+        raise ValueError(f"Original image is larger than {MAX_ORIGINAL_BYTES} bytes: {url}")
+    return data
+
+def render_variants(url: str, store_dir: str, cache_dir: str) -> str:
+    # Runs in a pool process: read the original, write every missing variant, then
+    # record which content the URL resolved to. Returns the content digest.
+    from io import BytesIO
+    from PIL import Image, ImageOps
+
+    data = _read_original(url, store_dir)
+    digest = hashlib.sha256(data).hexdigest()
+    missing = [name for name in VARIANTS if not os.path.exists(_object_path(cache_dir, digest, name))]
+    if missing:
+        with Image.open(BytesIO(data)) as original:
+            image = ImageOps.exif_transpose(original)
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+            for name in missing:
+                variant = image.copy()
+                variant.thumbnail((VARIANTS[name], VARIANTS[name]), Image.LANCZOS)
+                output = BytesIO()
+                variant.save(output, "WEBP", quality=WEBP_QUALITY, method=4)
+                _write_atomic(_object_path(cache_dir, digest, name), output.getvalue())
+    _write_atomic(_source_path(cache_dir, source_key(url)), digest.encode())
+    return digest
+
+class ImagePipeline:
+    # Hands URLs to a process pool, at most once at a time each. Also records which URL
+    # every source key belongs to, in memory and under cache_dir so that all workers
+    # share it, so /images can start work for a key it has not rendered yet; only URLs
+    # stored in the database are ever fetched.
+    def __init__(self, store_dir: str = IMAGE_STORE_DIR, cache_dir: str = IMAGE_CACHE_DIR, workers: int = IMAGE_WORKERS):
+        self.store_dir = store_dir
+        self.cache_dir = cache_dir
+        self.workers = workers
+        self._urls: Dict[str, str] = {}
+        self._digests: Dict[str, str] = {}
+        self._pending = set()
+        self._failed: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._available = importlib.util.find_spec("PIL") is not None
+        if not self._available:
+            logger.warning("Pillow is not installed; /images will redirect to the original images")
+
+    def register(self, urls: Iterable[str]) -> List[str]:
+        keys = []
+        new = {}
+        with self._lock:
+            for url in urls:
+                if url:
+                    key = source_key(url)
+                    if key not in self._urls:
+                        new[key] = url
+                    self._urls[key] = url
+                    keys.append(key)
+        for key, url in new.items():
+            path = _url_path(self.cache_dir, key)
+            if not os.path.exists(path):
+                try:
+                    _write_atomic(path, url.encode())
+                except OSError:
+                    logger.warning("Could not record the URL of image key %s", key, exc_info=True)
+        return keys
+
+    def lookup(self, key: str) -> Optional[str]:
+        url = self._urls.get(key)
+        if url is None and is_source_key(key):
+            # Registered by another worker
+            try:
+                with open(_url_path(self.cache_dir, key), encoding="utf-8") as f:
+                    url = f.read()
+            except (FileNotFoundError, ValueError):
+                return None
+            self._urls[key] = url
+        return url
+
+    def variant_path(self, key: str, variant: str) -> Optional[str]:
+        # Path of a rendered variant, or None if the URL has not been processed yet
+        digest = self._digests.get(key)
+        if digest is None and not is_source_key(key):
+            return None
+        if digest is None:
+            try:
+                with open(_source_path(self.cache_dir, key)) as f:
+                    digest = f.read().strip()
+            except FileNotFoundError:
+                return None
+            self._digests[key] = digest
+        path = _object_path(self.cache_dir, digest, variant)
+        return path if os.path.exists(path) else None
+
+    def enqueue(self, urls: Iterable[str]):
+        if not self._available:
+            return
+        now = time.monotonic()
+        with self._lock:
+            todo = [
+                url for url in dict.fromkeys(urls)
+                if url and url not in self._pending and self._failed.get(url, 0) <= now
+                and not os.path.exists(_source_path(self.cache_dir, source_key(url)))
+            ]
+            if not todo:
+                return
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            executor = self._executor
+            self._pending.update(todo)
+        for url in todo:
+            future = executor.submit(render_variants, url, self.store_dir, self.cache_dir)
+            future.add_done_callback(lambda done, url=url: self._finished(url, done))
+
+    def _finished(self, url: str, future):
+        with self._lock:
+            self._pending.discard(url)
+            error = future.exception()
+            if error is None:
+                self._digests[source_key(url)] = future.result()
+                self._failed.pop(url, None)
+            else:
+                self._failed[url] = time.monotonic() + RETRY_FAILED_SECONDS
+        if error is not None:
+            logger.warning("Could not make image variants for %s: %s", url, error)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+pipeline = ImagePipeline()
+
+def image_urls(obj) -> List[str]:
+    urls = [getattr(obj, "image_url", None)]
+    urls.extend(image.image_url for image in getattr(obj, "gallery", None) or [])
+    return [url for url in urls if url]
+
+def all_image_urls(db) -> List[str]:
+    from models import (
+        Destination, DestinationGallery, Accommodation, AccommodationGallery, Culinary, CulinaryGallery,
+        PhotoSpot, PhotoSpotGallery, TransportRoute, Review,
+    )
+    urls = []
+    for model in (Destination, DestinationGallery, Accommodation, AccommodationGallery, Culinary,
+                  CulinaryGallery, PhotoSpot, PhotoSpotGallery, TransportRoute, Review):
+        urls.extend(row[0] for row in db.query(model.image_url).distinct())
+    return urls
+
+def build(db):
+    # Learn every stored image URL so /images can resolve its keys
+    pipeline.register(all_image_urls(db))
+
+def _on_write(entity: str, action: str, entity_id: str, obj):
+    if action != "delete" and obj is not None:
+        urls = image_urls(obj)
+        pipeline.register(urls)
+        pipeline.enqueue(urls)
+
+for _entity in IMAGE_ENTITIES:
+    events.subscribe(_entity, _on_write)
+
+def pre_render() -> int:
+    # Render variants for every image in the database and wait for them
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        urls = list(dict.fromkeys(all_image_urls(db)))
+    finally:
+        db.close()
+    pipeline.register(urls)
+    pipeline.enqueue(urls)
+    pipeline.shutdown()
+    return sum(1 for url in urls if os.path.exists(_source_path(pipeline.cache_dir, source_key(url))))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"{pre_render()} images have variants in {IMAGE_CACHE_DIR}")
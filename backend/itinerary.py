@@ -0,0 +1,148 @@
+import heapq
+import re
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy.orm import Session, selectinload
+
+import events
+from models import TransportRoute
+from parsers import parse_duration_minutes, parse_rupiah
+from search_index import normalize
+
+# What /transport-routes/plan can minimise; the other total breaks ties
+OPTIMIZE = ("time", "cost")
+
+# "Pontianak ke Temajuk", "Dari Sambas menuju Temajuk", "Sambas - Temajuk", "Sambas → Temajuk"
+_ENDPOINTS = re.compile(r'^\s*(?:dari\s+)?(.+?)\s+(?:ke|menuju|to|-|–|→|->)\s+(.+?)\s*$', re.IGNORECASE)
+
+class Leg(NamedTuple):
+    route_id: str
+    title: str
+    origin: str
+    destination: str
+    minutes: Optional[int]
+    cost: Optional[int]
+
+def route_endpoints(title: str) -> Optional[Tuple[str, str]]:
+    match = _ENDPOINTS.match(title or "")
+    return (match.group(1), match.group(2)) if match else None
+
+def _total(values: List[Optional[int]]) -> Optional[int]:
+    return sum(values) if values and None not in values else None
+
+def route_leg(route: TransportRoute) -> Optional[Leg]:
+    # A route is one leg between the places named in its title. Its time and cost are
+    # the sums over its steps, or the route's own estimates when a step has no number.
+    endpoints = route_endpoints(route.title)
+    if endpoints is None:
+        return None
+    minutes = _total([step.duration_minutes for step in route.steps])
+    cost = _total([step.cost_rupiah for step in route.steps])
+    if minutes is None:
+        minutes = parse_duration_minutes(route.estimated_time)
+    if cost is None:
+        cost = parse_rupiah(route.estimated_cost)
+    return Leg(route.id, route.title, endpoints[0], endpoints[1], minutes, cost)
+
+class RouteGraph:
+    # Directed graph of route legs between places, keyed by normalized place name. The
+    # adjacency lists are rebuilt from the legs when a route is written, never per request.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._legs: Dict[str, Leg] = {}
+        self._edges: Dict[str, List[Leg]] = {}
+        self._places: Dict[str, str] = {}
+
+    def load(self, legs: List[Leg]):
+        with self._lock:
+            self._legs = {leg.route_id: leg for leg in legs}
+            self._rebuild()
+
+    def upsert(self, route_id: str, leg: Optional[Leg]):
+        # A route whose title names no places is dropped from the graph
+        with self._lock:
+            if leg is None:
+                self._legs.pop(route_id, None)
+            else:
+                self._legs[route_id] = leg
+            self._rebuild()
+
+    def remove(self, route_id: str):
+        self.upsert(route_id, None)
+
+    def _rebuild(self):
+        edges: Dict[str, List[Leg]] = {}
+        places: Dict[str, str] = {}
+        for leg in self._legs.values():
+            origin, destination = normalize(leg.origin), normalize(leg.destination)
+            edges.setdefault(origin, []).append(leg)
+            places.setdefault(origin, leg.origin)
+            places.setdefault(destination, leg.destination)
+        self._edges, self._places = edges, places
+
+    def place(self, name: str) -> Optional[str]:
+        # Exact normalized match, else the only place whose name contains it ("temajuk" ~ "Desa Temajuk")
+        key = normalize(name)
+        places = self._places
+        if key in places:
+            return key
+        matches = [place for place in places if key and key in place]
+        return matches[0] if len(matches) == 1 else None
+
+    def plan(self, origin: str, destination: str, optimize: str = "time") -> Optional[List[Leg]]:
+        # Dijkstra over (primary total, secondary total, legs); legs missing the optimised
+        # number are skipped. Returns None when no chain of routes connects the places.
+        primary, secondary = ("minutes", "cost") if optimize == "time" else ("cost", "minutes")
+        edges = self._edges
+        best = {origin: (0, 0, 0)}
+        previous: Dict[str, Tuple[str, Leg]] = {}
+        heap = [(0, 0, 0, origin)]
+        while heap:
+            first, second, hops, place = heapq.heappop(heap)
+            if place == destination:
+                break
+            if best[place] < (first, second, hops):
+                continue
+            for leg in edges.get(place, ()):
+                if getattr(leg, primary) is None:
+                    continue
+                target = normalize(leg.destination)
+                cost = (first + getattr(leg, primary), second + (getattr(leg, secondary) or 0), hops + 1)
+                if target not in best or cost < best[target]:
+                    best[target] = cost
+                    previous[target] = (place, leg)
+                    heapq.heappush(heap, (*cost, target))
+        if destination not in best:
+            return None
+        legs = []
+        place = destination
+        while place != origin:
+            place, leg = previous[place]
+            legs.append(leg)
+        return legs[::-1]
+
+    def display_name(self, key: str) -> str:
+        return self._places.get(key, key)
+
+graph = RouteGraph()
+
+def totals(legs: List[Leg]) -> Tuple[Optional[int], Optional[int]]:
+    # (minutes, rupiah) of a plan; None when a leg has no number for it
+    if not legs:
+        return 0, 0
+    return _total([leg.minutes for leg in legs]), _total([leg.cost for leg in legs])
+
+def build(db: Session):
+    routes = db.query(TransportRoute).options(selectinload(TransportRoute.steps)).all()
+    graph.load([leg for leg in map(route_leg, routes) if leg is not None])
+
+def _on_write(entity: str, action: str, entity_id: str, obj):
+    if action == "delete":
+        graph.remove(entity_id)
+    else:
+        graph.upsert(entity_id, route_leg(obj))
+
+events.subscribe("transport_route", _on_write)
+events.subscribe_remote("transport_route", _on_write)
+events.subscribe_resync(build)
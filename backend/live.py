@@ -0,0 +1,145 @@
+import asyncio
+import json
+import os
+from typing import Dict, Iterable, Optional, Set
+
+from dotenv import load_dotenv
+
+import cache
+import events
+
+load_dotenv()
+
+# Messages a stream can fall behind by before its backlog is dropped for a resync
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "100"))
+# Open streams per worker; more are turned away with 503
+LIVE_MAX_STREAMS = int(os.getenv("LIVE_MAX_STREAMS", "10000"))
+# Idle streams get a comment line this often so proxies do not close them
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS", "15"))
+
+# Entities crud publishes writes for. As in the cache, a stream that follows an entity
+# also gets the writes to its related entities (room writes for accommodation).
+LIVE_ENTITIES = ("destination", "accommodation", "room", "culinary", "review", "photo_spot", "transport_route")
+
+# Sent first: how long EventSource waits before reconnecting, in milliseconds
+RETRY = b"retry: 5000\n\n"
+HEARTBEAT = b": keep-alive\n\n"
+# Sent instead of the messages a slow stream missed; the client catches up with /changes
+RESYNC = b"event: resync\ndata: {}\n\n"
+
+def format_event(entity: str, action: str, entity_id, obj) -> bytes:
+    # Ids only; clients fetch the rows through the batch endpoints, which are cached
+    data = {"entity": entity, "action": action, "id": str(entity_id)}
+    updated_at = getattr(obj, "updated_at", None)
+    if updated_at is not None:
+        data["updated_at"] = updated_at.isoformat()
+    return f"event: {action}\ndata: {json.dumps(data)}\n\n".encode()
+
+class Stream:
+    # One client's bounded queue. When it is full the backlog is replaced by a single
+    # resync message, so a slow reader holds at most LIVE_QUEUE_SIZE messages and never
+    # holds up the writer or the other streams.
+    __slots__ = ("entities", "queue")
+
+    def __init__(self, entities: Iterable[str], size: int = LIVE_QUEUE_SIZE):
+        self.entities = tuple(entities)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=size)
+
+    def offer(self, message: bytes):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+class Broadcaster:
+    # Fans write events out to the open streams of this worker. crud publishes from
+    # request threads, so each event is serialised once there and handed to the event
+    # loop in one call_soon_threadsafe; on the loop it costs one put_nowait per stream
+    # that asked for the entity. Idle streams cost no task or timer of their own: one
+    # heartbeat timer per worker writes to those with nothing queued.
+    def __init__(self, max_streams: int = LIVE_MAX_STREAMS, heartbeat: float = LIVE_HEARTBEAT_SECONDS):
+        self.max_streams = max_streams
+        self.heartbeat = heartbeat
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._streams: Dict[str, Set[Stream]] = {entity: set() for entity in LIVE_ENTITIES}
+        self._count = 0
+
+    def open(self, entities: Iterable[str]) -> Optional[Stream]:
+        # Called on the event loop; None when the worker already has max_streams open
+        if self._count >= self.max_streams:
+            return None
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop.call_later(self.heartbeat, self._beat)
+        stream = Stream(entities)
+        for entity in stream.entities:
+            self._streams[entity].add(stream)
+        self._count += 1
+        return stream
+
+    def close(self, stream: Stream):
+        for entity in stream.entities:
+            self._streams[entity].discard(stream)
+        self._count -= 1
+
+    def publish(self, entity: str, message: bytes):
+        # Safe from any thread; dropped when this worker has no streams
+        loop = self._loop
+        if loop is None or not self._count or entity not in self._streams:
+            return
+        try:
+            loop.call_soon_threadsafe(self._fan_out, entity, message)
+        except RuntimeError:
+            # The loop has been closed at shutdown
+            pass
+
+    def publish_all(self, message: bytes):
+        loop = self._loop
+        if loop is None or not self._count:
+            return
+        try:
+            loop.call_soon_threadsafe(self._fan_out_all, message)
+        except RuntimeError:
+            pass
+
+    def _fan_out(self, entity: str, message: bytes):
+        streams = self._streams[entity]
+        for related in cache.RELATED_TAGS.get(entity, ()):
+            streams = streams | self._streams[related]
+        for stream in streams:
+            stream.offer(message)
+
+    def _fan_out_all(self, message: bytes):
+        for stream in set().union(*self._streams.values()):
+            stream.offer(message)
+
+    def _beat(self):
+        for stream in set().union(*self._streams.values()):
+            if stream.queue.empty():
+                stream.offer(HEARTBEAT)
+        self._loop.call_later(self.heartbeat, self._beat)
+
+broadcaster = Broadcaster()
+
+async def stream_events(stream: Stream):
+    # Body of a text/event-stream response; the stream is closed when the client disconnects
+    try:
+        yield RETRY
+        while True:
+            yield await stream.queue.get()
+    finally:
+        broadcaster.close(stream)
+
+def _on_write(entity: str, action: str, entity_id: str, obj):
+    broadcaster.publish(entity, format_event(entity, action, entity_id, obj))
+
+def _on_resync(db):
+    # Writes from other workers were missed, so every stream has to catch up
+    broadcaster.publish_all(RESYNC)
+
+# Local writes, and those of other workers through relay.py
+events.subscribe(events.ALL, _on_write)
+events.subscribe_remote(events.ALL, _on_write)
+events.subscribe_resync(_on_resync)
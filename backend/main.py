@@ -1,23 +1,40 @@
-from fastapi import FastAPI, Depends, HTTPException, Query, status
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
-import uvicorn
-
-from database import get_db, create_tables
-from models import (
-    Destination, DestinationTip, DestinationGallery, Facility, destination_facility,
-    Activity, destination_activity, PhotoSpot, PhotoSpotTip, PhotoSpotGallery, 
-    PhotoSpotNearbyAttraction, Review, TransportRoute, RouteStep, RouteTip,
-    Accommodation, Room, AccommodationGallery, accommodation_facility,
-    Culinary, CulinarySpecialty, CulinaryGallery
-)
+from datetime import datetime, timedelta, timezone
+import hashlib
+import os
+import time
+
+from database import get_db, get_read_db, wrote_recently, engine, replicas, READ_PRIMARY_COOKIE, READ_YOUR_WRITES_SECONDS
+from models import Destination, Accommodation, Culinary, Review, PhotoSpot, TransportRoute, Facility, Activity
 import schemas
 import crud
+from parsers import parse_clock
+import admission
+import cache
+import images
+import itinerary
+import live
+import map_index
+import pages
+import recommendations
+import relay
+import review_queue
+import schema_migrations
+import search_index
+import warmup
 
 app = FastAPI(title="Temajuk Tourism API", 
               description="API for Temajuk Tourism Information System")
 
+# Admission control: concurrency is capped at what the DB pool can serve, excess requests
+# wait briefly in a priority queue, and overload is shed with 503/429 plus Retry-After.
+# Added before CORS so that rejections still carry CORS headers.
+app.add_middleware(admission.AdmissionMiddleware, max_concurrency=admission.pool_capacity(engine))
+
 # CORS Configuration
 app.add_middleware(
     CORSMiddleware,
@@ -25,18 +42,129 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Browsers only let cross-origin scripts read headers listed here
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Initialize database tables
+# Read-your-writes: after a successful write, keep this client on the primary for the lag window
+@app.middleware("http")
+async def route_reads_after_writes(request: Request, call_next):
+    response = await call_next(request)
+    is_write = request.method not in ("GET", "HEAD", "OPTIONS") and not admission.is_batch_read(request.method, request.url.path)
+    if replicas.engines and is_write and response.status_code < 400:
+        response.set_cookie(
+            READ_PRIMARY_COOKIE,
+            str(time.time() + READ_YOUR_WRITES_SECONDS),
+            max_age=int(READ_YOUR_WRITES_SECONDS) + 1,
+            httponly=True,
+        )
+    return response
+
+# Apply pending schema migrations (a single-row read when the schema is current),
+# then warm up in the background; /ready reports when that is done
 @app.on_event("startup")
 def on_startup():
-    create_tables()
+    schema_migrations.upgrade(engine)
+    warmup.start(app)
+    if review_queue.writer is not None:
+        review_queue.writer.start()
+
+# Queued reviews are written before the worker exits
+@app.on_event("shutdown")
+def on_shutdown():
+    if review_queue.writer is not None:
+        review_queue.writer.stop()
+    images.pipeline.shutdown()
+
+# Facet counts are cheap to recompute, so keep them only briefly
+FACETS_CACHE_TTL = int(os.getenv("FACETS_CACHE_TTL", "10"))
+
+# Opening hours are Temajuk local time; Indonesia has no daylight saving, so a fixed offset is exact
+LOCAL_TIMEZONE = timezone(timedelta(hours=7), "WIB")
+
+def parse_open_at(open_at: Optional[str], open_now: bool):
+    # (minute of the day to filter on or None, cache ttl). open_now answers are cached
+    # only until the minute changes.
+    if open_now:
+        now = datetime.now(LOCAL_TIMEZONE)
+        return now.hour * 60 + now.minute, min(cache.CACHE_TTL, 60 - now.second)
+    if open_at is None:
+        return None, cache.CACHE_TTL
+    minute = parse_clock(open_at)
+    if minute is None:
+        raise HTTPException(status_code=400, detail="open_at must be HH:MM")
+    return minute, cache.CACHE_TTL
+
+def parse_ids(ids: str) -> List[str]:
+    return [entity_id for entity_id in (part.strip() for part in ids.split(",")) if entity_id]
+
+def parse_include(include: Optional[str], model) -> Optional[List[str]]:
+    # None means every collection, as before ?include= existed
+    if include is None:
+        return None
+    names = [name for name in (part.strip() for part in include.split(",")) if name]
+    unknown = [name for name in names if name not in crud.COLLECTIONS[model]]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown include: {', '.join(unknown)}. Choose from: {', '.join(crud.COLLECTIONS[model])}",
+        )
+    return names
+
+def omitted(model, include: Optional[List[str]], many: bool = False):
+    # Serializer exclude for the collections left out of include
+    if include is None:
+        return None
+    left_out = set(crud.COLLECTIONS[model]) - set(include)
+    if not left_out:
+        return None
+    return {"__all__": left_out} if many else left_out
+
+def batch_delete_result(requested: List[str], deleted: List[str]) -> dict:
+    deleted_set = set(deleted)
+    return {"deleted": deleted, "missing": [entity_id for entity_id in requested if entity_id not in deleted_set]}
+
+# Most ids one batch fetch accepts; GET suits the 20-50 ids a screen holds, POST longer lists
+MAX_BATCH_IDS = int(os.getenv("MAX_BATCH_IDS", "500"))
+
+def batch_fetch(request: Request, db: Session, model, entity: str, response_type, ids: List[str],
+                include: Optional[str] = None, from_body: bool = False):
+    # Rows in the requested order plus the ids that matched nothing, from one IN query and
+    # one more per included collection, however many ids are asked for. The POST form takes
+    # the ids from its body, for lists too long for a URL, and is cached by their hash.
+    requested = list(dict.fromkeys(ids))
+    if not requested:
+        raise HTTPException(status_code=400, detail="ids must not be empty")
+    if len(requested) > MAX_BATCH_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IDS} ids per request")
+    names = parse_include(include, model) if model in crud.COLLECTIONS else None
+    def produce():
+        rows = crud.get_by_ids(db, model, requested, names)
+        found = {row.id for row in rows}
+        return {"items": rows, "missing": [entity_id for entity_id in requested if entity_id not in found]}
+    left_out = omitted(model, names, many=True)
+    key = None
+    if from_body:
+        digest = hashlib.sha256("\n".join(requested).encode()).hexdigest()
+        key = f"{cache.request_key(request)}&ids-sha256={digest}"
+    return cache.cached_json(
+        request, [entity], schemas.BatchFetchResult[response_type], produce,
+        exclude={"items": left_out} if left_out else None, key=key,
+    )
 
 # Health check endpoint
 @app.get("/", tags=["Root"])
 def read_root():
     return {"message": "Welcome to Temajuk Tourism API"}
 
+# Readiness check: 503 until the worker has finished warming up
+@app.get("/ready", tags=["Root"])
+def read_ready(response: Response):
+    if not warmup.state["ready"]:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "failed" if warmup.state["error"] else "warming_up"}
+    return {"status": "ready", "warmup_ms": warmup.state["duration_ms"]}
+
 # --------------------------
 # DESTINATION ENDPOINTS
 # --------------------------
@@ -46,25 +174,56 @@ def create_destination(destination: schemas.DestinationCreate, db: Session = Dep
 
 @app.get("/destinations/", response_model=List[schemas.Destination], tags=["Destinations"])
 def read_destinations(
+    request: Request,
     skip: int = 0, 
     limit: int = 100,
     search: Optional[str] = None,
+    fuzzy: bool = Query(False, description="Typo-tolerant search using the trigram index"),
+    open_at: Optional[str] = Query(None, description="Only rows open at this local time (HH:MM, WIB)"),
+    open_now: bool = Query(False, description="Only rows open at the current local time"),
     category: Optional[str] = None,
-    db: Session = Depends(get_db)
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
 ):
-    destinations = crud.get_destinations(db, skip=skip, limit=limit, search=search)
-    if category:
-        destinations = [d for d in destinations if d.category == category]
-    return destinations
+    names = parse_include(include, Destination)
+    minute, ttl = parse_open_at(open_at, open_now)
+    def produce():
+        destinations = crud.get_destinations(db, skip=skip, limit=limit, search=search, include=names, fuzzy=fuzzy, open_at=minute)
+        if category:
+            destinations = [d for d in destinations if d.category == category]
+        return destinations
+    return cache.cached_json(request, ["destination"], List[schemas.Destination], produce, ttl=ttl, exclude=omitted(Destination, names, many=True))
+
+@app.get("/destinations/batch", response_model=schemas.BatchFetchResult[schemas.Destination], tags=["Destinations"])
+def read_destinations_batch(
+    request: Request,
+    ids: str = Query(..., description="Comma-separated ids"),
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    return batch_fetch(request, db, Destination, "destination", schemas.Destination, parse_ids(ids), include)
+
+@app.post("/destinations/batch", response_model=schemas.BatchFetchResult[schemas.Destination], tags=["Destinations"])
+def read_destinations_batch_from_body(
+    request: Request,
+    batch: schemas.BatchFetch,
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    return batch_fetch(request, db, Destination, "destination", schemas.Destination, batch.ids, include, from_body=True)
 
 @app.get("/destinations/{destination_id}", response_model=schemas.Destination, tags=["Destinations"])
-def read_destination(destination_id: str, db: Session = Depends(get_db)):
-    db_destination = crud.get_destination(db, destination_id=destination_id)
-    if db_destination is None:
-        raise HTTPException(status_code=404, detail="Destination not found")
-    return db_destination
+def read_destination(request: Request, destination_id: str, include: Optional[str] = None, db: Session = Depends(get_read_db)):
+    names = parse_include(include, Destination)
+    def produce():
+        db_destination = crud.get_destination(db, destination_id=destination_id, include=names)
+        if db_destination is None:
+            raise HTTPException(status_code=404, detail="Destination not found")
+        return db_destination
+    return cache.cached_json(request, ["destination"], schemas.Destination, produce, exclude=omitted(Destination, names))
 
 @app.put("/destinations/{destination_id}", response_model=schemas.Destination, tags=["Destinations"])
+@app.patch("/destinations/{destination_id}", response_model=schemas.Destination, tags=["Destinations"])
 def update_destination(
     destination_id: str, 
     destination: schemas.DestinationUpdate, 
@@ -82,6 +241,52 @@ def delete_destination(destination_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Destination not found")
     return None
 
+@app.delete("/destinations/", response_model=schemas.BatchDeleteResult, tags=["Destinations"])
+def delete_destinations(ids: str = Query(..., description="Comma-separated ids"), db: Session = Depends(get_db)):
+    requested = parse_ids(ids)
+    return batch_delete_result(requested, crud.delete_destinations(db, requested))
+
+@app.get("/destinations/{destination_id}/reviews", response_model=List[schemas.Review], tags=["Destinations"])
+def read_destination_reviews(request: Request, destination_id: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    def produce():
+        reviews = crud.get_destination_reviews(db, destination_id=destination_id, skip=skip, limit=limit)
+        if reviews is None:
+            raise HTTPException(status_code=404, detail="Destination not found")
+        return reviews
+    return cache.cached_json(request, ["review", "destination"], List[schemas.Review], produce)
+
+@app.get("/destinations/{destination_id}/page", response_model=schemas.DestinationPage, tags=["Destinations"])
+def read_destination_page(
+    request: Request,
+    destination_id: str,
+    reviews_limit: int = Query(10, ge=0, le=100),
+    nearby_limit: int = Query(6, ge=0, le=50),
+    radius_km: float = Query(pages.NEARBY_RADIUS_KM, gt=0, le=100),
+):
+    # Everything a destination page shows in one round-trip, cached as a unit
+    def produce():
+        page = pages.destination_page(destination_id, wrote_recently(request), reviews_limit, nearby_limit, radius_km)
+        if page is None:
+            raise HTTPException(status_code=404, detail="Destination not found")
+        return page
+    return cache.cached_json(request, pages.PAGE_TAGS, schemas.DestinationPage, produce)
+
+@app.get("/destinations/{destination_id}/similar", response_model=List[schemas.Destination], tags=["Destinations"])
+def read_similar_destinations(
+    request: Request,
+    destination_id: str,
+    limit: int = Query(recommendations.SIMILAR_K, ge=1, le=recommendations.SIMILAR_K),
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    names = parse_include(include, Destination)
+    def produce():
+        similar = crud.get_similar(db, "destination", destination_id, limit, names)
+        if similar is None:
+            raise HTTPException(status_code=404, detail="Destination not found")
+        return similar
+    return cache.cached_json(request, ["destination"], List[schemas.Destination], produce, exclude=omitted(Destination, names, many=True))
+
 # --------------------------
 # ACCOMMODATION ENDPOINTS
 # --------------------------
@@ -91,25 +296,53 @@ def create_accommodation(accommodation: schemas.AccommodationCreate, db: Session
 
 @app.get("/accommodations/", response_model=List[schemas.Accommodation], tags=["Accommodations"])
 def read_accommodations(
+    request: Request,
     skip: int = 0, 
     limit: int = 100,
     search: Optional[str] = None,
+    fuzzy: bool = Query(False, description="Typo-tolerant search using the trigram index"),
     category: Optional[str] = None,
-    db: Session = Depends(get_db)
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    names = parse_include(include, Accommodation)
+    def produce():
+        accommodations = crud.get_accommodations(db, skip=skip, limit=limit, search=search, include=names, fuzzy=fuzzy)
+        if category:
+            accommodations = [a for a in accommodations if a.category == category]
+        return accommodations
+    return cache.cached_json(request, ["accommodation"], List[schemas.Accommodation], produce, exclude=omitted(Accommodation, names, many=True))
+
+@app.get("/accommodations/batch", response_model=schemas.BatchFetchResult[schemas.Accommodation], tags=["Accommodations"])
+def read_accommodations_batch(
+    request: Request,
+    ids: str = Query(..., description="Comma-separated ids"),
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
 ):
-    accommodations = crud.get_accommodations(db, skip=skip, limit=limit, search=search)
-    if category:
-        accommodations = [a for a in accommodations if a.category == category]
-    return accommodations
+    return batch_fetch(request, db, Accommodation, "accommodation", schemas.Accommodation, parse_ids(ids), include)
+
+@app.post("/accommodations/batch", response_model=schemas.BatchFetchResult[schemas.Accommodation], tags=["Accommodations"])
+def read_accommodations_batch_from_body(
+    request: Request,
+    batch: schemas.BatchFetch,
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    return batch_fetch(request, db, Accommodation, "accommodation", schemas.Accommodation, batch.ids, include, from_body=True)
 
 @app.get("/accommodations/{accommodation_id}", response_model=schemas.Accommodation, tags=["Accommodations"])
-def read_accommodation(accommodation_id: str, db: Session = Depends(get_db)):
-    db_accommodation = crud.get_accommodation(db, accommodation_id=accommodation_id)
-    if db_accommodation is None:
-        raise HTTPException(status_code=404, detail="Accommodation not found")
-    return db_accommodation
+def read_accommodation(request: Request, accommodation_id: str, include: Optional[str] = None, db: Session = Depends(get_read_db)):
+    names = parse_include(include, Accommodation)
+    def produce():
+        db_accommodation = crud.get_accommodation(db, accommodation_id=accommodation_id, include=names)
+        if db_accommodation is None:
+            raise HTTPException(status_code=404, detail="Accommodation not found")
+        return db_accommodation
+    return cache.cached_json(request, ["accommodation"], schemas.Accommodation, produce, exclude=omitted(Accommodation, names))
 
 @app.put("/accommodations/{accommodation_id}", response_model=schemas.Accommodation, tags=["Accommodations"])
+@app.patch("/accommodations/{accommodation_id}", response_model=schemas.Accommodation, tags=["Accommodations"])
 def update_accommodation(
     accommodation_id: str, 
     accommodation: schemas.AccommodationUpdate, 
@@ -127,6 +360,11 @@ def delete_accommodation(accommodation_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Accommodation not found")
     return None
 
+@app.delete("/accommodations/", response_model=schemas.BatchDeleteResult, tags=["Accommodations"])
+def delete_accommodations(ids: str = Query(..., description="Comma-separated ids"), db: Session = Depends(get_db)):
+    requested = parse_ids(ids)
+    return batch_delete_result(requested, crud.delete_accommodations(db, requested))
+
 # Room endpoints
 @app.post("/accommodations/{accommodation_id}/rooms/", response_model=schemas.Room, status_code=status.HTTP_201_CREATED, tags=["Accommodations"])
 def create_room_for_accommodation(
@@ -136,9 +374,44 @@ def create_room_for_accommodation(
 ):
     return crud.create_room(db=db, accommodation_id=accommodation_id, room=room)
 
+@app.get("/accommodations/{accommodation_id}/similar", response_model=List[schemas.Accommodation], tags=["Accommodations"])
+def read_similar_accommodations(
+    request: Request,
+    accommodation_id: str,
+    limit: int = Query(recommendations.SIMILAR_K, ge=1, le=recommendations.SIMILAR_K),
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    names = parse_include(include, Accommodation)
+    def produce():
+        similar = crud.get_similar(db, "accommodation", accommodation_id, limit, names)
+        if similar is None:
+            raise HTTPException(status_code=404, detail="Accommodation not found")
+        return similar
+    return cache.cached_json(request, ["accommodation"], List[schemas.Accommodation], produce, exclude=omitted(Accommodation, names, many=True))
+
 @app.get("/accommodations/{accommodation_id}/rooms/", response_model=List[schemas.Room], tags=["Accommodations"])
-def read_rooms_for_accommodation(accommodation_id: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_rooms_by_accommodation(db, accommodation_id=accommodation_id, skip=skip, limit=limit)
+def read_rooms_for_accommodation(request: Request, accommodation_id: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    def produce():
+        return crud.get_rooms_by_accommodation(db, accommodation_id=accommodation_id, skip=skip, limit=limit)
+    return cache.cached_json(request, ["accommodation"], List[schemas.Room], produce)
+
+@app.get("/rooms/search", response_model=List[schemas.RoomMatch], tags=["Accommodations"])
+def search_rooms(
+    request: Request,
+    guests: Optional[int] = Query(None, ge=1),
+    max_price: Optional[int] = Query(None, ge=0, description="Highest price per night in rupiah"),
+    facilities: Optional[str] = Query(None, description="Comma-separated facilities the accommodation must all offer"),
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=100),
+    db: Session = Depends(get_read_db)
+):
+    def produce():
+        return crud.search_rooms(
+            db, guests=guests, max_price=max_price,
+            facilities=parse_ids(facilities) if facilities else None, skip=skip, limit=limit
+        )
+    return cache.cached_json(request, ["accommodation"], List[schemas.RoomMatch], produce)
 
 # --------------------------
 # CULINARY ENDPOINTS
@@ -149,25 +422,56 @@ def create_culinary(culinary: schemas.CulinaryCreate, db: Session = Depends(get_
 
 @app.get("/culinaries/", response_model=List[schemas.Culinary], tags=["Culinaries"])
 def read_culinaries(
+    request: Request,
     skip: int = 0, 
     limit: int = 100,
     search: Optional[str] = None,
+    fuzzy: bool = Query(False, description="Typo-tolerant search using the trigram index"),
+    open_at: Optional[str] = Query(None, description="Only rows open at this local time (HH:MM, WIB)"),
+    open_now: bool = Query(False, description="Only rows open at the current local time"),
     category: Optional[str] = None,
-    db: Session = Depends(get_db)
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    names = parse_include(include, Culinary)
+    minute, ttl = parse_open_at(open_at, open_now)
+    def produce():
+        culinaries = crud.get_culinaries(db, skip=skip, limit=limit, search=search, include=names, fuzzy=fuzzy, open_at=minute)
+        if category:
+            culinaries = [c for c in culinaries if c.category == category]
+        return culinaries
+    return cache.cached_json(request, ["culinary"], List[schemas.Culinary], produce, ttl=ttl, exclude=omitted(Culinary, names, many=True))
+
+@app.get("/culinaries/batch", response_model=schemas.BatchFetchResult[schemas.Culinary], tags=["Culinaries"])
+def read_culinaries_batch(
+    request: Request,
+    ids: str = Query(..., description="Comma-separated ids"),
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
 ):
-    culinaries = crud.get_culinaries(db, skip=skip, limit=limit, search=search)
-    if category:
-        culinaries = [c for c in culinaries if c.category == category]
-    return culinaries
+    return batch_fetch(request, db, Culinary, "culinary", schemas.Culinary, parse_ids(ids), include)
+
+@app.post("/culinaries/batch", response_model=schemas.BatchFetchResult[schemas.Culinary], tags=["Culinaries"])
+def read_culinaries_batch_from_body(
+    request: Request,
+    batch: schemas.BatchFetch,
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    return batch_fetch(request, db, Culinary, "culinary", schemas.Culinary, batch.ids, include, from_body=True)
 
 @app.get("/culinaries/{culinary_id}", response_model=schemas.Culinary, tags=["Culinaries"])
-def read_culinary(culinary_id: str, db: Session = Depends(get_db)):
-    db_culinary = crud.get_culinary(db, culinary_id=culinary_id)
-    if db_culinary is None:
-        raise HTTPException(status_code=404, detail="Culinary not found")
-    return db_culinary
+def read_culinary(request: Request, culinary_id: str, include: Optional[str] = None, db: Session = Depends(get_read_db)):
+    names = parse_include(include, Culinary)
+    def produce():
+        db_culinary = crud.get_culinary(db, culinary_id=culinary_id, include=names)
+        if db_culinary is None:
+            raise HTTPException(status_code=404, detail="Culinary not found")
+        return db_culinary
+    return cache.cached_json(request, ["culinary"], schemas.Culinary, produce, exclude=omitted(Culinary, names))
 
 @app.put("/culinaries/{culinary_id}", response_model=schemas.Culinary, tags=["Culinaries"])
+@app.patch("/culinaries/{culinary_id}", response_model=schemas.Culinary, tags=["Culinaries"])
 def update_culinary(
     culinary_id: str, 
     culinary: schemas.CulinaryUpdate, 
@@ -185,30 +489,84 @@ def delete_culinary(culinary_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Culinary not found")
     return None
 
+@app.delete("/culinaries/", response_model=schemas.BatchDeleteResult, tags=["Culinaries"])
+def delete_culinaries(ids: str = Query(..., description="Comma-separated ids"), db: Session = Depends(get_db)):
+    requested = parse_ids(ids)
+    return batch_delete_result(requested, crud.delete_culinaries(db, requested))
+
 # --------------------------
 # REVIEW ENDPOINTS
 # --------------------------
 @app.post("/reviews/", response_model=schemas.Review, status_code=status.HTTP_201_CREATED, tags=["Reviews"])
-def create_review(review: schemas.ReviewCreate, db: Session = Depends(get_db)):
-    return crud.create_review(db=db, review=review)
+def create_review(review: schemas.ReviewCreate, response: Response, db: Session = Depends(get_db)):
+    if review_queue.writer is not None:
+        # Write-behind: acknowledged now, inserted with the next batch
+        try:
+            queued = review_queue.writer.submit(review, db)
+        except review_queue.DuplicateReview:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A review with this id already exists")
+        except review_queue.UnknownDestination:
+            raise HTTPException(status_code=422, detail="Destination not found")
+        except review_queue.QueueFull:
+            raise HTTPException(status_code=503, detail="Review queue is full", headers={"Retry-After": "1"})
+        response.status_code = status.HTTP_202_ACCEPTED
+        return queued
+    db_review = crud.create_review(db=db, review=review)
+    if db_review is None:
+        raise HTTPException(status_code=422, detail="Destination not found")
+    return db_review
 
 @app.get("/reviews/", response_model=List[schemas.Review], tags=["Reviews"])
 def read_reviews(
+    response: Response,
     skip: int = 0, 
     limit: int = 100,
     destination: Optional[str] = None,
-    db: Session = Depends(get_db)
+    destination_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_read_db)
 ):
-    return crud.get_reviews(db, skip=skip, limit=limit, destination=destination)
+    try:
+        reviews = crud.get_reviews(
+            db, skip=skip, limit=limit, destination=destination, destination_id=destination_id,
+            since=since, until=until, cursor=cursor
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Newest-first feed: pass X-Next-Cursor back as ?cursor= to fetch the next page
+    if reviews and len(reviews) == limit:
+        response.headers["X-Next-Cursor"] = crud.encode_review_cursor(reviews[-1])
+    return reviews
+
+@app.get("/reviews/batch", response_model=schemas.BatchFetchResult[schemas.Review], tags=["Reviews"])
+def read_reviews_batch(
+    request: Request,
+    ids: str = Query(..., description="Comma-separated ids"),
+    db: Session = Depends(get_read_db)
+):
+    return batch_fetch(request, db, Review, "review", schemas.Review, parse_ids(ids))
+
+@app.post("/reviews/batch", response_model=schemas.BatchFetchResult[schemas.Review], tags=["Reviews"])
+def read_reviews_batch_from_body(
+    request: Request,
+    batch: schemas.BatchFetch,
+    db: Session = Depends(get_read_db)
+):
+    return batch_fetch(request, db, Review, "review", schemas.Review, batch.ids, from_body=True)
 
 @app.get("/reviews/{review_id}", response_model=schemas.Review, tags=["Reviews"])
-def read_review(review_id: str, db: Session = Depends(get_db)):
-    db_review = crud.get_review(db, review_id=review_id)
-    if db_review is None:
-        raise HTTPException(status_code=404, detail="Review not found")
-    return db_review
+def read_review(request: Request, review_id: str, db: Session = Depends(get_read_db)):
+    def produce():
+        db_review = crud.get_review(db, review_id=review_id)
+        if db_review is None:
+            raise HTTPException(status_code=404, detail="Review not found")
+        return db_review
+    return cache.cached_json(request, ["review"], schemas.Review, produce)
 
 @app.put("/reviews/{review_id}", response_model=schemas.Review, tags=["Reviews"])
+@app.patch("/reviews/{review_id}", response_model=schemas.Review, tags=["Reviews"])
 def update_review(
     review_id: str, 
     review: schemas.ReviewUpdate, 
@@ -226,6 +584,11 @@ def delete_review(review_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Review not found")
     return None
 
+@app.delete("/reviews/", response_model=schemas.BatchDeleteResult, tags=["Reviews"])
+def delete_reviews(ids: str = Query(..., description="Comma-separated ids"), db: Session = Depends(get_db)):
+    requested = parse_ids(ids)
+    return batch_delete_result(requested, crud.delete_reviews(db, requested))
+
 # --------------------------
 # PHOTO SPOT ENDPOINTS
 # --------------------------
@@ -235,25 +598,56 @@ def create_photo_spot(photo_spot: schemas.PhotoSpotCreate, db: Session = Depends
 
 @app.get("/photo-spots/", response_model=List[schemas.PhotoSpot], tags=["Photo Spots"])
 def read_photo_spots(
+    request: Request,
     skip: int = 0, 
     limit: int = 100,
     search: Optional[str] = None,
+    fuzzy: bool = Query(False, description="Typo-tolerant search using the trigram index"),
+    open_at: Optional[str] = Query(None, description="Only spots whose best time includes this local time (HH:MM, WIB)"),
+    open_now: bool = Query(False, description="Only spots whose best time is now"),
     category: Optional[str] = None,
-    db: Session = Depends(get_db)
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    names = parse_include(include, PhotoSpot)
+    minute, ttl = parse_open_at(open_at, open_now)
+    def produce():
+        photo_spots = crud.get_photo_spots(db, skip=skip, limit=limit, search=search, include=names, fuzzy=fuzzy, open_at=minute)
+        if category:
+            photo_spots = [p for p in photo_spots if p.category == category]
+        return photo_spots
+    return cache.cached_json(request, ["photo_spot"], List[schemas.PhotoSpot], produce, ttl=ttl, exclude=omitted(PhotoSpot, names, many=True))
+
+@app.get("/photo-spots/batch", response_model=schemas.BatchFetchResult[schemas.PhotoSpot], tags=["Photo Spots"])
+def read_photo_spots_batch(
+    request: Request,
+    ids: str = Query(..., description="Comma-separated ids"),
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
 ):
-    photo_spots = crud.get_photo_spots(db, skip=skip, limit=limit, search=search)
-    if category:
-        photo_spots = [p for p in photo_spots if p.category == category]
-    return photo_spots
+    return batch_fetch(request, db, PhotoSpot, "photo_spot", schemas.PhotoSpot, parse_ids(ids), include)
+
+@app.post("/photo-spots/batch", response_model=schemas.BatchFetchResult[schemas.PhotoSpot], tags=["Photo Spots"])
+def read_photo_spots_batch_from_body(
+    request: Request,
+    batch: schemas.BatchFetch,
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    return batch_fetch(request, db, PhotoSpot, "photo_spot", schemas.PhotoSpot, batch.ids, include, from_body=True)
 
 @app.get("/photo-spots/{photo_spot_id}", response_model=schemas.PhotoSpot, tags=["Photo Spots"])
-def read_photo_spot(photo_spot_id: str, db: Session = Depends(get_db)):
-    db_photo_spot = crud.get_photo_spot(db, photo_spot_id=photo_spot_id)
-    if db_photo_spot is None:
-        raise HTTPException(status_code=404, detail="Photo spot not found")
-    return db_photo_spot
+def read_photo_spot(request: Request, photo_spot_id: str, include: Optional[str] = None, db: Session = Depends(get_read_db)):
+    names = parse_include(include, PhotoSpot)
+    def produce():
+        db_photo_spot = crud.get_photo_spot(db, photo_spot_id=photo_spot_id, include=names)
+        if db_photo_spot is None:
+            raise HTTPException(status_code=404, detail="Photo spot not found")
+        return db_photo_spot
+    return cache.cached_json(request, ["photo_spot"], schemas.PhotoSpot, produce, exclude=omitted(PhotoSpot, names))
 
 @app.put("/photo-spots/{photo_spot_id}", response_model=schemas.PhotoSpot, tags=["Photo Spots"])
+@app.patch("/photo-spots/{photo_spot_id}", response_model=schemas.PhotoSpot, tags=["Photo Spots"])
 def update_photo_spot(
     photo_spot_id: str, 
     photo_spot: schemas.PhotoSpotUpdate, 
@@ -271,6 +665,11 @@ def delete_photo_spot(photo_spot_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Photo spot not found")
     return None
 
+@app.delete("/photo-spots/", response_model=schemas.BatchDeleteResult, tags=["Photo Spots"])
+def delete_photo_spots(ids: str = Query(..., description="Comma-separated ids"), db: Session = Depends(get_db)):
+    requested = parse_ids(ids)
+    return batch_delete_result(requested, crud.delete_photo_spots(db, requested))
+
 # --------------------------
 # TRANSPORT ROUTE ENDPOINTS
 # --------------------------
@@ -280,25 +679,78 @@ def create_transport_route(route: schemas.TransportRouteCreate, db: Session = De
 
 @app.get("/transport-routes/", response_model=List[schemas.TransportRoute], tags=["Transport Routes"])
 def read_transport_routes(
+    request: Request,
     skip: int = 0, 
     limit: int = 100,
     search: Optional[str] = None,
+    fuzzy: bool = Query(False, description="Typo-tolerant search using the trigram index"),
     difficulty: Optional[str] = None,
-    db: Session = Depends(get_db)
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    names = parse_include(include, TransportRoute)
+    def produce():
+        routes = crud.get_transport_routes(db, skip=skip, limit=limit, search=search, include=names, fuzzy=fuzzy)
+        if difficulty:
+            routes = [r for r in routes if r.difficulty == difficulty]
+        return routes
+    return cache.cached_json(request, ["transport_route"], List[schemas.TransportRoute], produce, exclude=omitted(TransportRoute, names, many=True))
+
+@app.get("/transport-routes/plan", response_model=schemas.ItineraryPlan, tags=["Transport Routes"])
+def plan_itinerary(
+    origin: str = Query(..., alias="from"),
+    destination: str = Query(..., alias="to"),
+    optimize: str = "time"
 ):
-    routes = crud.get_transport_routes(db, skip=skip, limit=limit, search=search)
-    if difficulty:
-        routes = [r for r in routes if r.difficulty == difficulty]
-    return routes
+    # Shortest chain of routes from the in-memory route graph; no database access
+    if optimize not in itinerary.OPTIMIZE:
+        raise HTTPException(status_code=400, detail=f"optimize must be one of: {', '.join(itinerary.OPTIMIZE)}")
+    start, end = itinerary.graph.place(origin), itinerary.graph.place(destination)
+    if start is None or end is None:
+        raise HTTPException(status_code=404, detail=f"Unknown place: {origin if start is None else destination}")
+    legs = itinerary.graph.plan(start, end, optimize)
+    if legs is None:
+        raise HTTPException(status_code=404, detail="No route connects these places")
+    total_minutes, total_cost = itinerary.totals(legs)
+    return {
+        "origin": itinerary.graph.display_name(start),
+        "destination": itinerary.graph.display_name(end),
+        "optimize": optimize,
+        "total_minutes": total_minutes,
+        "total_cost": total_cost,
+        "legs": [leg._asdict() for leg in legs],
+    }
+
+@app.get("/transport-routes/batch", response_model=schemas.BatchFetchResult[schemas.TransportRoute], tags=["Transport Routes"])
+def read_transport_routes_batch(
+    request: Request,
+    ids: str = Query(..., description="Comma-separated ids"),
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    return batch_fetch(request, db, TransportRoute, "transport_route", schemas.TransportRoute, parse_ids(ids), include)
+
+@app.post("/transport-routes/batch", response_model=schemas.BatchFetchResult[schemas.TransportRoute], tags=["Transport Routes"])
+def read_transport_routes_batch_from_body(
+    request: Request,
+    batch: schemas.BatchFetch,
+    include: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    return batch_fetch(request, db, TransportRoute, "transport_route", schemas.TransportRoute, batch.ids, include, from_body=True)
 
 @app.get("/transport-routes/{route_id}", response_model=schemas.TransportRoute, tags=["Transport Routes"])
-def read_transport_route(route_id: str, db: Session = Depends(get_db)):
-    db_route = crud.get_transport_route(db, route_id=route_id)
-    if db_route is None:
-        raise HTTPException(status_code=404, detail="Transport route not found")
-    return db_route
+def read_transport_route(request: Request, route_id: str, include: Optional[str] = None, db: Session = Depends(get_read_db)):
+    names = parse_include(include, TransportRoute)
+    def produce():
+        db_route = crud.get_transport_route(db, route_id=route_id, include=names)
+        if db_route is None:
+            raise HTTPException(status_code=404, detail="Transport route not found")
+        return db_route
+    return cache.cached_json(request, ["transport_route"], schemas.TransportRoute, produce, exclude=omitted(TransportRoute, names))
 
 @app.put("/transport-routes/{route_id}", response_model=schemas.TransportRoute, tags=["Transport Routes"])
+@app.patch("/transport-routes/{route_id}", response_model=schemas.TransportRoute, tags=["Transport Routes"])
 def update_transport_route(
     route_id: str, 
     route: schemas.TransportRouteUpdate, 
@@ -316,16 +768,130 @@ def delete_transport_route(route_id: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Transport route not found")
     return None
 
+@app.delete("/transport-routes/", response_model=schemas.BatchDeleteResult, tags=["Transport Routes"])
+def delete_transport_routes(ids: str = Query(..., description="Comma-separated ids"), db: Session = Depends(get_db)):
+    requested = parse_ids(ids)
+    return batch_delete_result(requested, crud.delete_transport_routes(db, requested))
+
+# --------------------------
+# AUTOCOMPLETE ENDPOINTS
+# --------------------------
+@app.get("/autocomplete", response_model=List[schemas.Suggestion], tags=["Search"])
+def read_autocomplete(
+    q: str,
+    limit: int = Query(10, ge=1, le=50),
+    entity: Optional[str] = Query(None, description="Comma-separated entities to suggest, e.g. destination,facility")
+):
+    # Served from the in-memory prefix index; no database access
+    entities = parse_ids(entity) if entity else None
+    if entities:
+        unknown = [name for name in entities if name not in search_index.TITLE_MODELS and name not in search_index.NAME_MODELS]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown entity: {', '.join(unknown)}")
+    return search_index.autocomplete.lookup(q, limit, entities)
+
+# --------------------------
+# FACET ENDPOINTS
+# --------------------------
+@app.get("/facets", response_model=schemas.Facets, tags=["Search"])
+def read_facets(
+    request: Request,
+    entity: str,
+    q: Optional[str] = None,
+    category: Optional[str] = None,
+    db: Session = Depends(get_read_db)
+):
+    if entity not in crud.FACETS:
+        raise HTTPException(status_code=400, detail=f"entity must be one of: {', '.join(crud.FACETS)}")
+    def produce():
+        return crud.get_facets(db, entity, search=q, category=category)
+    return cache.cached_json(request, [entity], schemas.Facets, produce, ttl=FACETS_CACHE_TTL)
+
+# --------------------------
+# MAP ENDPOINTS
+# --------------------------
+@app.get("/map/clusters", response_model=List[schemas.MapCluster], tags=["Map"])
+def read_map_clusters(
+    bbox: str = Query(..., description="min_lng,min_lat,max_lng,max_lat"),
+    zoom: int = Query(..., ge=0)
+):
+    try:
+        min_lng, min_lat, max_lng, max_lat = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_lng,min_lat,max_lng,max_lat")
+    return map_index.index.clusters(min_lng, min_lat, max_lng, max_lat, zoom)
+
+# --------------------------
+# SYNC ENDPOINTS
+# --------------------------
+@app.get("/changes", response_model=schemas.ChangeFeed, tags=["Sync"])
+def read_changes(
+    since: Optional[str] = Query(None, description="token from the previous response; omit for a full sync"),
+    limit: int = Query(500, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    # Rows created or updated since the token, and ids deleted since it. Call again with
+    # the new token while more is true; an empty page keeps the same token.
+    try:
+        after = crud.decode_change_token(since) if since else 0
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid token")
+    last, more, updated, deleted = crud.get_changes(db, after, limit)
+    return {"token": crud.encode_change_token(last), "more": more, "updated": updated, "deleted": deleted}
+
+@app.get("/live", tags=["Sync"])
+async def read_live(
+    entity: Optional[str] = Query(None, description="Comma-separated entities to follow; all when omitted")
+):
+    # Server-Sent Events: one "create", "update" or "delete" event per write with the entity
+    # and id, and "resync" when the client fell too far behind and should call /changes
+    entities = parse_ids(entity) if entity else list(live.LIVE_ENTITIES)
+    unknown = [name for name in entities if name not in live.LIVE_ENTITIES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown entity: {', '.join(unknown)}")
+    stream = live.broadcaster.open(entities)
+    if stream is None:
+        raise HTTPException(status_code=503, detail="Too many live streams", headers={"Retry-After": "30"})
+    return StreamingResponse(
+        live.stream_events(stream),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --------------------------
+# IMAGE ENDPOINTS
+# --------------------------
+@app.get("/images/{key}/{variant}.webp", tags=["Images"])
+def read_image_variant(key: str, variant: str):
+    if variant not in images.VARIANTS:
+        raise HTTPException(status_code=404, detail="Unknown image variant")
+    path = images.pipeline.variant_path(key, variant)
+    if path is not None:
+        # Keys are derived from the original URL, which is not expected to change its content
+        return FileResponse(path, media_type="image/webp", headers={"Cache-Control": "public, max-age=604800"})
+    url = images.pipeline.lookup(key)
+    if url is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    # Not rendered yet: start on it and send the original meanwhile
+    images.pipeline.enqueue([url])
+    return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+
 # --------------------------
 # FACILITY & ACTIVITY ENDPOINTS (for admin)
 # --------------------------
 @app.get("/facilities/", response_model=List[schemas.FacilityBase], tags=["Admin"])
-def read_facilities(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(Facility).offset(skip).limit(limit).all()
+def read_facilities(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    def produce():
+        return db.query(Facility).offset(skip).limit(limit).all()
+    return cache.cached_json(request, ["destination", "accommodation"], List[schemas.FacilityBase], produce)
 
 @app.get("/activities/", response_model=List[schemas.ActivityBase], tags=["Admin"])
-def read_activities(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return db.query(Activity).offset(skip).limit(limit).all()
+def read_activities(request: Request, skip: int = 0, limit: int = 100, db: Session = Depends(get_read_db)):
+    def produce():
+        return db.query(Activity).offset(skip).limit(limit).all()
+    return cache.cached_json(request, ["destination"], List[schemas.ActivityBase], produce)
 
 if __name__ == "__main__":
+    # Only needed when run directly; uvicorn workers import this module without it
+    import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,201 @@
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+import events
+from models import Destination, Accommodation, Culinary, PhotoSpot
+
+# Entities that have a position on the map
+MAP_MODELS = {
+    "destination": Destination,
+    "accommodation": Accommodation,
+    "culinary": Culinary,
+    "photo_spot": PhotoSpot,
+}
+
+MIN_ZOOM = 0
+MAX_ZOOM = 18
+# Cluster cells are 64px on a 256px tile, i.e. 4x4 cells per tile
+CELLS_PER_TILE = 4
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = 111.32
+
+class _Cell:
+    __slots__ = ("items", "sum_lat", "sum_lng", "counts", "top")
+
+    def __init__(self):
+        self.items: Dict[Tuple[str, str], Tuple[float, float, str]] = {}
+        self.sum_lat = 0.0
+        self.sum_lng = 0.0
+        self.counts: Dict[str, int] = {}
+        self.top: Optional[Tuple[str, str]] = None
+
+    def add(self, key: Tuple[str, str], lat: float, lng: float, title: str):
+        self.items[key] = (lat, lng, title)
+        self.sum_lat += lat
+        self.sum_lng += lng
+        self.counts[key[0]] = self.counts.get(key[0], 0) + 1
+        self.top = None
+
+    def remove(self, key: Tuple[str, str]):
+        lat, lng, _ = self.items.pop(key)
+        self.sum_lat -= lat
+        self.sum_lng -= lng
+        self.counts[key[0]] -= 1
+        if not self.counts[key[0]]:
+            del self.counts[key[0]]
+        self.top = None
+
+    def centroid(self) -> Tuple[float, float]:
+        count = len(self.items)
+        return self.sum_lat / count, self.sum_lng / count
+
+    def top_item(self) -> Tuple[str, str]:
+        # The item closest to the centroid represents the cluster; cached until the cell changes
+        if self.top is None:
+            lat, lng = self.centroid()
+            self.top = min(
+                self.items,
+                key=lambda k: ((self.items[k][0] - lat) ** 2 + (self.items[k][1] - lng) ** 2, k),
+            )
+        return self.top
+
+def _cell_size(zoom: int) -> float:
+    return 360.0 / ((2 ** zoom) * CELLS_PER_TILE)
+
+def _cell_of(lat: float, lng: float, zoom: int) -> Tuple[int, int]:
+    size = _cell_size(zoom)
+    return int((lng + 180.0) // size), int((lat + 90.0) // size)
+
+class GridIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._levels: List[Dict[Tuple[int, int], _Cell]] = [{} for _ in range(MIN_ZOOM, MAX_ZOOM + 1)]
+        self._positions: Dict[Tuple[str, str], Tuple[float, float]] = {}
+
+    def clear(self):
+        with self._lock:
+            for level in self._levels:
+                level.clear()
+            self._positions.clear()
+
+    def upsert(self, entity: str, entity_id: str, lat: Optional[float], lng: Optional[float], title: str):
+        key = (entity, entity_id)
+        with self._lock:
+            self._remove(key)
+            if lat is None or lng is None:
+                return
+            self._positions[key] = (lat, lng)
+            for zoom, level in enumerate(self._levels, start=MIN_ZOOM):
+                cell_key = _cell_of(lat, lng, zoom)
+                cell = level.get(cell_key)
+                if cell is None:
+                    cell = level[cell_key] = _Cell()
+                cell.add(key, lat, lng, title)
+
+    def remove(self, entity: str, entity_id: str):
+        with self._lock:
+            self._remove((entity, entity_id))
+
+    def _remove(self, key: Tuple[str, str]):
+        position = self._positions.pop(key, None)
+        if position is None:
+            return
+        for zoom, level in enumerate(self._levels, start=MIN_ZOOM):
+            cell_key = _cell_of(position[0], position[1], zoom)
+            cell = level[cell_key]
+            cell.remove(key)
+            if not cell.items:
+                del level[cell_key]
+
+    def clusters(self, min_lng: float, min_lat: float, max_lng: float, max_lat: float, zoom: int) -> List[dict]:
+        zoom = max(MIN_ZOOM, min(MAX_ZOOM, zoom))
+        x0, y0 = _cell_of(min_lat, min_lng, zoom)
+        x1, y1 = _cell_of(max_lat, max_lng, zoom)
+        result = []
+        with self._lock:
+            level = self._levels[zoom - MIN_ZOOM]
+            # Walk whichever is smaller: the cells covered by the bbox or the occupied cells
+            if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(level):
+                cells = (
+                    ((x, y), level[(x, y)])
+                    for x in range(x0, x1 + 1)
+                    for y in range(y0, y1 + 1)
+                    if (x, y) in level
+                )
+            else:
+                cells = (
+                    (k, c) for k, c in level.items()
+                    if x0 <= k[0] <= x1 and y0 <= k[1] <= y1
+                )
+            for _, cell in cells:
+                lat, lng = cell.centroid()
+                top = cell.top_item()
+                result.append({
+                    "count": len(cell.items),
+                    "counts": dict(cell.counts),
+                    "latitude": lat,
+                    "longitude": lng,
+                    "top": {"entity": top[0], "id": top[1], "title": cell.items[top][2]},
+                })
+        return result
+
+    def position(self, entity: str, entity_id: str) -> Optional[Tuple[float, float]]:
+        with self._lock:
+            return self._positions.get((entity, entity_id))
+
+    def nearby(self, entity: str, lat: float, lng: float, radius_km: float, limit: int) -> List[Tuple[str, float]]:
+        # (id, distance_km) of the nearest items of one entity within radius_km, nearest first
+        span = max(radius_km / KM_PER_DEGREE, radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01)))
+        # The finest level whose cells are at least as wide as the radius, so the 3x3 block around the point covers it
+        zoom = MIN_ZOOM
+        while zoom < MAX_ZOOM and _cell_size(zoom + 1) >= span:
+            zoom += 1
+        x, y = _cell_of(lat, lng, zoom)
+        found = []
+        with self._lock:
+            level = self._levels[zoom - MIN_ZOOM]
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    cell = level.get((x + dx, y + dy))
+                    if cell is None:
+                        continue
+                    for (item_entity, item_id), (item_lat, item_lng, _) in cell.items.items():
+                        if item_entity == entity:
+                            distance = _distance_km(lat, lng, item_lat, item_lng)
+                            if distance <= radius_km:
+                                found.append((item_id, distance))
+        found.sort(key=lambda item: (item[1], item[0]))
+        return found[:limit]
+
+def _distance_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    # Haversine distance
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = math.sin((phi2 - phi1) / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+index = GridIndex()
+
+def build(db: Session):
+    index.clear()
+    for entity, model in MAP_MODELS.items():
+        rows = (
+            db.query(model.id, model.title, model.latitude, model.longitude)
+            .filter(model.latitude.isnot(None), model.longitude.isnot(None))
+            .all()
+        )
+        for row in rows:
+            index.upsert(entity, row.id, row.latitude, row.longitude, row.title)
+
+def _on_write(entity: str, action: str, entity_id: str, obj):
+    if action == "delete":
+        index.remove(entity, entity_id)
+    else:
+        index.upsert(entity, entity_id, obj.latitude, obj.longitude, obj.title)
+
+for _entity in MAP_MODELS:
+    events.subscribe(_entity, _on_write)
+    events.subscribe_remote(_entity, _on_write)
+events.subscribe_resync(build)
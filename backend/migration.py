@@ -1,16 +1,22 @@
 # migration.py
+from datetime import datetime
 from sqlalchemy.orm import Session
 from models import (
     Base, Destination, DestinationTip, DestinationGallery, Facility, destination_facility,
     Activity, destination_activity, PhotoSpot, PhotoSpotTip, PhotoSpotGallery, 
     PhotoSpotNearbyAttraction, Review, TransportRoute, RouteStep, RouteTip,
     Accommodation, Room, AccommodationGallery, accommodation_facility,
-    Culinary, CulinarySpecialty, CulinaryGallery,
+    Culinary, CulinarySpecialty, CulinaryGallery, HOURS_COLUMNS,
 )
 from database import engine
+from parsers import parse_review_date, parse_duration_minutes, parse_rupiah, parse_capacity, parse_hours
+import schema_migrations
 
-# Create all tables
-Base.metadata.create_all(bind=engine)
+def hours_columns(model, value: str) -> dict:
+    # The parsed from/until columns for a row's hours text, as crud sets them
+    _, start, end = HOURS_COLUMNS[model]
+    opens, closes = parse_hours(value) or (None, None)
+    return {start: opens, end: closes}
 
 def migrate_destinations(db: Session, destinations_data):
     for dest_data in destinations_data:
@@ -44,7 +50,8 @@ def migrate_destinations(db: Session, destinations_data):
             category=dest_data['category'],
             price=dest_data['price'],
             location=dest_data['location'],
-            open_hours=dest_data['openHours']
+            open_hours=dest_data['openHours'],
+            **hours_columns(Destination, dest_data['openHours'])
         )
         
         # Add facilities and activities
@@ -75,7 +82,8 @@ def migrate_photo_spots(db: Session, photo_spots_data):
             image_url=spot_data['imageUrl'],
             category=spot_data['category'],
             location=spot_data['location'],
-            best_time=spot_data['bestTime']
+            best_time=spot_data['bestTime'],
+            **hours_columns(PhotoSpot, spot_data['bestTime'])
         )
         
         # Add tips
@@ -106,6 +114,7 @@ def migrate_reviews(db: Session, reviews_data):
             date=review_data['date'],
             rating=review_data['rating'],
             text=review_data['text'],
+            reviewed_at=parse_review_date(review_data['date']) or datetime.utcnow(),
             destination=review_data['destination']
         )
         db.add(review)
@@ -131,7 +140,9 @@ def migrate_transport_routes(db: Session, transport_routes_data):
                 description=step_data['description'],
                 duration=step_data['duration'],
                 cost=step_data['cost'],
-                vehicle=step_data['vehicle']
+                vehicle=step_data['vehicle'],
+                duration_minutes=parse_duration_minutes(step_data['duration']),
+                cost_rupiah=parse_rupiah(step_data['cost'])
             )
             transport_route.steps.append(step)
         
@@ -179,7 +190,9 @@ def migrate_accommodations(db: Session, accommodations_data):
                 type=room_data['type'],
                 price=room_data['price'],
                 capacity=room_data['capacity'],
-                description=room_data['description']
+                description=room_data['description'],
+                price_rupiah=parse_rupiah(room_data['price']),
+                guests=parse_capacity(room_data['capacity'])
             )
             accommodation.rooms.append(room)
         
@@ -204,7 +217,8 @@ def migrate_culinaries(db: Session, culinaries_data):
             price=cul_data['price'],
             location=cul_data['location'],
             open_hours=cul_data['openHours'],
-            contact=cul_data.get('contact')
+            contact=cul_data.get('contact'),
+            **hours_columns(Culinary, cul_data['openHours'])
         )
         
         # Add specialties
@@ -491,7 +505,8 @@ def main():
         # Add other culinaries similarly...
     ]
 
-    # Connect to database and run migrations
+    # Bring the schema up to date, then connect to database and run migrations
+    schema_migrations.upgrade(engine)
     db = Session(bind=engine)
     
     try:
@@ -499,9 +514,11 @@ def main():
         migrate_destinations(db, destinations_data)
         migrate_photo_spots(db, photo_spots_data)
         migrate_reviews(db, reviews_data)
+        schema_migrations.backfill_review_destination_ids(db)
         migrate_transport_routes(db, transport_routes_data)
         migrate_accommodations(db, accommodations_data)
         migrate_culinaries(db, culinaries_data)
+        schema_migrations.seed_change_log(db)
         
         print("Migration completed successfully!")
     except Exception as e:
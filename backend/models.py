@@ -1,6 +1,7 @@
-from sqlalchemy import Column, Integer, String, Table, Text, Float, DateTime, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, Table, Text, Float, DateTime, ForeignKey, JSON, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from datetime import datetime
 from database import Base
 
 # Define common string lengths for consistency
@@ -16,26 +17,32 @@ CONTACT_LENGTH = 20
 NAME_LENGTH = 255
 TIP_LENGTH = 500
 
-# Association tables (unchanged)
+# Association tables
 accommodation_facility = Table(
     'accommodation_facility',
     Base.metadata,
-    Column('accommodation_id', String(50), ForeignKey('accommodations.id')),
-    Column('facility_id', Integer, ForeignKey('facilities.id'))
+    Column('accommodation_id', String(50), ForeignKey('accommodations.id', ondelete='CASCADE')),
+    Column('facility_id', Integer, ForeignKey('facilities.id', ondelete='CASCADE')),
+    # Covers facet counts joined from the filtered accommodation rows
+    Index('ix_accommodation_facility_accommodation_id_facility_id', 'accommodation_id', 'facility_id')
 )
 
 destination_facility = Table(
     'destination_facility',
     Base.metadata,
-    Column('destination_id', String(50), ForeignKey('destinations.id')),
-    Column('facility_id', Integer, ForeignKey('facilities.id'))
+    Column('destination_id', String(50), ForeignKey('destinations.id', ondelete='CASCADE')),
+    Column('facility_id', Integer, ForeignKey('facilities.id', ondelete='CASCADE')),
+    # Covers facet counts joined from the filtered destination rows
+    Index('ix_destination_facility_destination_id_facility_id', 'destination_id', 'facility_id')
 )
 
 destination_activity = Table(
     'destination_activity',
     Base.metadata,
-    Column('destination_id', String(50), ForeignKey('destinations.id')),
-    Column('activity_id', Integer, ForeignKey('activities.id'))
+    Column('destination_id', String(50), ForeignKey('destinations.id', ondelete='CASCADE')),
+    Column('activity_id', Integer, ForeignKey('activities.id', ondelete='CASCADE')),
+    # Covers facet counts joined from the filtered destination rows
+    Index('ix_destination_activity_destination_id_activity_id', 'destination_id', 'activity_id')
 )
 
 class Facility(Base):
@@ -44,8 +51,8 @@ class Facility(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(NAME_LENGTH), nullable=False)
     
-    accommodations = relationship("Accommodation", secondary=accommodation_facility, back_populates="facilities")
-    destinations = relationship("Destination", secondary=destination_facility, back_populates="facilities")
+    accommodations = relationship("Accommodation", secondary=accommodation_facility, back_populates="facilities", passive_deletes=True)
+    destinations = relationship("Destination", secondary=destination_facility, back_populates="facilities", passive_deletes=True)
 
 class Activity(Base):
     __tablename__ = 'activities'
@@ -53,25 +60,34 @@ class Activity(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(NAME_LENGTH), nullable=False)
     
-    destinations = relationship("Destination", secondary=destination_activity, back_populates="activities")
+    destinations = relationship("Destination", secondary=destination_activity, back_populates="activities", passive_deletes=True)
 
 class Room(Base):
     __tablename__ = 'rooms'
     
     id = Column(Integer, primary_key=True, autoincrement=True)
-    accommodation_id = Column(String(50), ForeignKey('accommodations.id'))
+    accommodation_id = Column(String(50), ForeignKey('accommodations.id', ondelete='CASCADE'))
     type = Column(String(TITLE_LENGTH), nullable=False)
     price = Column(String(PRICE_LENGTH), nullable=False)
     capacity = Column(String(20), nullable=False)
     description = Column(String(DESCRIPTION_LENGTH), nullable=False)
+    # Parsed from price and capacity by crud; NULL when the text has no number
+    price_rupiah = Column(Integer, nullable=True)
+    guests = Column(Integer, nullable=True)
     
     accommodation = relationship("Accommodation", back_populates="rooms")
 
+    __table_args__ = (
+        # Serves /rooms/search as a price range scan in price order; guests is checked
+        # from the index entry, so the scan stops once a page of rooms has matched
+        Index('ix_rooms_price_rupiah_guests', 'price_rupiah', 'guests'),
+    )
+
 class AccommodationGallery(Base):
     __tablename__ = 'accommodation_galleries'
     
     id = Column(Integer, primary_key=True)
-    accommodation_id = Column(String(50), ForeignKey('accommodations.id'))
+    accommodation_id = Column(String(50), ForeignKey('accommodations.id', ondelete='CASCADE'))
     image_url = Column(String(URL_LENGTH), nullable=False)
     
     accommodation = relationship("Accommodation", back_populates="gallery")
@@ -84,21 +100,26 @@ class Accommodation(Base):
     description = Column(String(DESCRIPTION_LENGTH), nullable=False)
     full_description = Column(String(LONG_DESCRIPTION_LENGTH), nullable=False)
     image_url = Column(String(URL_LENGTH), nullable=False)
-    category = Column(String(CATEGORY_LENGTH), nullable=False)
+    # Indexed for category filters and facet counts
+    category = Column(String(CATEGORY_LENGTH), nullable=False, index=True)
     price = Column(String(PRICE_LENGTH), nullable=False)
     location = Column(String(LOCATION_LENGTH), nullable=False)
     contact = Column(String(CONTACT_LENGTH), nullable=False)
     website = Column(String(URL_LENGTH))
-    
-    facilities = relationship("Facility", secondary=accommodation_facility, back_populates="accommodations")
-    rooms = relationship("Room", back_populates="accommodation")
-    gallery = relationship("AccommodationGallery", back_populates="accommodation")
+    latitude = Column(Float)
+    longitude = Column(Float)
+    # Set by crud on every write to the row or its children
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+    
+    facilities = relationship("Facility", secondary=accommodation_facility, back_populates="accommodations", passive_deletes=True)
+    rooms = relationship("Room", back_populates="accommodation", cascade="all, delete-orphan", passive_deletes=True)
+    gallery = relationship("AccommodationGallery", back_populates="accommodation", cascade="all, delete-orphan", passive_deletes=True)
 
 class CulinarySpecialty(Base):
     __tablename__ = 'culinary_specialties'
     
     id = Column(Integer, primary_key=True)
-    culinary_id = Column(String(50), ForeignKey('culinaries.id'))
+    culinary_id = Column(String(50), ForeignKey('culinaries.id', ondelete='CASCADE'))
     name = Column(String(NAME_LENGTH), nullable=False)
     
     culinary = relationship("Culinary", back_populates="specialties")
@@ -107,7 +128,7 @@ class CulinaryGallery(Base):
     __tablename__ = 'culinary_galleries'
     
     id = Column(Integer, primary_key=True)
-    culinary_id = Column(String(50), ForeignKey('culinaries.id'))
+    culinary_id = Column(String(50), ForeignKey('culinaries.id', ondelete='CASCADE'))
     image_url = Column(String(URL_LENGTH), nullable=False)
     
     culinary = relationship("Culinary", back_populates="gallery")
@@ -120,20 +141,33 @@ class Culinary(Base):
     description = Column(String(DESCRIPTION_LENGTH), nullable=False)
     full_description = Column(String(LONG_DESCRIPTION_LENGTH), nullable=False)
     image_url = Column(String(URL_LENGTH), nullable=False)
-    category = Column(String(CATEGORY_LENGTH), nullable=False)
+    # Indexed for category filters and facet counts
+    category = Column(String(CATEGORY_LENGTH), nullable=False, index=True)
     price = Column(String(PRICE_LENGTH), nullable=False)
     location = Column(String(LOCATION_LENGTH), nullable=False)
     open_hours = Column(String(TIME_LENGTH), nullable=False)
+    # Parsed from open_hours by crud as minutes after midnight; closes_at < opens_at runs past midnight
+    opens_at = Column(Integer, nullable=True)
+    closes_at = Column(Integer, nullable=True)
     contact = Column(String(CONTACT_LENGTH))
+    latitude = Column(Float)
+    longitude = Column(Float)
+    # Set by crud on every write to the row or its children
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
     
-    specialties = relationship("CulinarySpecialty", back_populates="culinary")
-    gallery = relationship("CulinaryGallery", back_populates="culinary")
+    specialties = relationship("CulinarySpecialty", back_populates="culinary", cascade="all, delete-orphan", passive_deletes=True)
+    gallery = relationship("CulinaryGallery", back_populates="culinary", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        # Serves the open_at/open_now filters as a range predicate on opens_at
+        Index('ix_culinaries_opens_at_closes_at', 'opens_at', 'closes_at'),
+    )
 
 class DestinationTip(Base):
     __tablename__ = 'destination_tips'
     
     id = Column(Integer, primary_key=True)
-    destination_id = Column(String(50), ForeignKey('destinations.id'))
+    destination_id = Column(String(50), ForeignKey('destinations.id', ondelete='CASCADE'))
     tip = Column(String(TIP_LENGTH), nullable=False)
     
     destination = relationship("Destination", back_populates="tips")
@@ -142,7 +176,7 @@ class DestinationGallery(Base):
     __tablename__ = 'destination_galleries'
     
     id = Column(Integer, primary_key=True)
-    destination_id = Column(String(50), ForeignKey('destinations.id'))
+    destination_id = Column(String(50), ForeignKey('destinations.id', ondelete='CASCADE'))
     image_url = Column(String(URL_LENGTH), nullable=False)
     
     destination = relationship("Destination", back_populates="gallery")
@@ -155,21 +189,35 @@ class Destination(Base):
     description = Column(String(DESCRIPTION_LENGTH), nullable=False)
     full_description = Column(String(LONG_DESCRIPTION_LENGTH), nullable=False)
     image_url = Column(String(URL_LENGTH), nullable=False)
-    category = Column(String(CATEGORY_LENGTH), nullable=False)
+    # Indexed for category filters and facet counts
+    category = Column(String(CATEGORY_LENGTH), nullable=False, index=True)
     price = Column(String(PRICE_LENGTH), nullable=False)
     location = Column(String(LOCATION_LENGTH), nullable=False)
     open_hours = Column(String(TIME_LENGTH), nullable=False)
-    
-    facilities = relationship("Facility", secondary=destination_facility, back_populates="destinations")
-    activities = relationship("Activity", secondary=destination_activity, back_populates="destinations")
-    tips = relationship("DestinationTip", back_populates="destination")
-    gallery = relationship("DestinationGallery", back_populates="destination")
+    # Parsed from open_hours by crud as minutes after midnight; closes_at < opens_at runs past midnight
+    opens_at = Column(Integer, nullable=True)
+    closes_at = Column(Integer, nullable=True)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    # Set by crud on every write to the row or its children
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+    
+    facilities = relationship("Facility", secondary=destination_facility, back_populates="destinations", passive_deletes=True)
+    activities = relationship("Activity", secondary=destination_activity, back_populates="destinations", passive_deletes=True)
+    tips = relationship("DestinationTip", back_populates="destination", cascade="all, delete-orphan", passive_deletes=True)
+    gallery = relationship("DestinationGallery", back_populates="destination", cascade="all, delete-orphan", passive_deletes=True)
+    reviews = relationship("Review", back_populates="destination_ref", passive_deletes=True)
+
+    __table_args__ = (
+        # Serves the open_at/open_now filters as a range predicate on opens_at
+        Index('ix_destinations_opens_at_closes_at', 'opens_at', 'closes_at'),
+    )
 
 class PhotoSpotTip(Base):
     __tablename__ = 'photo_spot_tips'
     
     id = Column(Integer, primary_key=True)
-    photo_spot_id = Column(String(50), ForeignKey('photo_spots.id'))
+    photo_spot_id = Column(String(50), ForeignKey('photo_spots.id', ondelete='CASCADE'))
     tip = Column(String(TIP_LENGTH), nullable=False)
     
     photo_spot = relationship("PhotoSpot", back_populates="tips")
@@ -178,7 +226,7 @@ class PhotoSpotGallery(Base):
     __tablename__ = 'photo_spot_galleries'
     
     id = Column(Integer, primary_key=True)
-    photo_spot_id = Column(String(50), ForeignKey('photo_spots.id'))
+    photo_spot_id = Column(String(50), ForeignKey('photo_spots.id', ondelete='CASCADE'))
     image_url = Column(String(URL_LENGTH), nullable=False)
     
     photo_spot = relationship("PhotoSpot", back_populates="gallery")
@@ -187,7 +235,7 @@ class PhotoSpotNearbyAttraction(Base):
     __tablename__ = 'photo_spot_nearby_attractions'
     
     id = Column(Integer, primary_key=True)
-    photo_spot_id = Column(String(50), ForeignKey('photo_spots.id'))
+    photo_spot_id = Column(String(50), ForeignKey('photo_spots.id', ondelete='CASCADE'))
     name = Column(String(NAME_LENGTH), nullable=False)
     
     photo_spot = relationship("PhotoSpot", back_populates="nearby_attractions")
@@ -200,13 +248,26 @@ class PhotoSpot(Base):
     description = Column(String(DESCRIPTION_LENGTH), nullable=False)
     full_description = Column(String(LONG_DESCRIPTION_LENGTH), nullable=False)
     image_url = Column(String(URL_LENGTH), nullable=False)
-    category = Column(String(CATEGORY_LENGTH), nullable=False)
+    # Indexed for category filters and facet counts
+    category = Column(String(CATEGORY_LENGTH), nullable=False, index=True)
     location = Column(String(LOCATION_LENGTH), nullable=False)
     best_time = Column(String(TIME_LENGTH), nullable=False)
-    
-    tips = relationship("PhotoSpotTip", back_populates="photo_spot")
-    gallery = relationship("PhotoSpotGallery", back_populates="photo_spot")
-    nearby_attractions = relationship("PhotoSpotNearbyAttraction", back_populates="photo_spot")
+    # Parsed from best_time by crud, like the opening hours of destinations
+    best_from = Column(Integer, nullable=True)
+    best_until = Column(Integer, nullable=True)
+    latitude = Column(Float)
+    longitude = Column(Float)
+    # Set by crud on every write to the row or its children
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+    
+    tips = relationship("PhotoSpotTip", back_populates="photo_spot", cascade="all, delete-orphan", passive_deletes=True)
+    gallery = relationship("PhotoSpotGallery", back_populates="photo_spot", cascade="all, delete-orphan", passive_deletes=True)
+    nearby_attractions = relationship("PhotoSpotNearbyAttraction", back_populates="photo_spot", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        # Serves the open_at/open_now filters as a range predicate on best_from
+        Index('ix_photo_spots_best_from_best_until', 'best_from', 'best_until'),
+    )
 
 class Review(Base):
     __tablename__ = 'reviews'
@@ -218,17 +279,35 @@ class Review(Base):
     rating = Column(Integer, nullable=False)
     text = Column(String(LONG_DESCRIPTION_LENGTH), nullable=False)
     destination = Column(String(TITLE_LENGTH), nullable=False)
+    destination_id = Column(String(50), ForeignKey('destinations.id', ondelete='SET NULL'))
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
+    # Parsed from the free-text date; falls back to the submission time when unparseable
+    reviewed_at = Column(DateTime, nullable=False)
+    # Set by crud on every write to the row
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+    
+    destination_ref = relationship("Destination", back_populates="reviews")
+    
+    __table_args__ = (
+        # Serves per-destination review lists newest-first as an index range scan
+        Index('ix_reviews_destination_id_reviewed_at_id', 'destination_id', 'reviewed_at', 'id'),
+        # Serves the newest-first review feed and its keyset pagination
+        Index('ix_reviews_reviewed_at_id', 'reviewed_at', 'id'),
+    )
 
 class RouteStep(Base):
     __tablename__ = 'route_steps'
     
     id = Column(Integer, primary_key=True)
-    route_id = Column(String(50), ForeignKey('transport_routes.id'))
+    route_id = Column(String(50), ForeignKey('transport_routes.id', ondelete='CASCADE'))
     step = Column(Integer, nullable=False)
     description = Column(String(DESCRIPTION_LENGTH), nullable=False)
     duration = Column(String(20), nullable=False)
     cost = Column(String(PRICE_LENGTH), nullable=False)
     vehicle = Column(String(50), nullable=False)
+    # Parsed from duration and cost by crud; NULL when the text has no number
+    duration_minutes = Column(Integer, nullable=True)
+    cost_rupiah = Column(Integer, nullable=True)
     
     transport_route = relationship("TransportRoute", back_populates="steps")
 
@@ -236,7 +315,7 @@ class RouteTip(Base):
     __tablename__ = 'route_tips'
     
     id = Column(Integer, primary_key=True)
-    route_id = Column(String(50), ForeignKey('transport_routes.id'))
+    route_id = Column(String(50), ForeignKey('transport_routes.id', ondelete='CASCADE'))
     tip = Column(String(TIP_LENGTH), nullable=False)
     
     transport_route = relationship("TransportRoute", back_populates="tips")
@@ -251,6 +330,41 @@ class TransportRoute(Base):
     estimated_time = Column(String(TIME_LENGTH), nullable=False)
     difficulty = Column(String(20), nullable=False)
     image_url = Column(String(URL_LENGTH), nullable=False)
+    # Set by crud on every write to the row or its children
+    updated_at = Column(DateTime, nullable=False, default=datetime.utcnow, server_default=func.now())
+    
+    steps = relationship("RouteStep", back_populates="transport_route", cascade="all, delete-orphan", passive_deletes=True)
+    tips = relationship("RouteTip", back_populates="transport_route", cascade="all, delete-orphan", passive_deletes=True)
+
+class ChangeLog(Base):
+    __tablename__ = 'change_log'
     
-    steps = relationship("RouteStep", back_populates="transport_route")
-    tips = relationship("RouteTip", back_populates="transport_route")
\ No newline at end of file
+    # Append-only record of writes to the root entities, read by /changes in id order.
+    # A delete's row stays behind as the tombstone of the removed entity.
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    entity = Column(String(30), nullable=False)
+    entity_id = Column(String(50), nullable=False)
+    action = Column(String(10), nullable=False)
+    changed_at = Column(DateTime, nullable=False)
+    
+    __table_args__ = (
+        # Lets the change log be seeded only for rows it has not seen
+        Index('ix_change_log_entity_entity_id', 'entity', 'entity_id'),
+    )
+
+# Entity names used in events and the change log, for the models whose writes are logged
+ROOT_MODELS = {
+    "destination": Destination,
+    "accommodation": Accommodation,
+    "culinary": Culinary,
+    "review": Review,
+    "photo_spot": PhotoSpot,
+    "transport_route": TransportRoute,
+}
+
+# Free-text hours and the parsed (from, until) minute-of-day columns kept beside them
+HOURS_COLUMNS = {
+    Destination: ("open_hours", "opens_at", "closes_at"),
+    Culinary: ("open_hours", "opens_at", "closes_at"),
+    PhotoSpot: ("best_time", "best_from", "best_until"),
+}
\ No newline at end of file
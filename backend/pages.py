@@ -0,0 +1,72 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from dotenv import load_dotenv
+import cache
+import crud
+import map_index
+import schemas
+from database import open_read_session
+from models import Accommodation, Culinary, PhotoSpot
+
+load_dotenv()
+
+# Sub-queries of all bundles share these threads; each holds one connection while it runs
+PAGE_WORKERS = int(os.getenv("PAGE_WORKERS", "4"))
+NEARBY_RADIUS_KM = float(os.getenv("NEARBY_RADIUS_KM", "10"))
+
+# A write to any of these entities can change a destination page
+PAGE_TAGS = ("destination", "review", "accommodation", "culinary", "photo_spot")
+
+# Bundle field, map entity, model and response schema of the places listed near a destination
+NEARBY = (
+    ("nearby_accommodations", "accommodation", Accommodation, schemas.Accommodation),
+    ("nearby_culinaries", "culinary", Culinary, schemas.Culinary),
+    ("nearby_photo_spots", "photo_spot", PhotoSpot, schemas.PhotoSpot),
+)
+
+# Response types of the sub-queries, for warmup.py
+SUB_QUERY_TYPES = (Optional[schemas.Destination], List[schemas.Review]) + tuple(List[schema] for _, _, _, schema in NEARBY)
+
+_executor = ThreadPoolExecutor(max_workers=PAGE_WORKERS, thread_name_prefix="page")
+
+def _fetch(prefer_primary: bool, response_type, query):
+    # Own session, so every sub-query runs on its own connection; lazy loads
+    # happen during validation, before the session is closed
+    db = open_read_session(prefer_primary)
+    try:
+        return cache.type_adapter(response_type).validate_python(query(db), from_attributes=True)
+    finally:
+        db.close()
+
+def destination_page(destination_id: str, prefer_primary: bool = False, reviews_limit: int = 10,
+                     nearby_limit: int = 6, radius_km: float = NEARBY_RADIUS_KM) -> Optional[schemas.DestinationPage]:
+    # Runs the destination, its reviews and the nearby places concurrently. Nearby ids
+    # come from the map index, so no sub-query has to wait for the destination row.
+    futures = {
+        "destination": _executor.submit(
+            _fetch, prefer_primary, Optional[schemas.Destination],
+            lambda db: crud.get_destination(db, destination_id),
+        ),
+        "reviews": _executor.submit(
+            _fetch, prefer_primary, List[schemas.Review],
+            lambda db: crud.get_destination_reviews(db, destination_id, limit=reviews_limit) or [],
+        ),
+    }
+    position = map_index.index.position("destination", destination_id)
+    for field, entity, model, schema in NEARBY:
+        ids = []
+        if position is not None and nearby_limit > 0:
+            ids = [entity_id for entity_id, _ in map_index.index.nearby(entity, position[0], position[1], radius_km, nearby_limit)]
+        if ids:
+            futures[field] = _executor.submit(
+                _fetch, prefer_primary, List[schema],
+                lambda db, model=model, ids=ids: crud.get_by_ids(db, model, ids),
+            )
+    parts = {field: future.result() for field, future in futures.items()}
+    if parts["destination"] is None:
+        return None
+    for field, _, _, _ in NEARBY:
+        parts.setdefault(field, [])
+    return schemas.DestinationPage(**parts)
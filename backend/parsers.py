@@ -0,0 +1,167 @@
+import re
+from datetime import datetime
+from typing import Optional, Tuple
+
+# Free-text field parsers shared by crud and migration
+
+MONTHS = {
+    'januari': 1, 'january': 1, 'jan': 1,
+    'februari': 2, 'february': 2, 'feb': 2, 'peb': 2,
+    'maret': 3, 'march': 3, 'mar': 3,
+    'april': 4, 'apr': 4,
+    'mei': 5, 'may': 5,
+    'juni': 6, 'june': 6, 'jun': 6,
+    'juli': 7, 'july': 7, 'jul': 7,
+    'agustus': 8, 'august': 8, 'agu': 8, 'agt': 8, 'ags': 8, 'aug': 8,
+    'september': 9, 'sep': 9, 'sept': 9,
+    'oktober': 10, 'october': 10, 'okt': 10, 'oct': 10,
+    'november': 11, 'nov': 11, 'nopember': 11,
+    'desember': 12, 'december': 12, 'des': 12, 'dec': 12,
+}
+
+_TEXT_DATE = re.compile(r'^(\d{1,2})\s+([A-Za-z]+)\.?\s+(\d{4})$')
+_NUMERIC_DATE = re.compile(r'^(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})$')
+
+def parse_review_date(value: Optional[str]) -> Optional[datetime]:
+    # Accepts "12 Mei 2023", "12 May 2023", "12/05/2023" and ISO dates
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    match = _TEXT_DATE.match(value)
+    if match:
+        month = MONTHS.get(match.group(2).lower())
+        if month is None:
+            return None
+        day, year = int(match.group(1)), int(match.group(3))
+    else:
+        match = _NUMERIC_DATE.match(value)
+        if not match:
+            return None
+        day, month, year = (int(group) for group in match.groups())
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
+
+# Ranges such as "4-5 jam" or "Rp 100.000 - Rp 150.000" resolve to their upper end,
+# so a plan built from them never understates what a trip takes
+_RANGE = r'\s*(?:-|–|s/d|sampai|hingga|to)\s*'
+_DURATION_NUMBER = r'\d+(?:[.,]\d+)?'
+_DURATION = re.compile(
+    rf'({_DURATION_NUMBER})(?:{_RANGE}({_DURATION_NUMBER}))?\s*'
+    r'(menit|mnt|minutes?|mins?|jam|hours?|hrs?|hari|days?)\b'
+)
+DURATION_UNITS = {
+    'menit': 1, 'mnt': 1, 'minute': 1, 'minutes': 1, 'min': 1, 'mins': 1,
+    'jam': 60, 'hour': 60, 'hours': 60, 'hr': 60, 'hrs': 60,
+    'hari': 1440, 'day': 1440, 'days': 1440,
+}
+
+def _decimal(value: str) -> float:
+    return float(value.replace(',', '.'))
+
+def parse_duration_minutes(value: Optional[str]) -> Optional[int]:
+    # Accepts "4-5 jam", "30 menit", "1 jam 30 menit", "1,5 jam" and "2 hari"
+    if not value:
+        return None
+    total = None
+    for low, high, unit in _DURATION.findall(value.lower()):
+        total = (total or 0) + _decimal(high or low) * DURATION_UNITS[unit]
+    return round(total) if total is not None else None
+
+_AMOUNT = r'((?:rp|idr)\.?\s*)?(\d+(?:[.,]\d+)*)\s*(ribu|rb|k|juta|jt)?\b'
+_AMOUNT_RANGE = re.compile(rf'{_AMOUNT}(?:{_RANGE}{_AMOUNT})?')
+_THOUSANDS = re.compile(r'^\d{1,3}(?:[.,]\d{3})+$')
+AMOUNT_MULTIPLIERS = {'ribu': 1000, 'rb': 1000, 'k': 1000, 'juta': 1000000, 'jt': 1000000}
+FREE_WORDS = ('gratis', 'free')
+
+def _amount(number: str, multiplier: str) -> float:
+    # "100.000" and "100,000" group thousands; "1,5" (juta) is a decimal
+    value = float(re.sub(r'[.,]', '', number)) if _THOUSANDS.match(number) else _decimal(number)
+    return value * AMOUNT_MULTIPLIERS.get(multiplier, 1)
+
+def parse_rupiah(value: Optional[str]) -> Optional[int]:
+    # Accepts "Rp 100.000 - Rp 150.000", "IDR 800.000/malam", "50rb", "Rp 1,5 juta" and "Gratis".
+    # Only amounts marked with Rp/IDR or a multiplier count, so "2 orang" is not read as a price.
+    if not value:
+        return None
+    text = value.lower()
+    amounts = []
+    for match in _AMOUNT_RANGE.finditer(text):
+        prefix, number, multiplier, high_prefix, high_number, high_multiplier = match.groups()
+        if not (prefix or multiplier or high_prefix or high_multiplier):
+            continue
+        # "Rp 100 - 150 ribu": a bare end of a range takes the other end's multiplier
+        amounts.append(_amount(number, multiplier or (high_multiplier if high_number else '')))
+        if high_number:
+            amounts.append(_amount(high_number, high_multiplier or multiplier or ''))
+    if amounts:
+        return round(max(amounts))
+    if any(word in text for word in FREE_WORDS):
+        return 0
+    return None
+
+_GUESTS = re.compile(rf'(\d+)(?:{_RANGE}(\d+))?')
+
+def parse_capacity(value: Optional[str]) -> Optional[int]:
+    # Accepts "2 orang", "2-3 orang", "Maks. 4 pax" and "2 dewasa + 1 anak" (3 guests)
+    if not value:
+        return None
+    total = None
+    for part in value.lower().split('+'):
+        match = _GUESTS.search(part)
+        if match:
+            total = (total or 0) + int(match.group(2) or match.group(1))
+    return total
+
+MINUTES_PER_DAY = 1440
+_CLOCK = r'(\d{1,2})[.:](\d{2})'
+_CLOCK_RANGE = re.compile(rf'{_CLOCK}{_RANGE}(?:{_CLOCK}|(selesai|habis|tutup))')
+_ALL_DAY = re.compile(r'\b24\s*(?:jam|hours?)\b|\bnonstop\b|\bsetiap saat\b|\bkapan saja\b|\banytime\b')
+# Free-text parts of the day, for best_time values without clock times
+DAYPARTS = (
+    (('sunrise', 'matahari terbit', 'fajar'), (300, 420)),
+    (('sunset', 'matahari terbenam', 'senja'), (1020, 1140)),
+    (('pagi', 'morning'), (300, 600)),
+    (('siang', 'midday', 'noon'), (600, 900)),
+    (('sore', 'afternoon'), (900, 1080)),
+    (('malam', 'night', 'evening'), (1080, MINUTES_PER_DAY)),
+)
+
+def _minute_of_day(hours: str, minutes: str) -> Optional[int]:
+    value = int(hours) * 60 + int(minutes)
+    return value if int(minutes) < 60 and value <= MINUTES_PER_DAY else None
+
+def parse_hours(value: Optional[str]) -> Optional[Tuple[int, int]]:
+    # (from, until) in minutes after midnight, until exclusive and up to 1440. until < from
+    # means the interval runs past midnight. Accepts "08.00 - 17.00 WIB", "18:00-02:00",
+    # "24 jam", "16.00 - selesai" and, failing clock times, "Pagi hari" or "Sunset".
+    # Several ranges are merged from the earliest opening to the latest closing, in any order:
+    # "13.00-17.00, 08.00-12.00" is (480, 1020). A range past midnight closes last.
+    if not value:
+        return None
+    text = value.lower()
+    if _ALL_DAY.search(text):
+        return 0, MINUTES_PER_DAY
+    ranges = []
+    for open_hours, open_minutes, close_hours, close_minutes, open_ended in _CLOCK_RANGE.findall(text):
+        start = _minute_of_day(open_hours, open_minutes)
+        end = MINUTES_PER_DAY if open_ended else _minute_of_day(close_hours, close_minutes)
+        if start is not None and end is not None and start != end:
+            ranges.append((start % MINUTES_PER_DAY, end))
+    if ranges:
+        past_midnight = [end for start, end in ranges if end < start]
+        return min(start for start, _ in ranges), max(past_midnight or [end for _, end in ranges])
+    found = [(text.find(word), span) for words, span in DAYPARTS for word in words if word in text]
+    # The first part of the day mentioned wins: "Pagi atau sore hari" is a morning spot
+    return min(found)[1] if found else None
+
+def parse_clock(value: Optional[str]) -> Optional[int]:
+    # "14:30" or "14.30" as minutes after midnight
+    match = re.fullmatch(_CLOCK, (value or '').strip())
+    minute = _minute_of_day(*match.groups()) if match else None
+    return minute if minute is not None and minute < MINUTES_PER_DAY else None
@@ -0,0 +1,166 @@
+import importlib.util
+import math
+import os
+import threading
+from collections import Counter
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+import events
+from models import Destination, Accommodation, destination_facility, destination_activity, accommodation_facility
+
+load_dotenv()
+
+# Neighbours kept per item
+SIMILAR_K = int(os.getenv("SIMILAR_K", "10"))
+
+# entity -> model and the (owner column, feature column, feature kind) links that describe an item
+SOURCES = {
+    "destination": (Destination, (
+        (destination_facility.c.destination_id, destination_facility.c.facility_id, "facility"),
+        (destination_activity.c.destination_id, destination_activity.c.activity_id, "activity"),
+    )),
+    "accommodation": (Accommodation, (
+        (accommodation_facility.c.accommodation_id, accommodation_facility.c.facility_id, "facility"),
+    )),
+}
+# Relationship on a written row for each feature kind
+FEATURE_ATTRIBUTES = {"facility": "facilities", "activity": "activities"}
+
+Feature = Tuple[str, int]
+
+def _has_scipy() -> bool:
+    return importlib.util.find_spec("scipy") is not None and importlib.util.find_spec("numpy") is not None
+
+def top_k_sparse(features: Dict[str, Set[Feature]], k: int) -> Dict[str, List[Tuple[str, float]]]:
+    # Cosine similarity of the binary item x feature matrix as one sparse product
+    import numpy as np
+    from scipy import sparse
+
+    items = list(features)
+    if not items:
+        return {}
+    columns: Dict[Feature, int] = {}
+    rows, cols, data = [], [], []
+    for row, item in enumerate(items):
+        for feature in features[item]:
+            rows.append(row)
+            cols.append(columns.setdefault(feature, len(columns)))
+            data.append(1 / math.sqrt(len(features[item])))
+    matrix = sparse.csr_matrix((data, (rows, cols)), shape=(len(items), max(len(columns), 1)))
+    similarity = (matrix @ matrix.T).tocsr()
+    similarity.setdiag(0)
+    similarity.eliminate_zeros()
+    names = np.array(items)
+    neighbors = {}
+    for row, item in enumerate(items):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        indices, scores = similarity.indices[start:end], similarity.data[start:end]
+        # Highest score first, ties by id
+        order = np.lexsort((names[indices], -scores))[:k]
+        neighbors[item] = [(items[indices[i]], float(scores[i])) for i in order]
+    return neighbors
+
+class SimilarityIndex:
+    # Precomputed top-k neighbour lists by feature overlap (cosine on binary vectors).
+    # A full build is one SciPy sparse product when SciPy is installed. A write only
+    # rescores the changed item through the feature -> items inverted index, plus the
+    # items whose lists it enters or leaves.
+    def __init__(self, k: int = SIMILAR_K):
+        self.k = k
+        self._lock = threading.Lock()
+        self._features: Dict[str, Set[Feature]] = {}
+        self._holders: Dict[Feature, Set[str]] = {}
+        self._neighbors: Dict[str, List[Tuple[str, float]]] = {}
+
+    def load(self, features: Dict[str, Set[Feature]]):
+        with self._lock:
+            self._features = {item: set(item_features) for item, item_features in features.items()}
+            self._holders = {}
+            for item, item_features in self._features.items():
+                for feature in item_features:
+                    self._holders.setdefault(feature, set()).add(item)
+            if _has_scipy():
+                self._neighbors = top_k_sparse(self._features, self.k)
+            else:
+                self._neighbors = {item: self._top(self._scores(item)) for item in self._features}
+
+    def similar(self, item: str) -> Optional[List[Tuple[str, float]]]:
+        with self._lock:
+            neighbors = self._neighbors.get(item)
+            return list(neighbors) if neighbors is not None else None
+
+    def update(self, item: str, features: Iterable[Feature]):
+        with self._lock:
+            before = self._scores(item)
+            self._set_features(item, set(features))
+            after = self._scores(item)
+            self._neighbors[item] = self._top(after)
+            self._refresh_others(item, set(before) | set(after), after)
+
+    def remove(self, item: str):
+        with self._lock:
+            before = self._scores(item)
+            self._set_features(item, set())
+            del self._features[item]
+            self._neighbors.pop(item, None)
+            self._refresh_others(item, set(before), {})
+
+    def _set_features(self, item: str, features: Set[Feature]):
+        for feature in self._features.get(item, set()) - features:
+            holders = self._holders[feature]
+            holders.discard(item)
+            if not holders:
+                del self._holders[feature]
+        for feature in features:
+            self._holders.setdefault(feature, set()).add(item)
+        self._features[item] = features
+
+    def _scores(self, item: str) -> Dict[str, float]:
+        mine = self._features.get(item)
+        if not mine:
+            return {}
+        shared = Counter(chain.from_iterable(self._holders[feature] for feature in mine))
+        shared.pop(item, None)
+        return {other: count / math.sqrt(len(mine) * len(self._features[other])) for other, count in shared.items()}
+
+    def _top(self, scores: Dict[str, float]) -> List[Tuple[str, float]]:
+        return sorted(scores.items(), key=lambda pair: (-pair[1], pair[0]))[:self.k]
+
+    def _refresh_others(self, item: str, affected: Set[str], scores: Dict[str, float]):
+        # Only lists the item was in, or now beats the last entry of, can change
+        for other in affected:
+            current = self._neighbors.get(other, [])
+            score = scores.get(other, 0.0)
+            listed = any(neighbor == item for neighbor, _ in current)
+            beats_last = len(current) < self.k or (-score, item) < (-current[-1][1], current[-1][0])
+            if listed or (score > 0 and beats_last):
+                self._neighbors[other] = self._top(self._scores(other))
+
+indexes = {entity: SimilarityIndex() for entity in SOURCES}
+
+def build(db: Session):
+    for entity, (model, links) in SOURCES.items():
+        features: Dict[str, Set[Feature]] = {row[0]: set() for row in db.query(model.id)}
+        for owner_column, feature_column, kind in links:
+            for owner, feature in db.query(owner_column, feature_column):
+                if owner in features:
+                    features[owner].add((kind, feature))
+        indexes[entity].load(features)
+
+def _on_write(entity: str, action: str, entity_id: str, obj):
+    if action == "delete":
+        indexes[entity].remove(entity_id)
+        return
+    features = set()
+    for _, _, kind in SOURCES[entity][1]:
+        features.update((kind, item.id) for item in getattr(obj, FEATURE_ATTRIBUTES[kind]))
+    indexes[entity].update(entity_id, features)
+
+for _entity in SOURCES:
+    events.subscribe(_entity, _on_write)
+    events.subscribe_remote(_entity, _on_write)
+events.subscribe_resync(build)
@@ -0,0 +1,85 @@
+import logging
+import threading
+import time
+import uuid
+
+import cache
+import crud
+import events
+from database import SessionLocal
+from models import ROOT_MODELS, Room
+
+logger = logging.getLogger(__name__)
+
+# Entity -> model of everything crud publishes, for reloading rows written by other workers
+MODELS = dict(ROOT_MODELS, room=Room)
+
+class WriteRelay:
+    # Shares crud write events between workers over Redis pub/sub, so that the in-memory
+    # indexes (map, autocomplete, fuzzy search, similar places, route graph, live streams)
+    # of every worker follow every write. A worker skips its own messages; for the others
+    # it reloads the row once and hands it to the events.subscribe_remote handlers. After
+    # the listener loses its connection it asks them to rebuild, as writes may be missed.
+    CHANNEL = "temajuk:writes"
+
+    def __init__(self, client, session_factory=SessionLocal):
+        self.client = client
+        self.session_factory = session_factory
+        self.worker_id = uuid.uuid4().hex
+        self._listener = threading.Thread(target=self._listen, name="write-relay", daemon=True)
+        self._listener.start()
+
+    def publish(self, entity: str, action: str, entity_id: str, obj):
+        if entity not in MODELS:
+            return
+        try:
+            self.client.publish(self.CHANNEL, "\n".join((self.worker_id, entity, action, str(entity_id))))
+        except Exception:
+            logger.warning("Redis write relay publish failed", exc_info=True)
+
+    def _listen(self):
+        connected_before = False
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                if connected_before:
+                    self._resync()
+                connected_before = True
+                for message in pubsub.listen():
+                    if message and message.get("type") == "message":
+                        data = message["data"]
+                        self._apply(*(data.decode() if isinstance(data, bytes) else data).split("\n", 3))
+            except Exception:
+                logger.warning("Redis write relay disconnected; retrying", exc_info=True)
+                time.sleep(1)
+
+    def _apply(self, worker_id: str, entity: str, action: str, entity_id: str):
+        if worker_id == self.worker_id:
+            return
+        if action == "delete":
+            events.publish_remote(entity, action, entity_id)
+            return
+        model = MODELS[entity]
+        if model is Room:
+            entity_id = int(entity_id)
+        db = self.session_factory()
+        try:
+            rows = crud.get_by_ids(db, model, [entity_id])
+            # A row deleted meanwhile is followed by its own delete message
+            if rows:
+                events.publish_remote(entity, action, entity_id, rows[0])
+        finally:
+            db.close()
+
+    def _resync(self):
+        db = self.session_factory()
+        try:
+            events.resync(db)
+        finally:
+            db.close()
+
+relay = WriteRelay(cache.backend.client) if isinstance(cache.backend, cache.RedisCache) else None
+
+if relay is not None:
+    events.subscribe(events.ALL, relay.publish)
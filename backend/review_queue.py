@@ -0,0 +1,157 @@
+import logging
+import os
+import queue
+import threading
+import time
+from typing import List
+
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+
+import crud
+from database import SessionLocal
+from schemas import ReviewCreate
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# When enabled, POST /reviews/ answers 202 at once and reviews are inserted in batches
+REVIEW_WRITE_BEHIND = os.getenv("REVIEW_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+REVIEW_BATCH_SIZE = int(os.getenv("REVIEW_BATCH_SIZE", "100"))
+REVIEW_FLUSH_INTERVAL_MS = int(os.getenv("REVIEW_FLUSH_INTERVAL_MS", "200"))
+REVIEW_QUEUE_SIZE = int(os.getenv("REVIEW_QUEUE_SIZE", "10000"))
+# Flush attempts made during shutdown before queued reviews are given up
+SHUTDOWN_ATTEMPTS = 3
+
+class QueueFull(Exception):
+    pass
+
+class DuplicateReview(Exception):
+    pass
+
+class UnknownDestination(Exception):
+    pass
+
+class ReviewWriteQueue:
+    # Reviews are validated and given their id and parsed date on submit, then a single
+    # thread inserts them with one multi-row INSERT per batch. A batch is flushed after
+    # batch_size reviews or flush_interval_ms, whichever comes first. Failed flushes are
+    # retried while the reviews stay queued, so a full queue pushes back on submitters.
+    # A client-supplied id that is already stored or queued is refused on submit; one that
+    # another worker inserts before the flush is still dropped, with an error logged. So is
+    # a destination_id that does not exist; one deleted before the flush is left empty.
+    def __init__(self, session_factory=SessionLocal, batch_size: int = REVIEW_BATCH_SIZE,
+                 flush_interval_ms: int = REVIEW_FLUSH_INTERVAL_MS, max_size: int = REVIEW_QUEUE_SIZE):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue: "queue.Queue[dict]" = queue.Queue(maxsize=max_size)
+        self._stopping = threading.Event()
+        self._thread = None
+        # Client-supplied ids of queued reviews
+        self._queued_ids = set()
+        self._ids_lock = threading.Lock()
+
+    def submit(self, review: ReviewCreate, db) -> dict:
+        values = crud.review_values(review)
+        if values["destination_id"] and not crud.known_destination_ids(db, [values["destination_id"]]):
+            raise UnknownDestination()
+        if review.id is not None:
+            if crud.get_review(db, review.id) is not None:
+                raise DuplicateReview()
+            with self._ids_lock:
+                if review.id in self._queued_ids:
+                    raise DuplicateReview()
+                self._queued_ids.add(review.id)
+        try:
+            self._queue.put_nowait(values)
+        except queue.Full:
+            self._forget([values])
+            raise QueueFull()
+        return dict(values)
+
+    def _forget(self, rows: List[dict]):
+        with self._ids_lock:
+            self._queued_ids.difference_update(row["id"] for row in rows)
+
+    def start(self):
+        if self._thread is None:
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="review-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 30):
+        # Drains everything still queued before returning
+        if self._thread is not None:
+            self._stopping.set()
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=0.5)]
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._flush(batch)
+            except Exception:
+                # Never let the writer thread die; a dead writer would refuse every later review
+                logger.exception("Review writer failed on %d queued reviews: %s", len(batch), [row["id"] for row in batch])
+            finally:
+                self._forget(batch)
+
+    def _flush(self, batch: List[dict]):
+        pending = list(batch)
+        one_by_one = False
+        attempt = 0
+        while True:
+            db = self.session_factory()
+            try:
+                if one_by_one:
+                    self._flush_each(db, pending)
+                else:
+                    crud.create_reviews(db, pending)
+                return
+            except IntegrityError:
+                # e.g. a client-supplied id inserted meanwhile by another worker; the rest
+                # of the batch is written row by row
+                db.rollback()
+                one_by_one = True
+                continue
+            except Exception:
+                db.rollback()
+                attempt += 1
+                logger.exception("Flushing %d queued reviews failed (attempt %d)", len(pending), attempt)
+                if self._stopping.is_set() and attempt >= SHUTDOWN_ATTEMPTS:
+                    logger.error("Giving up on %d queued reviews: %s", len(pending), [row["id"] for row in pending])
+                    return
+            finally:
+                db.close()
+            time.sleep(min(30, 0.5 * 2 ** attempt))
+
+    def _flush_each(self, db, pending: List[dict]):
+        # Rows are taken off pending once written or dropped, so a retry after any other
+        # error resumes with the rows that are left
+        while pending:
+            row = pending[0]
+            try:
+                crud.create_reviews(db, [row])
+            except IntegrityError as e:
+                db.rollback()
+                logger.error("Dropping queued review %s: %s", row["id"], e.orig)
+            pending.pop(0)
+
+writer = ReviewWriteQueue() if REVIEW_WRITE_BEHIND else None
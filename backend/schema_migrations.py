@@ -0,0 +1,393 @@
+# schema_migrations.py
+# Versioned schema upgrades. A single row in schema_version records the last applied
+# step, so a worker boot on an up-to-date database costs one SELECT.
+import logging
+from contextlib import contextmanager
+from datetime import datetime
+
+from sqlalchemy import bindparam, inspect, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.orm import Session
+
+from database import engine
+from models import Base, Review, Room, RouteStep, ChangeLog, HOURS_COLUMNS, ROOT_MODELS
+from parsers import parse_review_date, parse_duration_minutes, parse_rupiah, parse_capacity, parse_hours
+
+logger = logging.getLogger(__name__)
+
+LOCK_NAME = 'temajuk_schema_migrations'
+LOCK_TIMEOUT = 300
+BATCH_SIZE = 500
+FACET_INDEX_PREFIXES = (
+    'ix_destinations_category', 'ix_accommodations_category', 'ix_culinaries_category', 'ix_photo_spots_category',
+    'ix_accommodation_facility_', 'ix_destination_facility_', 'ix_destination_activity_',
+)
+
+def _columns(db: Session, table: str) -> set:
+    return {column['name'] for column in inspect(db.get_bind()).get_columns(table)}
+
+def _indexes(db: Session, table: str) -> set:
+    return {index['name'] for index in inspect(db.get_bind()).get_indexes(table)}
+
+def _is_sqlite(db: Session) -> bool:
+    return db.get_bind().dialect.name == 'sqlite'
+
+# Migration steps. Each one must be safe to run against a database that create_all
+# already brought to the latest schema, since step 1 does exactly that on fresh installs.
+def create_base_tables(db: Session):
+    Base.metadata.create_all(bind=db.get_bind())
+
+def upgrade_review_destination_link(db: Session):
+    columns = _columns(db, 'reviews')
+    if 'destination_id' not in columns:
+        db.execute(text("ALTER TABLE reviews ADD COLUMN destination_id VARCHAR(50) NULL"))
+        if not _is_sqlite(db):
+            db.execute(text(
+                "ALTER TABLE reviews ADD CONSTRAINT fk_reviews_destination_id "
+                "FOREIGN KEY (destination_id) REFERENCES destinations (id) ON DELETE SET NULL"
+            ))
+    if 'created_at' not in columns:
+        db.execute(text("ALTER TABLE reviews ADD COLUMN created_at DATETIME NULL"))
+        db.execute(text("UPDATE reviews SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL"))
+        if not _is_sqlite(db):
+            db.execute(text("ALTER TABLE reviews MODIFY created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP"))
+    if 'ix_reviews_destination_id_created_at' not in _indexes(db, 'reviews'):
+        db.execute(text("CREATE INDEX ix_reviews_destination_id_created_at ON reviews (destination_id, created_at)"))
+    db.commit()
+    backfill_review_destination_ids(db)
+
+def backfill_review_destination_ids(db: Session):
+    # Link reviews to destinations by matching the free-text title
+    db.execute(text(
+        "UPDATE reviews SET destination_id = "
+        "(SELECT destinations.id FROM destinations WHERE destinations.title = reviews.destination LIMIT 1) "
+        "WHERE destination_id IS NULL"
+    ))
+    db.commit()
+
+def upgrade_review_dates(db: Session):
+    columns = _columns(db, 'reviews')
+    if 'reviewed_at' not in columns:
+        db.execute(text("ALTER TABLE reviews ADD COLUMN reviewed_at DATETIME NULL"))
+        db.commit()
+
+    # Backfill in batches so the table is never locked for long
+    reviews = Review.__table__
+    while True:
+        rows = db.execute(
+            select(reviews.c.id, reviews.c.date, reviews.c.created_at)
+            .where(reviews.c.reviewed_at.is_(None))
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        db.execute(
+            reviews.update()
+            .where(reviews.c.id == bindparam('review_id'))
+            .values(reviewed_at=bindparam('parsed_at')),
+            [
+                {"review_id": row.id, "parsed_at": parse_review_date(row.date) or row.created_at or datetime.utcnow()}
+                for row in rows
+            ]
+        )
+        db.commit()
+
+    if 'reviewed_at' not in columns and not _is_sqlite(db):
+        db.execute(text("ALTER TABLE reviews MODIFY reviewed_at DATETIME NOT NULL"))
+    if 'ix_reviews_reviewed_at_id' not in _indexes(db, 'reviews'):
+        db.execute(text("CREATE INDEX ix_reviews_reviewed_at_id ON reviews (reviewed_at, id)"))
+    db.commit()
+
+def upgrade_cascading_deletes(db: Session):
+    # Recreate foreign keys created before ON DELETE rules were declared on the models.
+    # SQLite cannot alter constraints in place; its tables pick the rules up when recreated.
+    if _is_sqlite(db):
+        return
+    inspector = inspect(db.get_bind())
+    for table in Base.metadata.sorted_tables:
+        wanted = {
+            fk.parent.name: fk.ondelete
+            for fk in table.foreign_keys
+            if fk.ondelete
+        }
+        for existing in inspector.get_foreign_keys(table.name):
+            column = existing['constrained_columns'][0]
+            ondelete = wanted.get(column)
+            if not ondelete or (existing.get('options') or {}).get('ondelete', '').upper() == ondelete:
+                continue
+            name = existing['name']
+            db.execute(text(f"ALTER TABLE {table.name} DROP FOREIGN KEY {name}"))
+            db.execute(text(
+                f"ALTER TABLE {table.name} ADD CONSTRAINT {name} FOREIGN KEY ({column}) "
+                f"REFERENCES {existing['referred_table']} ({existing['referred_columns'][0]}) ON DELETE {ondelete}"
+            ))
+    db.commit()
+
+def upgrade_map_coordinates(db: Session):
+    for table in ('destinations', 'accommodations', 'culinaries', 'photo_spots'):
+        columns = _columns(db, table)
+        for column in ('latitude', 'longitude'):
+            if column not in columns:
+                db.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} FLOAT NULL"))
+    db.commit()
+
+def upgrade_facet_indexes(db: Session):
+    # Category indexes and the composite association-table indexes behind /facets
+    for table in Base.metadata.sorted_tables:
+        wanted = [index for index in table.indexes if index.name.startswith(FACET_INDEX_PREFIXES)]
+        if not wanted:
+            continue
+        existing = _indexes(db, table.name)
+        for index in wanted:
+            if index.name not in existing:
+                index.create(db.connection())
+    db.commit()
+
+def _add_integer_columns(db: Session, table: str, names):
+    columns = _columns(db, table)
+    for column in names:
+        if column not in columns:
+            db.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER NULL"))
+    db.commit()
+
+def _backfill_parsed(db: Session, table, sources, parse):
+    # Rewrite parsed columns from their text in primary key batches; parse(row) returns the values
+    last_id = None
+    while True:
+        query = select(table.c.id, *(table.c[name] for name in sources)).order_by(table.c.id).limit(BATCH_SIZE)
+        if last_id is not None:
+            query = query.where(table.c.id > last_id)
+        rows = db.execute(query).all()
+        if not rows:
+            break
+        db.execute(
+            table.update().where(table.c.id == bindparam('row_id')),
+            [dict(parse(row), row_id=row.id) for row in rows]
+        )
+        db.commit()
+        last_id = rows[-1].id
+
+def upgrade_route_step_numbers(db: Session):
+    _add_integer_columns(db, 'route_steps', ('duration_minutes', 'cost_rupiah'))
+    _backfill_parsed(db, RouteStep.__table__, ('duration', 'cost'), lambda row: {
+        "duration_minutes": parse_duration_minutes(row.duration),
+        "cost_rupiah": parse_rupiah(row.cost),
+    })
+
+def upgrade_room_numbers(db: Session):
+    _add_integer_columns(db, 'rooms', ('price_rupiah', 'guests'))
+    _backfill_parsed(db, Room.__table__, ('price', 'capacity'), lambda row: {
+        "price_rupiah": parse_rupiah(row.price),
+        "guests": parse_capacity(row.capacity),
+    })
+    if 'ix_rooms_price_rupiah_guests' not in _indexes(db, 'rooms'):
+        db.execute(text("CREATE INDEX ix_rooms_price_rupiah_guests ON rooms (price_rupiah, guests)"))
+    db.commit()
+
+def upgrade_opening_hours(db: Session):
+    for model, (source, start, end) in HOURS_COLUMNS.items():
+        table = model.__table__
+        _add_integer_columns(db, table.name, (start, end))
+        def parse(row, start=start, end=end):
+            opens, closes = parse_hours(row[1]) or (None, None)
+            return {start: opens, end: closes}
+        _backfill_parsed(db, table, (source,), parse)
+        index = f'ix_{table.name}_{start}_{end}'
+        if index not in _indexes(db, table.name):
+            db.execute(text(f"CREATE INDEX {index} ON {table.name} ({start}, {end})"))
+        db.commit()
+
+def seed_change_log(db: Session):
+    # Log a create for every root row the change log has not seen, so that a /changes
+    # sync from the start returns the whole catalog, including rows written around crud.
+    # Stamped with Python's UTC clock like crud.log_changes; the database's clock may
+    # be local time.
+    changed_at = datetime.utcnow()
+    for entity, model in ROOT_MODELS.items():
+        table = model.__table__.name
+        db.execute(text(
+            f"INSERT INTO change_log (entity, entity_id, action, changed_at) "
+            f"SELECT :entity, {table}.id, 'create', :changed_at FROM {table} "
+            f"WHERE NOT EXISTS (SELECT 1 FROM change_log WHERE change_log.entity = :entity "
+            f"AND change_log.entity_id = {table}.id) ORDER BY {table}.id"
+        ), {"entity": entity, "changed_at": changed_at})
+    db.commit()
+
+def upgrade_change_log(db: Session):
+    # updated_at holds UTC, as written by crud; the server default only covers raw SQL inserts
+    ChangeLog.__table__.create(bind=db.connection(), checkfirst=True)
+    now = datetime.utcnow()
+    for model in ROOT_MODELS.values():
+        table = model.__table__.name
+        if 'updated_at' not in _columns(db, table):
+            db.execute(text(f"ALTER TABLE {table} ADD COLUMN updated_at DATETIME NULL"))
+            db.execute(text(f"UPDATE {table} SET updated_at = :now WHERE updated_at IS NULL"), {"now": now})
+            if not _is_sqlite(db):
+                db.execute(text(f"ALTER TABLE {table} MODIFY updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP"))
+    db.commit()
+    seed_change_log(db)
+
+def _missing_delete_rules(inspector, table) -> bool:
+    wanted = {fk.parent.name: fk.ondelete.upper() for fk in table.foreign_keys if fk.ondelete}
+    for existing in inspector.get_foreign_keys(table.name):
+        ondelete = wanted.get(existing['constrained_columns'][0])
+        if ondelete and (existing.get('options') or {}).get('ondelete', '').upper() != ondelete:
+            return True
+    return False
+
+def _missing_foreign_keys(inspector, table) -> bool:
+    existing = {key['constrained_columns'][0] for key in inspector.get_foreign_keys(table.name)}
+    return any(fk.parent.name not in existing for fk in table.foreign_keys)
+
+def _clear_orphans(connection):
+    # Rows left behind by deletes made while SQLite did not enforce foreign keys get what
+    # their ON DELETE rule would have done: removed, or unlinked for SET NULL
+    while True:
+        violations = connection.exec_driver_sql("PRAGMA foreign_key_check").fetchall()
+        if not violations:
+            return
+        for table_name, rowid, _, key_id in violations:
+            keys = {key[0]: key for key in connection.exec_driver_sql(f"PRAGMA foreign_key_list({table_name})")}
+            column, on_delete = keys[key_id][3], keys[key_id][6]
+            if on_delete == "SET NULL":
+                connection.exec_driver_sql(f"UPDATE {table_name} SET {column} = NULL WHERE rowid = ?", (rowid,))
+            else:
+                connection.exec_driver_sql(f"DELETE FROM {table_name} WHERE rowid = ?", (rowid,))
+
+def _rebuild_sqlite_tables(db: Session, needs_rebuild):
+    # Rebuilds the tables needs_rebuild(inspector, table) picks as SQLite documents it:
+    # with enforcement off, create the table anew, copy the rows, drop the old one,
+    # rename, and recreate its indexes
+    db.commit()
+    with db.get_bind().connect() as connection:
+        # The pragma is ignored inside a transaction, so it is committed on its own
+        connection.exec_driver_sql("PRAGMA foreign_keys=OFF")
+        connection.commit()
+        try:
+            with connection.begin():
+                inspector = inspect(connection)
+                for table in Base.metadata.sorted_tables:
+                    if not inspector.has_table(table.name) or not needs_rebuild(inspector, table):
+                        continue
+                    existing = {column['name'] for column in inspector.get_columns(table.name)}
+                    columns = ", ".join(column.name for column in table.columns if column.name in existing)
+                    indexes = inspector.get_indexes(table.name)
+                    rebuilt = table.to_metadata(Base.metadata, name=f"{table.name}__rebuild")
+                    try:
+                        connection.execute(CreateTable(rebuilt))
+                    finally:
+                        Base.metadata.remove(rebuilt)
+                    connection.exec_driver_sql(f"INSERT INTO {rebuilt.name} ({columns}) SELECT {columns} FROM {table.name}")
+                    connection.exec_driver_sql(f"DROP TABLE {table.name}")
+                    connection.exec_driver_sql(f"ALTER TABLE {rebuilt.name} RENAME TO {table.name}")
+                    for index in indexes:
+                        unique = "UNIQUE " if index['unique'] else ""
+                        connection.exec_driver_sql(
+                            f"CREATE {unique}INDEX {index['name']} ON {table.name} ({', '.join(index['column_names'])})"
+                        )
+                    logger.info("Rebuilt %s with its foreign keys", table.name)
+                _clear_orphans(connection)
+        finally:
+            connection.exec_driver_sql("PRAGMA foreign_keys=ON")
+            connection.commit()
+
+def rebuild_sqlite_foreign_keys(db: Session):
+    # Step 4 cannot alter constraints on SQLite, whose connections enforce foreign keys,
+    # so a table created before the ON DELETE rules failed every delete of its parent
+    if _is_sqlite(db):
+        _rebuild_sqlite_tables(db, _missing_delete_rules)
+
+def rebuild_sqlite_review_link(db: Session):
+    # SQLite cannot add a constraint to an existing column, so step 2 added
+    # reviews.destination_id without its foreign key and deleted destinations left
+    # reviews linked to them. The rebuild adds it; orphans are unlinked on the way.
+    if _is_sqlite(db):
+        _rebuild_sqlite_tables(db, _missing_foreign_keys)
+
+def upgrade_destination_review_order(db: Session):
+    # Per-destination lists are ordered by reviewed_at; created_at was backfilled with one
+    # timestamp for every legacy review. The new index also serves the destination_id
+    # foreign key, so the old one can go once it exists.
+    indexes = _indexes(db, 'reviews')
+    if 'ix_reviews_destination_id_reviewed_at_id' not in indexes:
+        db.execute(text("CREATE INDEX ix_reviews_destination_id_reviewed_at_id ON reviews (destination_id, reviewed_at, id)"))
+    if 'ix_reviews_destination_id_created_at' in indexes:
+        on_table = "" if _is_sqlite(db) else " ON reviews"
+        db.execute(text(f"DROP INDEX ix_reviews_destination_id_created_at{on_table}"))
+    db.commit()
+
+# Append new steps at the end; never renumber or edit a released step
+MIGRATIONS = [
+    (1, "create base tables", create_base_tables),
+    (2, "link reviews to destinations", upgrade_review_destination_link),
+    (3, "parsed review dates", upgrade_review_dates),
+    (4, "cascading deletes", upgrade_cascading_deletes),
+    (5, "map coordinates", upgrade_map_coordinates),
+    (6, "facet indexes", upgrade_facet_indexes),
+    (7, "parsed route step numbers", upgrade_route_step_numbers),
+    (8, "parsed room numbers", upgrade_room_numbers),
+    (9, "parsed opening hours", upgrade_opening_hours),
+    (10, "change log", upgrade_change_log),
+    (11, "sqlite delete rules", rebuild_sqlite_foreign_keys),
+    (12, "destination review order", upgrade_destination_review_order),
+    (13, "sqlite review foreign key", rebuild_sqlite_review_link),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def current_version(db: Session) -> int:
+    try:
+        version = db.execute(text("SELECT version FROM schema_version")).scalar()
+    except (OperationalError, ProgrammingError):
+        # No schema_version table yet: nothing has been applied
+        db.rollback()
+        return 0
+    return version or 0
+
+def _set_version(db: Session, version: int):
+    db.execute(text("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)"))
+    if db.execute(text("UPDATE schema_version SET version = :version"), {"version": version}).rowcount == 0:
+        db.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": version})
+    db.commit()
+
+@contextmanager
+def _migration_lock(bind: Engine):
+    # Workers booting together must not apply the same step twice. SQLite serialises
+    # writers itself; MySQL gets a named lock held for the duration of the upgrade.
+    if bind.dialect.name != 'mysql':
+        yield
+        return
+    with bind.connect() as connection:
+        acquired = connection.execute(
+            text("SELECT GET_LOCK(:name, :timeout)"), {"name": LOCK_NAME, "timeout": LOCK_TIMEOUT}
+        ).scalar()
+        if not acquired:
+            raise RuntimeError("Timed out waiting for the schema migration lock")
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": LOCK_NAME})
+
+def upgrade(bind: Engine = engine) -> int:
+    with Session(bind=bind) as db:
+        version = current_version(db)
+    if version >= LATEST_VERSION:
+        return version
+
+    with _migration_lock(bind), Session(bind=bind) as db:
+        # Another worker may have finished the upgrade while we waited for the lock
+        version = current_version(db)
+        for step_version, name, step in MIGRATIONS:
+            if step_version <= version:
+                continue
+            logger.info("Applying schema migration %d: %s", step_version, name)
+            step(db)
+            _set_version(db, step_version)
+            version = step_version
+    return version
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"Schema is at version {upgrade()}")
@@ -1,6 +1,20 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, computed_field
+from typing import Dict, Generic, List, Optional, TypeVar
 from datetime import datetime
+import images
+
+# Image variant schemas
+class ImageVariants(BaseModel):
+    thumb: str
+    card: str
+    detail: str
+
+class WithImageVariants(BaseModel):
+    # Resized WebP copies of image_url, served from /images
+    @computed_field
+    @property
+    def image_variants(self) -> ImageVariants:
+        return ImageVariants(**images.variant_urls(self.image_url))
 
 # Base schemas
 class FacilityBase(BaseModel):
@@ -20,7 +34,9 @@ class RoomCreate(RoomBase):
     pass
 
 class Room(RoomBase):
-    id: str
+    id: int
+    price_rupiah: Optional[int] = None
+    guests: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -31,7 +47,7 @@ class AccommodationGalleryBase(BaseModel):
 class AccommodationGalleryCreate(AccommodationGalleryBase):
     pass
 
-class AccommodationGallery(AccommodationGalleryBase):
+class AccommodationGallery(AccommodationGalleryBase, WithImageVariants):
     id: int
     
     class Config:
@@ -46,6 +62,8 @@ class AccommodationBase(BaseModel):
     price: str
     location: str
     contact: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class AccommodationCreate(AccommodationBase):
     website: Optional[str] = None
@@ -53,8 +71,9 @@ class AccommodationCreate(AccommodationBase):
     rooms: List[RoomCreate] = []
     gallery: List[AccommodationGalleryCreate] = []
 
-class Accommodation(AccommodationBase):
+class Accommodation(AccommodationBase, WithImageVariants):
     id: str
+    updated_at: Optional[datetime] = None
     website: Optional[str] = None
     facilities: List[FacilityBase] = []
     rooms: List[Room] = []
@@ -82,7 +101,7 @@ class CulinaryGalleryBase(BaseModel):
 class CulinaryGalleryCreate(CulinaryGalleryBase):
     pass
 
-class CulinaryGallery(CulinaryGalleryBase):
+class CulinaryGallery(CulinaryGalleryBase, WithImageVariants):
     id: int
     
     class Config:
@@ -97,14 +116,19 @@ class CulinaryBase(BaseModel):
     price: str
     location: str
     open_hours: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class CulinaryCreate(CulinaryBase):
     contact: Optional[str] = None
     specialties: List[CulinarySpecialtyCreate] = []
     gallery: List[CulinaryGalleryCreate] = []
 
-class Culinary(CulinaryBase):
+class Culinary(CulinaryBase, WithImageVariants):
     id: str
+    updated_at: Optional[datetime] = None
+    opens_at: Optional[int] = None
+    closes_at: Optional[int] = None
     contact: Optional[str] = None
     specialties: List[CulinarySpecialty] = []
     gallery: List[CulinaryGallery] = []
@@ -131,7 +155,7 @@ class DestinationGalleryBase(BaseModel):
 class DestinationGalleryCreate(DestinationGalleryBase):
     pass
 
-class DestinationGallery(DestinationGalleryBase):
+class DestinationGallery(DestinationGalleryBase, WithImageVariants):
     id: int
     
     class Config:
@@ -146,6 +170,8 @@ class DestinationBase(BaseModel):
     price: str
     location: str
     open_hours: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class DestinationCreate(DestinationBase):
     facilities: List[str] = []
@@ -153,8 +179,11 @@ class DestinationCreate(DestinationBase):
     tips: List[DestinationTipCreate] = []
     gallery: List[DestinationGalleryCreate] = []
 
-class Destination(DestinationBase):
+class Destination(DestinationBase, WithImageVariants):
     id: str
+    updated_at: Optional[datetime] = None
+    opens_at: Optional[int] = None
+    closes_at: Optional[int] = None
     facilities: List[FacilityBase] = []
     activities: List[ActivityBase] = []
     tips: List[DestinationTip] = []
@@ -182,7 +211,7 @@ class PhotoSpotGalleryBase(BaseModel):
 class PhotoSpotGalleryCreate(PhotoSpotGalleryBase):
     pass
 
-class PhotoSpotGallery(PhotoSpotGalleryBase):
+class PhotoSpotGallery(PhotoSpotGalleryBase, WithImageVariants):
     id: int
     
     class Config:
@@ -208,14 +237,19 @@ class PhotoSpotBase(BaseModel):
     category: str
     location: str
     best_time: str
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class PhotoSpotCreate(PhotoSpotBase):
     tips: List[PhotoSpotTipCreate] = []
     gallery: List[PhotoSpotGalleryCreate] = []
     nearby_attractions: List[PhotoSpotNearbyAttractionCreate] = []
 
-class PhotoSpot(PhotoSpotBase):
+class PhotoSpot(PhotoSpotBase, WithImageVariants):
     id: str
+    updated_at: Optional[datetime] = None
+    best_from: Optional[int] = None
+    best_until: Optional[int] = None
     tips: List[PhotoSpotTip] = []
     gallery: List[PhotoSpotGallery] = []
     nearby_attractions: List[PhotoSpotNearbyAttraction] = []
@@ -231,12 +265,16 @@ class ReviewBase(BaseModel):
     rating: int
     text: str
     destination: str
+    destination_id: Optional[str] = None
 
 class ReviewCreate(ReviewBase):
-    pass
+    # Generated when omitted
+    id: Optional[str] = None
 
-class Review(ReviewBase):
+class Review(ReviewBase, WithImageVariants):
     id: str
+    updated_at: Optional[datetime] = None
+    reviewed_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
@@ -254,6 +292,8 @@ class RouteStepCreate(RouteStepBase):
 
 class RouteStep(RouteStepBase):
     id: int
+    duration_minutes: Optional[int] = None
+    cost_rupiah: Optional[int] = None
     
     class Config:
         from_attributes = True
@@ -282,8 +322,9 @@ class TransportRouteCreate(TransportRouteBase):
     steps: List[RouteStepCreate] = []
     tips: List[RouteTipCreate] = []
 
-class TransportRoute(TransportRouteBase):
+class TransportRoute(TransportRouteBase, WithImageVariants):
     id: str
+    updated_at: Optional[datetime] = None
     steps: List[RouteStep] = []
     tips: List[RouteTip] = []
     
@@ -304,6 +345,8 @@ class DestinationUpdate(BaseModel):
     activities: Optional[List[str]] = None
     tips: Optional[List[DestinationTipCreate]] = None
     gallery: Optional[List[DestinationGalleryCreate]] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class AccommodationUpdate(BaseModel):
     title: Optional[str] = None
@@ -318,6 +361,8 @@ class AccommodationUpdate(BaseModel):
     facilities: Optional[List[str]] = None
     rooms: Optional[List[RoomCreate]] = None
     gallery: Optional[List[AccommodationGalleryCreate]] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class RoomUpdate(BaseModel):
     type: Optional[str] = None
@@ -337,6 +382,8 @@ class CulinaryUpdate(BaseModel):
     contact: Optional[str] = None
     specialties: Optional[List[CulinarySpecialtyCreate]] = None
     gallery: Optional[List[CulinaryGalleryCreate]] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class CulinarySpecialtyUpdate(BaseModel):
     name: Optional[str] = None
@@ -348,6 +395,7 @@ class ReviewUpdate(BaseModel):
     rating: Optional[int] = None
     text: Optional[str] = None
     destination: Optional[str] = None
+    destination_id: Optional[str] = None
 
 class PhotoSpotUpdate(BaseModel):
     title: Optional[str] = None
@@ -360,6 +408,8 @@ class PhotoSpotUpdate(BaseModel):
     tips: Optional[List[PhotoSpotTipCreate]] = None
     gallery: Optional[List[PhotoSpotGalleryCreate]] = None
     nearby_attractions: Optional[List[PhotoSpotNearbyAttractionCreate]] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
 
 class TransportRouteUpdate(BaseModel):
     title: Optional[str] = None
@@ -379,4 +429,105 @@ class RouteStepUpdate(BaseModel):
     vehicle: Optional[str] = None
 
 class RouteTipUpdate(BaseModel):
-    tip: Optional[str] = None
\ No newline at end of file
+    tip: Optional[str] = None
+
+# Map schemas
+class MapItem(BaseModel):
+    entity: str
+    id: str
+    title: str
+
+class MapCluster(BaseModel):
+    count: int
+    counts: Dict[str, int]
+    latitude: float
+    longitude: float
+    top: MapItem
+
+# Page bundle schemas
+class DestinationPage(BaseModel):
+    destination: Destination
+    reviews: List[Review]
+    nearby_accommodations: List[Accommodation]
+    nearby_culinaries: List[Culinary]
+    nearby_photo_spots: List[PhotoSpot]
+
+# Room search schemas
+class RoomAccommodation(BaseModel):
+    id: str
+    title: str
+    category: str
+    location: str
+    image_url: str
+
+    class Config:
+        from_attributes = True
+
+class RoomMatch(Room):
+    accommodation: RoomAccommodation
+
+# Itinerary schemas
+class PlanLeg(BaseModel):
+    route_id: str
+    title: str
+    origin: str
+    destination: str
+    minutes: Optional[int] = None
+    cost: Optional[int] = None
+
+class ItineraryPlan(BaseModel):
+    origin: str
+    destination: str
+    optimize: str
+    total_minutes: Optional[int] = None
+    total_cost: Optional[int] = None
+    legs: List[PlanLeg]
+
+# Autocomplete schemas
+class Suggestion(BaseModel):
+    entity: str
+    id: str
+    title: str
+
+# Facet schemas
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+class Facets(BaseModel):
+    entity: str
+    total: int
+    category: List[FacetCount]
+    facilities: List[FacetCount] = []
+    activities: List[FacetCount] = []
+
+# Batch operation schemas
+class BatchDeleteResult(BaseModel):
+    deleted: List[str]
+    missing: List[str]
+
+class BatchFetch(BaseModel):
+    ids: List[str]
+
+Item = TypeVar("Item")
+
+class BatchFetchResult(BaseModel, Generic[Item]):
+    # Found rows in the requested order, then the ids that matched nothing
+    items: List[Item]
+    missing: List[str]
+
+# Change feed schemas
+class ChangedEntities(BaseModel):
+    destination: List[Destination] = []
+    accommodation: List[Accommodation] = []
+    culinary: List[Culinary] = []
+    review: List[Review] = []
+    photo_spot: List[PhotoSpot] = []
+    transport_route: List[TransportRoute] = []
+
+class ChangeFeed(BaseModel):
+    # Pass token back as ?since= to get the next changes; more means there are rows left to read now
+    token: str
+    more: bool
+    updated: ChangedEntities
+    deleted: Dict[str, List[str]]
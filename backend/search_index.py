@@ -0,0 +1,290 @@
+import bisect
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from itertools import chain
+from typing import Dict, List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+import events
+from models import Destination, Accommodation, Culinary, PhotoSpot, TransportRoute, Facility, Activity
+
+load_dotenv()
+
+# Share of the query's trigrams a row must contain to match a fuzzy search
+FUZZY_THRESHOLD = float(os.getenv("FUZZY_THRESHOLD", "0.5"))
+
+# Entities whose titles are suggested, and the name-only lookups linked to them
+TITLE_MODELS = {
+    "destination": Destination,
+    "accommodation": Accommodation,
+    "culinary": Culinary,
+    "photo_spot": PhotoSpot,
+    "transport_route": TransportRoute,
+}
+NAME_MODELS = {
+    "facility": Facility,
+    "activity": Activity,
+}
+# Relationships on written rows whose names are added to the index
+NAME_LINKS = {
+    "destination": (("facilities", "facility"), ("activities", "activity")),
+    "accommodation": (("facilities", "facility"),),
+}
+# Entries scanned per lookup at most; only reached when an entity filter skips most matches
+MAX_SCAN = 5000
+
+_EMPTY: Set[str] = frozenset()
+_non_word = re.compile(r"[^0-9a-z]+")
+
+def normalize(text: str) -> str:
+    # Lowercase, accents removed and punctuation collapsed, so "Pantai  Camar-Bulan" ~ "pantai camar bulan"
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _non_word.sub(" ", text.lower()).strip()
+
+class _Rebuildable:
+    # build() fills a new index off to the side while the live one keeps serving, then
+    # swaps it in. Writes made from begin_rebuild() on are journaled and replayed onto the
+    # new index in the swap, so none is lost to a build that read its rows before them.
+    _journal: Optional[List[Tuple[str, tuple]]] = None
+
+    def begin_rebuild(self):
+        with self._lock:
+            self._journal = []
+
+    def end_rebuild(self):
+        with self._lock:
+            self._journal = None
+
+    def _record(self, operation: str, *args):
+        # Called under the lock, after the operation was applied to the live index
+        if self._journal is not None:
+            self._journal.append((operation, args))
+
+    def replace(self, staged):
+        with self._lock:
+            self._take(staged)
+            for operation, args in self._journal or ():
+                getattr(self, operation)(*args)
+            self._journal = None
+
+class PrefixIndex(_Rebuildable):
+    # Two sorted arrays of (key, entity, id): one keyed by the whole title, one with a key
+    # from each later word to the end of the title, so "pan" finds "Pantai Camar Bulan"
+    # first and "bul" or "camar bu" find it next. A lookup is a bisect into each array
+    # plus a scan that stops after `limit` matches.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._starts: List[Tuple[str, str, str]] = []
+        self._words: List[Tuple[str, str, str]] = []
+        # (entity, id) -> (title, normalized title)
+        self._titles: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+    @staticmethod
+    def _word_keys(normalized: str) -> List[str]:
+        words = normalized.split(" ")
+        return [" ".join(words[start:]) for start in range(1, len(words))]
+
+    def load(self, items: List[Tuple[str, str, str]]):
+        # Bulk (entity, id, title) load with one sort per array, into a staged index
+        with self._lock:
+            for entity, entity_id, title in items:
+                self._titles[(entity, entity_id)] = (title, normalize(title))
+            self._starts = sorted(
+                (normalized, entity, entity_id)
+                for (entity, entity_id), (_, normalized) in self._titles.items()
+            )
+            self._words = sorted(
+                (key, entity, entity_id)
+                for (entity, entity_id), (_, normalized) in self._titles.items()
+                for key in self._word_keys(normalized)
+            )
+
+    def upsert(self, entity: str, entity_id: str, title: str):
+        with self._lock:
+            self._upsert(entity, entity_id, title)
+            self._record("_upsert", entity, entity_id, title)
+
+    def remove(self, entity: str, entity_id: str):
+        with self._lock:
+            self._remove(entity, entity_id)
+            self._record("_remove", entity, entity_id)
+
+    def _take(self, staged: "PrefixIndex"):
+        self._starts, self._words, self._titles = staged._starts, staged._words, staged._titles
+
+    def _upsert(self, entity: str, entity_id: str, title: str):
+        current = self._titles.get((entity, entity_id))
+        if current is not None and current[0] == title:
+            return
+        self._remove(entity, entity_id)
+        normalized = normalize(title)
+        self._titles[(entity, entity_id)] = (title, normalized)
+        bisect.insort(self._starts, (normalized, entity, entity_id))
+        for key in self._word_keys(normalized):
+            bisect.insort(self._words, (key, entity, entity_id))
+
+    def _remove(self, entity: str, entity_id: str):
+        current = self._titles.pop((entity, entity_id), None)
+        if current is None:
+            return
+        _delete(self._starts, (current[1], entity, entity_id))
+        for key in self._word_keys(current[1]):
+            _delete(self._words, (key, entity, entity_id))
+
+    def lookup(self, query: str, limit: int = 10, entities: Optional[List[str]] = None) -> List[dict]:
+        prefix = normalize(query)
+        if not prefix:
+            return []
+        found: Dict[Tuple[str, str], str] = {}
+        with self._lock:
+            for entries in (self._starts, self._words):
+                position = bisect.bisect_left(entries, (prefix,))
+                end = min(len(entries), position + MAX_SCAN)
+                while position < end and len(found) < limit:
+                    key, entity, entity_id = entries[position]
+                    if not key.startswith(prefix):
+                        break
+                    position += 1
+                    if (not entities or entity in entities) and (entity, entity_id) not in found:
+                        found[(entity, entity_id)] = self._titles[(entity, entity_id)][0]
+        return [{"entity": entity, "id": entity_id, "title": title} for (entity, entity_id), title in found.items()]
+
+def _delete(entries: List[Tuple[str, str, str]], entry: Tuple[str, str, str]):
+    position = bisect.bisect_left(entries, entry)
+    if position < len(entries) and entries[position] == entry:
+        del entries[position]
+
+def trigrams(text: str) -> Set[str]:
+    # pg_trgm style: each word padded with two spaces in front and one behind
+    grams = set()
+    for word in normalize(text).split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+class TrigramIndex(_Rebuildable):
+    # Inverted index from trigram to the rows whose title, description or location
+    # contains it, the same columns the non-fuzzy search matches. A row scores the share
+    # of the query's trigrams it contains, so a misspelt word still matches a long
+    # description; ties go to the closer title.
+    def __init__(self):
+        self._lock = threading.Lock()
+        # entity -> trigram -> ids
+        self._postings: Dict[str, Dict[str, Set[str]]] = {}
+        # (entity, id) -> (title, title trigrams, all trigrams)
+        self._rows: Dict[Tuple[str, str], Tuple[str, Set[str], Set[str]]] = {}
+
+    def upsert(self, entity: str, entity_id: str, title: str, *texts: Optional[str]):
+        title_grams = trigrams(title)
+        all_grams = title_grams.union(*(trigrams(text or "") for text in texts))
+        with self._lock:
+            self._store(entity, entity_id, title, title_grams, all_grams)
+            self._record("_store", entity, entity_id, title, title_grams, all_grams)
+
+    def remove(self, entity: str, entity_id: str):
+        with self._lock:
+            self._remove(entity, entity_id)
+            self._record("_remove", entity, entity_id)
+
+    def _take(self, staged: "TrigramIndex"):
+        self._postings, self._rows = staged._postings, staged._rows
+
+    def _store(self, entity: str, entity_id: str, title: str, title_grams: Set[str], all_grams: Set[str]):
+        self._remove(entity, entity_id)
+        self._rows[(entity, entity_id)] = (title, title_grams, all_grams)
+        postings = self._postings.setdefault(entity, {})
+        for gram in all_grams:
+            postings.setdefault(gram, set()).add(entity_id)
+
+    def _remove(self, entity: str, entity_id: str):
+        row = self._rows.pop((entity, entity_id), None)
+        if row is None:
+            return
+        postings = self._postings[entity]
+        for gram in row[2]:
+            ids = postings[gram]
+            ids.discard(entity_id)
+            if not ids:
+                del postings[gram]
+
+    def search(self, entity: str, query: str, threshold: float = FUZZY_THRESHOLD) -> List[str]:
+        # Ids of rows scoring at least threshold, best first
+        query_grams = trigrams(query)
+        if not query_grams:
+            return []
+        needed = max(1, math.ceil(threshold * len(query_grams) - 1e-9))
+        with self._lock:
+            postings = self._postings.get(entity, {})
+            lists = sorted((postings.get(gram, _EMPTY) for gram in query_grams), key=len)
+            # A row holding `needed` of the query's trigrams appears in at least one of the
+            # len(lists) - needed + 1 rarest lists, so only those produce candidates
+            seeds = lists[:len(lists) - needed + 1]
+            shared = Counter(chain.from_iterable(seeds))
+            for ids in lists[len(seeds):]:
+                for entity_id in shared:
+                    if entity_id in ids:
+                        shared[entity_id] += 1
+            ranked = []
+            for entity_id, count in shared.items():
+                if count >= needed:
+                    title, title_grams, _ = self._rows[(entity, entity_id)]
+                    common = len(query_grams & title_grams)
+                    closeness = common / (len(query_grams) + len(title_grams) - common)
+                    ranked.append((-count, -closeness, title, entity_id))
+        ranked.sort()
+        return [entity_id for _, _, _, entity_id in ranked]
+
+autocomplete = PrefixIndex()
+fuzzy = TrigramIndex()
+
+def _searched(model) -> tuple:
+    # Columns searched besides the title; transport routes have no location
+    return tuple(getattr(model, name) for name in ("description", "location") if hasattr(model, name))
+
+# One rebuild at a time, as both share the live indexes' journals
+_build_lock = threading.Lock()
+
+def build(db: Session):
+    # At boot and on resync; lookups keep using the current indexes until the swap
+    with _build_lock:
+        autocomplete.begin_rebuild()
+        fuzzy.begin_rebuild()
+        try:
+            items = []
+            staged_fuzzy = TrigramIndex()
+            for entity, model in TITLE_MODELS.items():
+                for row in db.query(model.id, model.title, *_searched(model)):
+                    items.append((entity, row.id, row.title))
+                    staged_fuzzy.upsert(entity, row.id, row.title, *row[2:])
+            for entity, model in NAME_MODELS.items():
+                items.extend((entity, str(row.id), row.name) for row in db.query(model.id, model.name))
+            staged_autocomplete = PrefixIndex()
+            staged_autocomplete.load(items)
+            autocomplete.replace(staged_autocomplete)
+            fuzzy.replace(staged_fuzzy)
+        finally:
+            autocomplete.end_rebuild()
+            fuzzy.end_rebuild()
+
+def _on_write(entity: str, action: str, entity_id: str, obj):
+    if action == "delete":
+        autocomplete.remove(entity, entity_id)
+        fuzzy.remove(entity, entity_id)
+        return
+    autocomplete.upsert(entity, entity_id, obj.title)
+    fuzzy.upsert(entity, entity_id, obj.title, *(getattr(obj, column.key) for column in _searched(TITLE_MODELS[entity])))
+    for attribute, name_entity in NAME_LINKS.get(entity, ()):
+        for item in getattr(obj, attribute, None) or []:
+            autocomplete.upsert(name_entity, str(item.id), item.name)
+
+for _entity in TITLE_MODELS:
+    events.subscribe(_entity, _on_write)
+    events.subscribe_remote(_entity, _on_write)
+events.subscribe_resync(build)
@@ -0,0 +1,135 @@
+from datetime import datetime
+
+import pytest
+
+from parsers import parse_capacity, parse_clock, parse_duration_minutes, parse_hours, parse_review_date, parse_rupiah
+
+@pytest.mark.parametrize("value, expected", [
+    ("12 Mei 2023", datetime(2023, 5, 12)),
+    ("12 May 2023", datetime(2023, 5, 12)),
+    ("12 mei 2023", datetime(2023, 5, 12)),
+    ("1 Agustus 2022", datetime(2022, 8, 1)),
+    ("3 Okt. 2021", datetime(2021, 10, 3)),
+    ("  5 Des 2020 ", datetime(2020, 12, 5)),
+    ("12/05/2023", datetime(2023, 5, 12)),
+    ("12-05-2023", datetime(2023, 5, 12)),
+    ("12.05.2023", datetime(2023, 5, 12)),
+    ("2023-05-12", datetime(2023, 5, 12)),
+    ("2023-05-12T08:30:00", datetime(2023, 5, 12, 8, 30)),
+    ("31 Februari 2023", None),
+    ("12 Foo 2023", None),
+    ("kemarin", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_review_date(value, expected):
+    assert parse_review_date(value) == expected
+
+@pytest.mark.parametrize("value, expected", [
+    ("30 menit", 30),
+    ("45 mins", 45),
+    ("2 hours", 120),
+    ("1 jam 30 menit", 90),
+    ("1,5 jam", 90),
+    ("1.5 hours", 90),
+    ("2 hari", 2880),
+    # Ranges resolve to their upper end
+    ("4-5 jam", 300),
+    ("4 - 5 jam", 300),
+    ("3 sampai 4 jam", 240),
+    ("sekitar 6-7 jam perjalanan", 420),
+    ("tergantung cuaca", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_duration_minutes(value, expected):
+    assert parse_duration_minutes(value) == expected
+
+@pytest.mark.parametrize("value, expected", [
+    ("Rp 25.000", 25000),
+    ("Rp25.000 per orang", 25000),
+    ("Rp 1.250.000", 1250000),
+    ("IDR 1,000,000", 1000000),
+    ("50rb", 50000),
+    ("100k", 100000),
+    ("Rp 1,5 juta", 1500000),
+    ("Rp 35.000 (2 orang)", 35000),
+    # Ranges resolve to their upper end; a bare end takes the other end's multiplier
+    ("Rp 100.000 - Rp 150.000", 150000),
+    ("Rp 50.000 - 75.000", 75000),
+    ("Rp 100 - 150 ribu", 150000),
+    ("Gratis", 0),
+    ("Free entry", 0),
+    # Numbers without Rp/IDR or a multiplier are not prices
+    ("2 orang", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_rupiah(value, expected):
+    assert parse_rupiah(value) == expected
+
+@pytest.mark.parametrize("value, expected", [
+    ("2 orang", 2),
+    ("Maks. 4 pax", 4),
+    # Ranges resolve to their upper end and parts joined by + add up
+    ("2-3 orang", 3),
+    ("2 - 4 orang", 4),
+    ("2 dewasa + 1 anak", 3),
+    ("2 dewasa + 2 anak", 4),
+    ("4 orang + extra bed", 4),
+    ("Keluarga", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_capacity(value, expected):
+    assert parse_capacity(value) == expected
+
+@pytest.mark.parametrize("value, expected", [
+    ("IDR 800.000/malam", 800000),
+    ("Rp 300.000 - 500.000 / malam", 500000),
+])
+def test_parse_rupiah_room_prices(value, expected):
+    assert parse_rupiah(value) == expected
+
+@pytest.mark.parametrize("value, expected", [
+    ("08.00 - 17.00 WIB", (480, 1020)),
+    ("07.00 s/d 16.00", (420, 960)),
+    ("00.00 - 24.00", (0, 1440)),
+    # until < from runs past midnight
+    ("18.00 - 02.00", (1080, 120)),
+    ("18:00-02:00", (1080, 120)),
+    ("16.00 - selesai", (960, 1440)),
+    ("24 jam", (0, 1440)),
+    ("Buka 24 Jam", (0, 1440)),
+    ("nonstop", (0, 1440)),
+    # Several ranges: earliest opening to latest closing, in any order
+    ("08.00-12.00, 13.00-17.00", (480, 1020)),
+    ("13.00-17.00, 08.00-12.00", (480, 1020)),
+    ("10.00-14.00, 18.00-02.00", (600, 120)),
+    # Parts of the day, for best_time without clock times; the first one mentioned wins
+    ("Pagi hari", (300, 600)),
+    ("Sunset", (1020, 1140)),
+    ("Pagi atau sore hari", (300, 600)),
+    ("25.00-26.00", None),
+    ("08.00-08.00", None),
+    ("Setiap hari", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_hours(value, expected):
+    assert parse_hours(value) == expected
+
+@pytest.mark.parametrize("value, expected", [
+    ("14:30", 870),
+    ("14.30", 870),
+    ("9:05", 545),
+    ("00:00", 0),
+    ("24:00", None),
+    ("25:00", None),
+    ("14:60", None),
+    ("abc", None),
+    ("", None),
+    (None, None),
+])
+def test_parse_clock(value, expected):
+    assert parse_clock(value) == expected
@@ -0,0 +1,80 @@
+import logging
+import threading
+import time
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+import cache
+import crud
+import images
+import itinerary
+import map_index
+import pages
+import recommendations
+import schemas
+import search_index
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Response models paired with the crud list call that feeds them
+WARMUP_QUERIES = [
+    (schemas.Destination, crud.get_destinations),
+    (schemas.Accommodation, crud.get_accommodations),
+    (schemas.Culinary, crud.get_culinaries),
+    (schemas.Review, crud.get_reviews),
+    (schemas.PhotoSpot, crud.get_photo_spots),
+    (schemas.TransportRoute, crud.get_transport_routes),
+]
+
+state = {"ready": False, "duration_ms": None, "error": None}
+
+def response_types(app) -> list:
+    # Everything the endpoints serialize through cache.type_adapter: the route response
+    # models, which cache.cached_json is given as well, and the page bundle's sub-queries
+    found = {route.response_model for route in app.routes if getattr(route, "response_model", None) is not None}
+    return list(found) + [response_type for response_type in pages.SUB_QUERY_TYPES if response_type not in found]
+
+def warm_up(app):
+    # Pay the one-off costs of the first request before traffic arrives: mapper
+    # configuration, the first pooled connection, SQL compilation caches for the list
+    # queries and their lazy loads, and the response serializers.
+    configure_mappers()
+    for response_type in response_types(app):
+        cache.type_adapter(response_type)
+    db = SessionLocal()
+    try:
+        db.execute(text("SELECT 1"))
+        map_index.build(db)
+        images.build(db)
+        search_index.build(db)
+        recommendations.build(db)
+        itinerary.build(db)
+        for model, fetch in WARMUP_QUERIES:
+            adapter = cache.type_adapter(List[model])
+            rows = adapter.validate_python(fetch(db, limit=1), from_attributes=True)
+            adapter.dump_python(rows, mode="json")
+    finally:
+        db.close()
+
+def _run(app):
+    started = time.perf_counter()
+    try:
+        warm_up(app)
+        # The OpenAPI document is otherwise generated by whoever first opens /docs
+        app.openapi()
+    except Exception as e:
+        logger.exception("Warm-up failed")
+        state["error"] = str(e)
+        return
+    state["duration_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    state["ready"] = True
+    logger.info("Warm-up finished in %.1f ms", state["duration_ms"])
+
+def start(app) -> threading.Thread:
+    # Warm up in the background so the worker can answer liveness checks meanwhile
+    thread = threading.Thread(target=_run, args=(app,), name="warmup", daemon=True)
+    thread.start()
+    return thread